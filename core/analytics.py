@@ -0,0 +1,332 @@
+# core/analytics.py
+"""
+Per-category and per-account spending analytics.
+
+A user's transactions for the period are read with one ``values_list``
+query into NumPy arrays (ids, days, amounts, group), then everything is
+computed over the whole set at once: monthly totals are a single
+``bincount`` into a groups x months matrix, trailing averages come from
+its cumulative sums, and per-group percentiles index into one sort of all
+amounts. Transactions and months are flagged as anomalies when their
+robust z-score (distance from the group median in median absolute
+deviations) is above ANOMALY_THRESHOLD.
+
+NumPy is optional; without it ``available()`` is False and the analytics
+views answer 503.
+"""
+from django.db.models import Q
+from django.utils import timezone
+
+from .categories import STEP, path_id
+from .dates import add_months
+from .fx import rates_version, report_rate, user_currency
+from .models import Category, Transaction
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 60
+# Months in the trailing average, the current one included
+ROLLING_MONTHS = 3
+PERCENTILES = (50, 90)
+# Robust z-score above which a transaction or month is flagged
+ANOMALY_THRESHOLD = 3.5
+# Fewest values a group needs before any of them is flagged
+MIN_HISTORY = 5
+MAX_ANOMALIES = 10
+
+
+def available():
+    return np is not None
+
+
+def analysis_months(value, default=DEFAULT_MONTHS):
+    """Parse a requested period in months, clamped to MAX_MONTHS"""
+    try:
+        return max(1, min(int(value), MAX_MONTHS))
+    except (TypeError, ValueError):
+        return default
+
+
+def period(today, months):
+    """First and last day of the ``months`` calendar months ending with today's"""
+    return add_months(today.replace(day=1), 1 - months), today
+
+
+def _arrays(queryset, fields):
+    """Columns of ``fields`` as lists, read in one query"""
+    rows = list(queryset.order_by().values_list(*fields))
+    return [list(column) for column in zip(*rows)] if rows else [[] for field in fields]
+
+
+def _month_index(days, start):
+    """Month of each day, counted from the month of ``start``"""
+    return (days.astype('datetime64[M]') - np.datetime64(start, 'M')).astype(int)
+
+
+def _convert(amounts, currencies, months, start, target):
+    """Convert amounts into ``target`` at the rate of the first day of their month, one lookup per currency and month"""
+    codes, code_index = np.unique(np.array(currencies, dtype=str), return_inverse=True)
+    if (codes == target).all():
+        return amounts
+    width = int(months.max()) + 1
+    pairs, inverse = np.unique(code_index * width + months, return_inverse=True)
+    version = rates_version()
+    factors = np.array([
+        float(report_rate(
+            str(codes[pair // width]), target, add_months(start.replace(day=1), int(pair % width)), version
+        ))
+        for pair in pairs
+    ])
+    return amounts * factors[inverse]
+
+
+def _monthly(groups, count, months, n_months, values):
+    """groups x months matrix of summed ``values``"""
+    flat = np.bincount(groups * n_months + months, weights=values, minlength=count * n_months)
+    return flat.reshape(count, n_months)
+
+
+def _trend(totals):
+    """Trailing averages, month-over-month changes and their percentage for a groups x months matrix"""
+    n_months = totals.shape[1]
+    cumulative = np.concatenate([np.zeros((totals.shape[0], 1)), np.cumsum(totals, axis=1)], axis=1)
+    index = np.arange(n_months)
+    first = np.maximum(index + 1 - ROLLING_MONTHS, 0)
+    rolling = (cumulative[:, index + 1] - cumulative[:, first]) / (index + 1 - first)
+
+    previous = np.concatenate([np.full((totals.shape[0], 1), np.nan), totals[:, :-1]], axis=1)
+    change = totals - previous
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percent = np.where(previous != 0, change / np.abs(previous) * 100, np.nan)
+    return rolling, change, percent
+
+
+def _quantiles(groups, count, values, quantiles):
+    """groups x quantiles matrix of linearly interpolated quantiles, NaN for empty groups"""
+    result = np.full((count, len(quantiles)), np.nan)
+    if not len(values):
+        return result
+    order = np.lexsort((values, groups))
+    ordered = values[order]
+    sizes = np.bincount(groups, minlength=count)
+    starts = np.cumsum(sizes) - sizes
+    positions = np.maximum(sizes[:, None] - 1, 0) * np.asarray(quantiles)[None, :]
+    low = np.floor(positions).astype(int)
+    high = np.ceil(positions).astype(int)
+    lower = ordered[np.minimum(starts[:, None] + low, len(ordered) - 1)]
+    upper = ordered[np.minimum(starts[:, None] + high, len(ordered) - 1)]
+    interpolated = lower + (upper - lower) * (positions - low)
+    return np.where(sizes[:, None] > 0, interpolated, result)
+
+
+def _scores(values, medians, deviations, sizes):
+    """Robust z-scores of values against their group's median and MAD; 0 where a group is too small or flat"""
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = 0.6745 * (values - medians) / deviations
+    return np.where((deviations > 0) & (sizes >= MIN_HISTORY), scores, 0.0)
+
+
+def _outliers(groups, count, values):
+    """Robust z-score of every value within its group"""
+    sizes = np.bincount(groups, minlength=count)
+    medians = _quantiles(groups, count, values, [0.5])[:, 0]
+    deviations = _quantiles(groups, count, np.abs(values - medians[groups]), [0.5])[:, 0]
+    return _scores(values, medians[groups], deviations[groups], sizes[groups])
+
+
+def _month_outliers(totals):
+    """Robust z-score of every monthly total within its group's months"""
+    medians = np.median(totals, axis=1, keepdims=True)
+    deviations = np.median(np.abs(totals - medians), axis=1, keepdims=True)
+    sizes = np.full((totals.shape[0], 1), totals.shape[1])
+    return _scores(totals, medians, deviations, sizes)
+
+
+def _number(value):
+    return None if np.isnan(value) else round(float(value), 2)
+
+
+def _series(months, totals, counts, rolling, change, percent, scores):
+    return [
+        {
+            'month': str(month),
+            'total': _number(totals[index]),
+            'transactions': int(counts[index]),
+            'rolling_average': _number(rolling[index]),
+            'change': _number(change[index]),
+            'change_percent': _number(percent[index]),
+            'anomaly': bool(scores[index] > ANOMALY_THRESHOLD),
+        }
+        for index, month in enumerate(months)
+    ]
+
+
+def _anomalies(ids, scores):
+    """The most unusual transactions above the threshold, most unusual first"""
+    flagged = np.flatnonzero(scores > ANOMALY_THRESHOLD)
+    flagged = flagged[np.argsort(-scores[flagged], kind='stable')][:MAX_ANOMALIES]
+    details = Transaction.objects.select_related('account', 'category').in_bulk(ids[flagged].tolist())
+    anomalies = []
+    for pk, score in zip(ids[flagged].tolist(), scores[flagged].tolist()):
+        transaction = details.get(pk)
+        if transaction is None:
+            continue
+        anomalies.append({
+            'id': pk,
+            'date': transaction.date.isoformat(),
+            'description': transaction.description,
+            'category': transaction.category.name if transaction.category else None,
+            'account': transaction.account.name,
+            'amount': float(transaction.amount),
+            'score': round(score, 1),
+        })
+    return anomalies
+
+
+def _nodes(user, parent):
+    """Map each of the user's category ids to the (id, name) of the child of ``parent`` (or root) it rolls up to"""
+    prefix = parent.path if parent else ''
+    categories = {
+        pk: (path, name)
+        for pk, path, name in Category.objects.filter(user=user).values_list('pk', 'path', 'name')
+        if path.startswith(prefix)
+    }
+    nodes = {}
+    for pk, (path, name) in categories.items():
+        node = path_id(path[:len(prefix) + STEP])
+        nodes[pk] = (node, categories[node][1] if node in categories else name)
+    return nodes
+
+
+def category_statistics(user, transaction_type, start, end, parent=None):
+    """
+    Monthly totals, trailing averages, month-over-month changes, amount
+    percentiles and anomalies per child of ``parent`` (per root category
+    without one, uncategorized transactions included), in the user's currency
+    """
+    currency = user_currency(user)
+    transactions = Transaction.objects.filter(
+        user=user, transaction_type=transaction_type, date__gte=start, date__lte=end
+    ).exclude(status='CANCELLED')
+    if parent is not None:
+        transactions = transactions.filter(category__path__gte=parent.path, category__path__lt=parent.path + '~')
+    ids, days, amounts, category_ids, currencies = _arrays(
+        transactions, ('id', 'date', 'amount', 'category_id', 'account__currency')
+    )
+    ids = np.array(ids, dtype=np.int64)
+    days = np.array(days, dtype='datetime64[D]')
+    n_months = (np.datetime64(end, 'M') - np.datetime64(start, 'M')).astype(int) + 1
+    months = _month_index(days, start)
+    amounts = _convert(np.array(amounts, dtype=float), currencies, months, start, currency)
+
+    # Group index per transaction: its node among the distinct categories present
+    nodes = _nodes(user, parent)
+    distinct, inverse = np.unique(np.array([pk or 0 for pk in category_ids], dtype=np.int64), return_inverse=True)
+    node_of = [nodes.get(int(pk), (None, 'Uncategorized')) for pk in distinct]
+    keys = list(dict.fromkeys(node_of))
+    groups = np.array([keys.index(node) for node in node_of], dtype=np.int64)[inverse]
+    count = len(keys)
+
+    totals = _monthly(groups, count, months, n_months, amounts)
+    counts = _monthly(groups, count, months, n_months, np.ones(len(amounts)))
+    rolling, change, percent = _trend(totals)
+    month_scores = _month_outliers(totals)
+    quantiles = _quantiles(groups, count, amounts, [q / 100 for q in PERCENTILES])
+    labels = np.arange(np.datetime64(start, 'M'), np.datetime64(end, 'M') + 1)
+
+    categories = [
+        {
+            'category_id': node,
+            'name': name,
+            'total': _number(totals[index].sum()),
+            'transactions': int(counts[index].sum()),
+            'monthly_average': _number(totals[index].mean()),
+            'percentiles': {f'p{q}': _number(quantiles[index, position]) for position, q in enumerate(PERCENTILES)},
+            'months': _series(
+                labels, totals[index], counts[index], rolling[index], change[index], percent[index], month_scores[index]
+            ),
+        }
+        for index, (node, name) in enumerate(keys)
+    ]
+    categories.sort(key=lambda row: -row['total'])
+    return {
+        'currency': currency,
+        'transaction_type': transaction_type,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'categories': categories,
+        'anomalies': _anomalies(ids, _outliers(groups, count, amounts)),
+    }
+
+
+def account_statistics(account, start, end=None):
+    """
+    Monthly income, expenses, transfers, net flow and month-end balance of
+    an account, with trends, expense percentiles and unusual expenses
+    (compared with the rest of their category), in the account's currency
+    """
+    end = end or timezone.now().date()
+    transactions = Transaction.objects.filter(
+        Q(account=account) | Q(transfer_account=account), user_id=account.user_id, date__gte=start
+    ).exclude(status='CANCELLED')
+    ids, days, amounts, types, account_ids, category_ids = _arrays(
+        transactions, ('id', 'date', 'amount', 'transaction_type', 'account_id', 'category_id')
+    )
+    ids = np.array(ids, dtype=np.int64)
+    days = np.array(days, dtype='datetime64[D]')
+    amounts = np.array(amounts, dtype=float)
+    types = np.array(types, dtype=str)
+    outgoing = np.array(account_ids, dtype=np.int64) == account.pk
+    n_months = (np.datetime64(end, 'M') - np.datetime64(start, 'M')).astype(int) + 1
+    months = _month_index(days, start)
+
+    # Signed effect on this account, as in ledger.effects
+    flows = np.where((types == 'INCOME') | ((types == 'TRANSFER') & ~outgoing), amounts, -amounts)
+    # Columns: income, expenses, transfers (net); later-dated rows only move the balance
+    kinds = np.select([types == 'INCOME', types == 'EXPENSE'], [0, 1], 2)
+    in_period = months < n_months
+    totals = _monthly(kinds[in_period], 3, months[in_period], n_months, flows[in_period])
+    income, expenses, transfers = totals[0], -totals[1], totals[2]
+    net = totals.sum(axis=0)
+    # The balance at a month end is today's balance less everything recorded after it
+    later = flows[~in_period].sum()
+    balances = float(account.balance) - later - (net.sum() - np.cumsum(net))
+    rolling, change, percent = _trend(expenses[None, :])
+
+    expense = (types == 'EXPENSE') & in_period
+    quantiles = _quantiles(np.zeros(expense.sum(), dtype=np.int64), 1, amounts[expense], [q / 100 for q in PERCENTILES])
+    distinct, groups = np.unique(np.array([pk or 0 for pk in category_ids], dtype=np.int64)[expense], return_inverse=True)
+    labels = np.arange(np.datetime64(start, 'M'), np.datetime64(end, 'M') + 1)
+    month_scores = _month_outliers(expenses[None, :])[0]
+
+    return {
+        'currency': account.currency,
+        'start_date': start.isoformat(),
+        'end_date': end.isoformat(),
+        'balance': float(account.balance),
+        'income': _number(income.sum()),
+        'expenses': _number(expenses.sum()),
+        'monthly_income': _number(income.mean()),
+        'monthly_expenses': _number(expenses.mean()),
+        'percentiles': {f'p{q}': _number(quantiles[0, position]) for position, q in enumerate(PERCENTILES)},
+        'months': [
+            {
+                'month': str(month),
+                'income': _number(income[index]),
+                'expenses': _number(expenses[index]),
+                'transfers': _number(transfers[index]),
+                'net': _number(net[index]),
+                'balance': _number(balances[index]),
+                'rolling_expenses': _number(rolling[0, index]),
+                'expense_change': _number(change[0, index]),
+                'expense_change_percent': _number(percent[0, index]),
+                'anomaly': bool(month_scores[index] > ANOMALY_THRESHOLD),
+            }
+            for index, month in enumerate(labels)
+        ],
+        'anomalies': _anomalies(ids[expense], _outliers(groups, len(distinct), amounts[expense])),
+    }
@@ -0,0 +1,295 @@
+# core/benchmarking.py
+"""
+Synthetic data and view profiling used by the benchmark management commands.
+
+Everything here talks to the configured database; callers wrap it in a
+transaction that is rolled back so benchmark data never sticks around.
+Views are profiled with CORE_CONCURRENT_QUERIES off, so chart builders run
+on the request's own connection: their queries are counted and they see
+that uncommitted data.
+"""
+import random
+import statistics
+import time
+from contextlib import ExitStack
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import categories, forecast, ledger, rollups, search, tags
+from .goals import recompute as recompute_goals
+from .models import Account, Budget, Category, Goal, RecurringTransaction, Transaction
+from .routers import replica_alias
+
+CATEGORY_NAMES = [
+    'Groceries', 'Rent', 'Transport', 'Dining', 'Utilities', 'Health', 'Travel',
+    'Shopping', 'Entertainment', 'Education', 'Insurance', 'Gifts', 'Salary', 'Bonus',
+]
+# Subcategories of some top-level categories, so reports have trees to roll up
+SUBCATEGORY_NAMES = {
+    'Groceries': ['Supermarket', 'Farmers market', 'Bakery'],
+    'Transport': ['Fuel', 'Public transport', 'Parking', 'Taxi'],
+    'Dining': ['Restaurants', 'Coffee', 'Delivery'],
+    'Utilities': ['Electricity', 'Water', 'Internet', 'Phone'],
+    'Travel': ['Flights', 'Hotels'],
+    'Shopping': ['Clothing', 'Electronics', 'Home'],
+}
+MERCHANTS = [
+    'Corner Store', 'City Market', 'Blue Bottle Coffee', 'Shell', 'Metro Transit', 'Netflix', 'Spotify',
+    'Amazon', 'IKEA', 'Pharmacy Plus', 'Sushi House', 'Pizza Place', 'Airline', 'Grand Hotel', 'Power Co',
+]
+TAG_NAMES = ['work', 'family', 'travel', 'reimbursable', 'subscription', 'gift', 'health', 'weekend']
+
+# (name, url name, args, query string) of every view we keep an eye on
+BENCHMARK_VIEWS = [
+    ('dashboard', 'core:dashboard', [], {}),
+    ('dashboard_data', 'core:dashboard_data', [], {}),
+    ('transaction_list_data', 'core:transaction_list_data', [], {}),
+    ('search_transactions', 'core:search_transactions', [], {'q': 'coffee'}),
+    ('expense_summary', 'core:expense_summary', [], {}),
+    ('income_summary', 'core:income_summary', [], {}),
+    ('cash_flow', 'core:cash_flow', [], {}),
+    ('transaction_chart_data', 'core:transaction_chart_data', [], {}),
+    ('transaction_chart_data_years', 'core:transaction_chart_data', [], {
+        'date_from': (date.today() - timedelta(days=3 * 365)).isoformat(), 'granularity': 'month',
+    }),
+    ('category_chart_data', 'core:category_chart_data', [], {}),
+    ('tag_spending_data', 'core:tag_spending_data', [], {}),
+    ('budget_progress_data', 'core:budget_progress_data', [], {}),
+    ('forecast_data', 'core:forecast_data', [], {'months': 60}),
+    ('export_transactions', 'core:export_transactions', [], {}),
+    ('export_report', 'core:export_report', ['expense'], {}),
+    ('export_cash_flow', 'core:export_report', ['cash-flow'], {'granularity': 'week'}),
+]
+
+
+
+def _filled(buckets):
+    return sum(1 for bucket in buckets if bucket['income'] or bucket['expenses'])
+
+
+# Data rows in the JSON of the views that must return some for a seeded user
+ROW_COUNTS = {
+    'dashboard_data': lambda data: _filled(data['transactions']) + len(data['categories']) + len(data['budgets']),
+    'transaction_list_data': lambda data: len(data['results']),
+    'search_transactions': lambda data: len(data['results']),
+    'transaction_chart_data': _filled,
+    'transaction_chart_data_years': _filled,
+    'category_chart_data': len,
+    'tag_spending_data': lambda data: len(data['totals']),
+    'budget_progress_data': len,
+    'forecast_data': lambda data: len(data['accounts']),
+}
+
+
+class BenchmarkError(RuntimeError):
+    """A profiled view failed or returned no data"""
+
+
+def seed_user(username, transactions=50000, accounts=5, budgets=20, recurring=50, goals=5, years=3, seed=0):
+    """Create a user with a realistic spread of data, using bulk inserts throughout"""
+    rng = random.Random(seed)
+    user = get_user_model().objects.create_user(username=username)
+
+    account_objects = Account.objects.bulk_create([
+        Account(
+            user=user,
+            name=f'Account {number}',
+            account_type=rng.choice(Account.ACCOUNT_TYPES)[0],
+            opening_balance=Decimal(rng.randrange(0, 10000)),
+        )
+        for number in range(accounts)
+    ])
+    parents = Category.objects.bulk_create([
+        Category(user=user, name=name) for name in CATEGORY_NAMES
+    ])
+    children = Category.objects.bulk_create([
+        Category(user=user, name=name, parent=parent)
+        for parent in parents
+        for name in SUBCATEGORY_NAMES.get(parent.name, [])
+    ])
+    # bulk_create skips the signals that maintain category paths
+    categories.rebuild(user=user)
+    income_categories = parents[-2:]
+    expense_categories = parents[:-2] + children
+
+    today = date.today()
+    first_day = today - timedelta(days=365 * years)
+    days = (today - first_day).days
+
+    def transaction(number):
+        is_income = rng.random() < 0.1
+        return Transaction(
+            user=user,
+            account=rng.choice(account_objects),
+            category=rng.choice(income_categories if is_income else expense_categories),
+            amount=Decimal(rng.randrange(100, 500000 if is_income else 30000)) / 100,
+            transaction_type='INCOME' if is_income else 'EXPENSE',
+            description=f'{rng.choice(MERCHANTS)} {number}',
+            date=first_day + timedelta(days=rng.randrange(days + 1)),
+            tags=rng.sample(TAG_NAMES, rng.randint(1, 2)) if rng.random() < 0.2 else None,
+        )
+
+    Transaction.objects.bulk_create((transaction(number) for number in range(transactions)), batch_size=2000)
+
+    Budget.objects.bulk_create([
+        Budget(
+            user=user,
+            category=rng.choice(parents[:-2]),
+            name=f'Budget {number}',
+            amount=Decimal(rng.randrange(100, 2000)),
+            period=rng.choice(Budget.PERIOD_CHOICES)[0],
+            start_date=first_day,
+            rollover=rng.random() < 0.3,
+        )
+        for number in range(budgets)
+    ])
+    RecurringTransaction.objects.bulk_create([
+        RecurringTransaction(
+            user=user,
+            account=rng.choice(account_objects),
+            category=rng.choice(expense_categories),
+            amount=Decimal(rng.randrange(500, 50000)) / 100,
+            transaction_type='INCOME' if rng.random() < 0.1 else 'EXPENSE',
+            description=f'Subscription {number}',
+            frequency=rng.choice(RecurringTransaction.FREQUENCY_CHOICES)[0],
+            start_date=first_day,
+            next_due=today + timedelta(days=rng.randrange(30)),
+        )
+        for number in range(recurring)
+    ])
+    Goal.objects.bulk_create([
+        Goal(
+            user=user,
+            name=f'Goal {number}',
+            description='Synthetic goal',
+            target_amount=Decimal(rng.randrange(1000, 50000)),
+            goal_type='SAVINGS',
+            priority='MEDIUM',
+            deadline=today + timedelta(days=rng.randrange(30, 1000)),
+            start_date=today - timedelta(days=rng.randrange(30, 365)),
+            # Half of them track an account, a few a category, the rest are manual
+            account=rng.choice(account_objects) if number % 2 == 0 else None,
+            category=rng.choice(expense_categories) if number % 4 == 1 else None,
+        )
+        for number in range(goals)
+    ])
+
+    # Derived data, rebuilt once instead of row by row
+    rollups.rebuild(user=user)
+    ledger.recompute_balances(Account.objects.filter(user=user))
+    tags.rebuild(user=user)
+    recompute_goals(user=user)
+    if search.backend() == 'tokens':
+        # The FTS5 index is kept up to date by triggers
+        search.rebuild(user=user)
+    return user
+
+
+def seed_users(prefix, users=1, seed=0, **options):
+    """Seed ``users`` users named ``<prefix>-<n>``; each gets its own random seed"""
+    return [seed_user(f'{prefix}-{number}', seed=seed + number, **options) for number in range(users)]
+
+
+def explain(sql):
+    """Return the database's query plan for a captured SELECT statement"""
+    if not sql.lstrip().upper().startswith('SELECT'):
+        return None
+    prefix = 'EXPLAIN QUERY PLAN ' if connection.vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql)
+        return [' '.join(str(column) for column in row) for row in cursor.fetchall()]
+
+
+def profile_view(client, url, params=None, repeat=5, rows=None):
+    """
+    Time a view through the test client and capture its queries, on every
+    database, and their plans. ``rows`` counts the data rows of its JSON.
+    """
+    timings = []
+    for _ in range(repeat):
+        with ExitStack() as stack:
+            contexts = [
+                stack.enter_context(CaptureQueriesContext(connections[alias]))
+                for alias in {DEFAULT_DB_ALIAS, replica_alias() or DEFAULT_DB_ALIAS}
+            ]
+            started = time.perf_counter()
+            response = client.get(url, params or {})
+            if response.streaming:
+                size = sum(len(chunk) for chunk in response.streaming_content)
+            else:
+                size = len(response.content)
+            timings.append((time.perf_counter() - started) * 1000)
+
+    captured = [query for context in contexts for query in context.captured_queries]
+    return {
+        'status': response.status_code,
+        'bytes': size,
+        'rows': rows(response.json()) if rows and response.status_code == 200 else None,
+        'queries': len(captured),
+        'db_ms': round(sum(float(query['time']) for query in captured) * 1000, 2),
+        'total_ms': round(statistics.median(timings), 2),
+        # The first request also fills the caches the others are served from
+        'first_ms': round(timings[0], 2),
+        'plans': [
+            {'sql': query['sql'], 'plan': explain(query['sql'])}
+            for query in captured
+        ],
+    }
+
+
+def profile_views(user, views=BENCHMARK_VIEWS, repeat=5):
+    """
+    Profile every benchmark view as ``user``. Raises BenchmarkError when a
+    view does not answer 200 or a data API returns no rows.
+    """
+    if not forecast.available():
+        views = [view for view in views if view[0] != 'forecast_data']
+    # Outside the test runner 'testserver' is not an allowed host
+    client = Client(raise_request_exception=False, HTTP_HOST='localhost')
+    client.force_login(user)
+    with override_settings(CORE_CONCURRENT_QUERIES=False):
+        results = {
+            name: profile_view(client, reverse(url_name, args=args), params, repeat=repeat, rows=ROW_COUNTS.get(name))
+            for name, url_name, args, params in views
+        }
+
+    failures = [
+        f"{name} answered {result['status']}" if result['status'] != 200 else f'{name} returned no rows'
+        for name, result in results.items()
+        if result['status'] != 200 or result['rows'] == 0
+    ]
+    if failures:
+        raise BenchmarkError(', '.join(failures))
+    return results
+
+
+def compare(previous, current, tolerance=0.2):
+    """List human readable regressions between two profile_views results"""
+    regressions = []
+    for name, result in current.items():
+        before = previous.get(name)
+        if not before:
+            continue
+        if result['queries'] > before['queries']:
+            regressions.append(f"{name}: {before['queries']} -> {result['queries']} queries")
+        if result['total_ms'] > before['total_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: {before['total_ms']}ms -> {result['total_ms']}ms")
+        scans_before = sum(_full_scans(plan['plan']) for plan in before['plans'])
+        scans_after = sum(_full_scans(plan['plan']) for plan in result['plans'])
+        if scans_after > scans_before:
+            regressions.append(f"{name}: {scans_before} -> {scans_after} full table scans")
+    return regressions
+
+
+def _full_scans(plan):
+    # SQLite reports "SCAN <table>" without an index for full scans, PostgreSQL "Seq Scan"
+    return sum(
+        1 for line in plan or []
+        if ('SCAN ' in line and 'INDEX' not in line) or 'Seq Scan' in line
+    )
@@ -0,0 +1,117 @@
+# core/budgets.py
+"""
+Batched budget evaluation.
+
+All of a user's active budgets are evaluated with a single conditional
+aggregation over the daily rollups, instead of one ``Sum`` per budget.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from .categories import subtree
+from .dates import months_between, next_period_start, period_start
+from .fx import fold, user_currency
+from .models import Budget, DailySummary
+
+
+def active_budgets(user, today):
+    """Budgets that have started and not yet ended on ``today``"""
+    return Budget.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=today),
+        user=user,
+        start_date__lte=today,
+    ).select_related('category')
+
+
+def budget_window(budget, today):
+    """Return ``(start, end)`` of the budget's period containing ``today``"""
+    if not budget.period:
+        return budget.start_date, budget.end_date or today
+
+    start = period_start(budget.start_date, budget.period, today)
+    end = next_period_start(budget.start_date, budget.period, start) - timedelta(days=1)
+    if budget.end_date and budget.end_date < end:
+        end = budget.end_date
+    return start, end
+
+
+def completed_periods(budget, current_start):
+    """Number of full periods between the budget's start and ``current_start``"""
+    if budget.period == 'WEEKLY':
+        return (current_start - budget.start_date).days // 7
+    months = months_between(budget.start_date, current_start)
+    return months // 12 if budget.period == 'YEARLY' else months
+
+
+def _category_filter(budget):
+    # Budgets without a category cap total spending
+    if budget.category_id is None:
+        return Q()
+    # A parent category's budget covers its subcategories too
+    return subtree(budget.category)
+
+
+def evaluate_budgets(user, today=None, budgets=None):
+    """
+    Compute spent/remaining/percentage for every active budget of ``user``.
+
+    Issues one query for the budgets (skipped when ``budgets`` is given) and
+    one aggregate query for all of their spending, whatever their number.
+    """
+    today = today or timezone.now().date()
+    if budgets is None:
+        budgets = active_budgets(user, today)
+    budgets = list(budgets)
+    if not budgets:
+        return []
+
+    windows = {}
+    aggregates = {}
+    for budget in budgets:
+        start, end = budget_window(budget, today)
+        windows[budget.pk] = (start, end)
+        category = _category_filter(budget)
+        aggregates[f'spent_{budget.pk}'] = Sum(
+            'amount', filter=category & Q(date__gte=start, date__lte=min(end, today))
+        )
+        if budget.rollover and start > budget.start_date:
+            aggregates[f'carried_{budget.pk}'] = Sum(
+                'amount', filter=category & Q(date__gte=budget.start_date, date__lt=start)
+            )
+
+    earliest = min(
+        budget.start_date if budget.rollover else windows[budget.pk][0]
+        for budget in budgets
+    )
+    # Still one query: grouped by account currency and folded into the user's
+    rows = DailySummary.objects.filter(
+        user=user,
+        transaction_type='EXPENSE',
+        date__gte=earliest,
+        date__lte=today,
+    ).values('account__currency').annotate(**aggregates).order_by()
+    totals = (fold(rows, (), list(aggregates), user_currency(user), today) or [dict.fromkeys(aggregates)])[0]
+
+    results = []
+    for budget in budgets:
+        start, end = windows[budget.pk]
+        spent = totals[f'spent_{budget.pk}'] or Decimal('0')
+        limit = budget.amount
+        if f'carried_{budget.pk}' in totals:
+            # Unspent (or overspent) amounts from every earlier period carry forward
+            periods = completed_periods(budget, start)
+            limit += budget.amount * periods - (totals[f'carried_{budget.pk}'] or 0)
+
+        results.append({
+            'budget': budget,
+            'period_start': start,
+            'period_end': end,
+            'limit': limit,
+            'spent': spent,
+            'remaining': limit - spent,
+            'percentage': (spent / limit * 100) if limit > 0 else 0,
+        })
+    return results
@@ -0,0 +1,161 @@
+# core/bulk.py
+"""
+Set-based bulk operations on transactions.
+
+A selection of transactions is recategorized, retagged or given a new
+status with a single UPDATE statement, or deleted by id in chunks of raw
+DELETEs, without loading or saving any model instance. The derived data (balances, daily rollups,
+goal progress) is adjusted from one grouped query over the selection,
+taken before it changes: rows are grouped by everything those depend on,
+so the deltas are computed from a handful of groups rather than from
+every row.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import connections, router
+from django.db import transaction as db_transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from . import cache, goals, ledger, rollups, search, tags
+from .models import SearchToken, Transaction, TransactionTag
+
+OPERATIONS = ('recategorize', 'retag', 'set_status', 'delete')
+
+# Explicit id lists are bound as query parameters; larger selections use a filter
+MAX_IDS = 10000
+
+# Ids per DELETE statement, within every database's parameter limit
+DELETE_CHUNK_SIZE = 500
+
+# Fields of a transaction that balances, rollups and goals depend on
+GROUP_FIELDS = ('user_id', 'date', 'account_id', 'transfer_account_id', 'category_id', 'transaction_type', 'status')
+
+
+class BulkError(ValueError):
+    """A bulk operation that cannot be applied"""
+
+
+def _groups(selection):
+    return list(selection.order_by().values(*GROUP_FIELDS).annotate(amount=Sum('amount'), count=Count('id')))
+
+
+def _adjust(groups, change):
+    """
+    Move the derived data of every group to ``change(group)``, or take it
+    out when that is None; returns the number of accounts whose balance changed
+    """
+    balances = defaultdict(Decimal)
+    buckets = defaultdict(lambda: [Decimal('0'), 0])
+    goal_changes = []
+    for group in groups:
+        after = change(group)
+        for state, sign in ((group, -1), (after, 1)):
+            if state is None:
+                continue
+            for account_id, delta in ledger.effects(state).items():
+                balances[account_id] += sign * delta
+            bucket = buckets[(
+                state['user_id'], state['date'], state['account_id'], state['category_id'], state['transaction_type']
+            )]
+            bucket[0] += sign * state['amount']
+            bucket[1] += sign * state['count']
+            goal_changes.append((state, sign))
+
+    ledger.apply_deltas(balances)
+    rollups.apply_many({key: delta for key, delta in buckets.items() if any(delta)})
+    goals.apply(goal_changes)
+    return sum(1 for delta in balances.values() if delta)
+
+
+def recategorize(selection, category):
+    groups = _groups(selection)
+    count = selection.update(category=category, updated_at=timezone.now())
+    category_id = category.pk if category else None
+    return count, _adjust(groups, lambda group: dict(group, category_id=category_id))
+
+
+def set_status(selection, status):
+    if status not in dict(Transaction.STATUS_CHOICES):
+        raise BulkError(f'Unknown status {status!r}')
+    groups = _groups(selection)
+    count = selection.update(status=status, updated_at=timezone.now())
+    return count, _adjust(groups, lambda group: dict(group, status=status))
+
+
+def retag(selection, value):
+    names = tags.tag_names(value)
+    # The selection may be a tag search: rebuild the links before the tags change
+    TransactionTag.objects.filter(transaction__in=selection.values('pk')).delete()
+    reindex = []
+    if search.backend() == 'tokens':
+        reindex = list(selection.only('id', 'user_id', 'description'))
+    if names:
+        rows = list(selection.values_list('pk', 'user_id', 'account_id', 'date', 'transaction_type', 'amount'))
+        tag_ids = {user_id: tags.get_tags(user_id, names) for user_id in {row[1] for row in rows}}
+        TransactionTag.objects.bulk_create(
+            (
+                TransactionTag(
+                    transaction_id=pk,
+                    user_id=user_id,
+                    account_id=account_id,
+                    tag_id=tag_ids[user_id][name.casefold()],
+                    date=day,
+                    transaction_type=transaction_type,
+                    amount=amount,
+                )
+                for pk, user_id, account_id, day, transaction_type, amount in rows
+                for name in names
+            ),
+            batch_size=2000,
+        )
+    count = selection.update(tags=names or None, updated_at=timezone.now())
+    # The FTS5 index follows the UPDATE through its trigger
+    for transaction in reindex:
+        transaction.tags = names
+    search.index_transactions(reindex)
+    return count, 0
+
+
+def delete(selection):
+    groups = _groups(selection)
+    # Ids first: the selection may be a tag or token search over the rows deleted
+    ids = list(selection.order_by().values_list('pk', flat=True))
+    # A regular QuerySet.delete() would load every row and fire the per-row
+    # signals, adjusting balances and rollups a second time, so the
+    # transactions go in raw DELETEs and the cascade to the indexes is done by hand
+    connection = connections[router.db_for_write(Transaction)]
+    table = connection.ops.quote_name(Transaction._meta.db_table)
+    column = connection.ops.quote_name(Transaction._meta.pk.column)
+    count = 0
+    with connection.cursor() as cursor:
+        for start in range(0, len(ids), DELETE_CHUNK_SIZE):
+            chunk = ids[start:start + DELETE_CHUNK_SIZE]
+            TransactionTag.objects.filter(transaction_id__in=chunk).delete()
+            if search.backend() == 'tokens':
+                SearchToken.objects.filter(transaction_id__in=chunk).delete()
+            cursor.execute(f'DELETE FROM {table} WHERE {column} IN ({", ".join(["%s"] * len(chunk))})', chunk)
+            count += cursor.rowcount
+    return count, _adjust(groups, lambda group: None)
+
+
+def run(selection, operation, category=None, tags=None, status=None):
+    """
+    Apply ``operation`` to every transaction of ``selection`` (a queryset
+    already limited to one user's rows); returns the affected counts
+    """
+    if operation not in OPERATIONS:
+        raise BulkError(f'Unknown operation {operation!r}')
+    user_ids = set(selection.order_by().values_list('user_id', flat=True).distinct())
+    with db_transaction.atomic():
+        if operation == 'recategorize':
+            count, accounts = recategorize(selection, category)
+        elif operation == 'retag':
+            count, accounts = retag(selection, tags)
+        elif operation == 'set_status':
+            count, accounts = set_status(selection, status)
+        else:
+            count, accounts = delete(selection)
+        cache.bump(*user_ids)
+    return {'operation': operation, 'transactions': count, 'accounts': accounts}
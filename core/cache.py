@@ -0,0 +1,148 @@
+# core/cache.py
+"""
+Per-user versioned caching of derived data.
+
+Every user has a data version that is bumped whenever one of their
+transactions, accounts, budgets, goals, categories or recurrences
+changes. Cached fragments are keyed by that version, so nothing ever has
+to be deleted: a bump simply makes the old entries unreachable.
+"""
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction as db_transaction
+
+from .routers import reading_from_primary
+
+VERSION_KEY = 'core:version:{}'
+GLOBAL_VERSION_KEY = 'core:version:all'
+FRAGMENT_KEY = 'core:fragment:{}:{}:{}'
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def alias():
+    return getattr(settings, 'CORE_CACHE_ALIAS', 'default')
+
+
+def get_cache():
+    return caches[alias()]
+
+
+def timeout():
+    return getattr(settings, 'CORE_CACHE_TIMEOUT', 60 * 60 * 24)
+
+
+def _count(event, amount=1):
+    with _stats_lock:
+        _stats[event] += amount
+
+
+def stats():
+    """Hit/miss counters of this process"""
+    with _stats_lock:
+        counters = dict(_stats)
+    lookups = counters.get('hits', 0) + counters.get('misses', 0)
+    counters['hit_rate'] = round(counters.get('hits', 0) / lookups, 4) if lookups else None
+    return counters
+
+
+def reset_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def _new_version():
+    # Time based, so a version evicted from the cache never comes back with old entries
+    return time.time_ns()
+
+
+def data_version(user_id):
+    """Current data version of a user: a single cache round trip"""
+    cache = get_cache()
+    key = VERSION_KEY.format(user_id)
+    versions = cache.get_many([key, GLOBAL_VERSION_KEY])
+    missing = {}
+    if key not in versions:
+        missing[key] = versions[key] = _new_version()
+    if GLOBAL_VERSION_KEY not in versions:
+        missing[GLOBAL_VERSION_KEY] = versions[GLOBAL_VERSION_KEY] = _new_version()
+    if missing:
+        cache.set_many(missing, timeout=None)
+    return f'{versions[GLOBAL_VERSION_KEY]}.{versions[key]}'
+
+
+def _bump_now(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, _new_version(), timeout=None)
+    _count('invalidations', len(keys))
+
+
+def bump(*user_ids):
+    """Invalidate everything cached for these users once the current transaction commits"""
+    keys = [VERSION_KEY.format(user_id) for user_id in set(user_ids) if user_id is not None]
+    if keys:
+        db_transaction.on_commit(lambda: _bump_now(keys))
+
+
+def bump_all():
+    """Invalidate everything cached for every user"""
+    db_transaction.on_commit(lambda: _bump_now([GLOBAL_VERSION_KEY]))
+
+
+def _fragment_keys(user_id, names, scope, version):
+    return {
+        name: FRAGMENT_KEY.format(user_id, version, f'{scope}:{name}' if scope else name)
+        for name in names
+    }
+
+
+def cached_fragments(user_id, builders, scope='', version=None):
+    """
+    Return ``{name: value}`` for a dict of ``{name: builder}``, computing and
+    storing only the fragments that are not cached for the user's current
+    data version. ``scope`` separates otherwise identical names (e.g. a date).
+    """
+    cache = get_cache()
+    version = version or data_version(user_id)
+    keys = _fragment_keys(user_id, builders, scope, version)
+    cached = cache.get_many(list(keys.values()))
+
+    values = {}
+    missing = {}
+    for name, key in keys.items():
+        if key in cached:
+            values[name] = cached[key]
+        else:
+            # What is stored under ``version`` must not come from a replica that is behind it
+            with reading_from_primary():
+                values[name] = missing[key] = builders[name]()
+    _count('hits', len(keys) - len(missing))
+    _count('misses', len(missing))
+    if missing:
+        cache.set_many(missing, timeout=timeout())
+    return values
+
+
+def store_fragments(user_id, values, scope='', version=None):
+    """
+    Store precomputed ``{name: value}`` fragments, e.g. from a batch job.
+    Pass the ``version`` read before computing them, so data that changed in
+    the meantime is not cached under the new version.
+    """
+    version = version or data_version(user_id)
+    keys = _fragment_keys(user_id, values, scope, version)
+    get_cache().set_many({keys[name]: value for name, value in values.items()}, timeout=timeout())
+
+
+def cached_fragment(user_id, name, builder, scope=''):
+    """Single fragment shortcut for cached_fragments"""
+    return cached_fragments(user_id, {name: builder}, scope=scope)[name]
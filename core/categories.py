@@ -0,0 +1,152 @@
+# core/categories.py
+"""
+Category tree stored as materialized paths.
+
+Every category stores the fixed-width ids of its ancestors and itself
+(``0000000003/0000000017/``). A subtree is then a single indexed range on
+``path``, and the subtree a row rolls up to at any level is a prefix of
+its path, so "total per child of X, descendants included" is one GROUP BY.
+Paths are maintained by core.signals on create, move and delete.
+"""
+from collections import defaultdict
+
+from django.db.models import F, Q, Sum, Value
+from django.db.models.functions import Concat, Substr
+
+from .fx import fold
+from .models import Category
+
+ID_WIDTH = 10
+STEP = ID_WIDTH + 1  # Id plus separator
+MAX_DEPTH = Category._meta.get_field('path').max_length // STEP
+
+
+class TreeError(ValueError):
+    """A category move that would break the tree"""
+
+
+def segment(pk):
+    return f'{pk:0{ID_WIDTH}d}/'
+
+
+def path_id(path):
+    """Id of the category a path ends with"""
+    return int(path[-STEP:-1])
+
+
+def subtree(category, prefix='category__'):
+    """Q matching rows whose category is ``category`` or one of its descendants"""
+    # A range rather than startswith, so the index is used on every database
+    return Q(**{f'{prefix}path__gte': category.path, f'{prefix}path__lt': category.path + '~'})
+
+
+def descendants(category, include_self=True):
+    categories = Category.objects.filter(subtree(category, prefix=''), user_id=category.user_id)
+    if not include_self:
+        categories = categories.exclude(pk=category.pk)
+    return categories
+
+
+def check_move(category, parent):
+    """Raise TreeError if ``parent`` cannot become the parent of ``category``"""
+    if parent is None:
+        return
+    if category.pk is not None and (parent.pk == category.pk or parent.path.startswith(category.path or '-')):
+        raise TreeError('A category cannot be moved under itself or one of its subcategories')
+    if parent.depth + 1 >= MAX_DEPTH:
+        raise TreeError(f'Categories cannot be nested more than {MAX_DEPTH} levels deep')
+
+
+def place(category):
+    """
+    Store the path of a saved category, moving its descendants along if it
+    changed; returns the previous path of a category that moved
+    """
+    parent = None
+    if category.parent_id:
+        parent = Category.objects.only('path', 'depth').get(pk=category.parent_id)
+    path = (parent.path if parent else '') + segment(category.pk)
+    depth = parent.depth + 1 if parent else 0
+
+    stored = Category.objects.filter(pk=category.pk).values_list('path', 'depth').first()
+    old_path, old_depth = stored or ('', 0)
+    if old_path == path:
+        return None
+    if old_path:
+        # Whole subtree, the category itself included, in one UPDATE
+        Category.objects.filter(
+            user_id=category.user_id, path__gte=old_path, path__lt=old_path + '~'
+        ).update(
+            path=Concat(Value(path), Substr('path', len(old_path) + 1)),
+            depth=F('depth') + (depth - old_depth),
+        )
+    else:
+        Category.objects.filter(pk=category.pk).update(path=path, depth=depth)
+    category.path, category.depth = path, depth
+    return old_path or None
+
+
+def detach(category):
+    """Turn the children of a category that is about to be deleted into roots"""
+    Category.objects.filter(
+        user_id=category.user_id, path__gt=category.path, path__lt=category.path + '~'
+    ).update(
+        path=Substr('path', len(category.path) + 1),
+        depth=F('depth') - (category.depth + 1),
+    )
+
+
+def rebuild(user=None):
+    """Recompute every path from the parent links; returns the number of categories"""
+    categories = Category.objects.all() if user is None else Category.objects.filter(user=user)
+    nodes = list(categories.only('id', 'parent_id', 'path', 'depth'))
+    children = defaultdict(list)
+    known = {node.pk for node in nodes}
+    for node in nodes:
+        children[node.parent_id if node.parent_id in known else None].append(node)
+
+    changed = []
+    stack = [(node, '', 0) for node in children[None]]
+    while stack:
+        node, parent_path, depth = stack.pop()
+        path = parent_path + segment(node.pk)
+        if (node.path, node.depth) != (path, depth):
+            node.path, node.depth = path, depth
+            changed.append(node)
+        stack.extend((child, path, depth + 1) for child in children[node.pk])
+    Category.objects.bulk_update(changed, ['path', 'depth'], batch_size=1000)
+    return len(nodes)
+
+
+def subtree_totals(rows, parent=None, amount='amount', currency=None):
+    """
+    Roll ``rows`` (a DailySummary or Transaction queryset) up to the
+    children of ``parent``, or to the root categories: one GROUP BY on the
+    path prefix. Returns dicts with category_id, category__name and total;
+    spending on ``parent`` itself and uncategorised spending come back with
+    the parent's id or None. With ``currency``, totals are converted into it.
+    """
+    depth = 0
+    if parent is not None:
+        rows = rows.filter(subtree(parent))
+        depth = parent.depth + 1
+    rows = rows.annotate(node=Substr('category__path', 1, STEP * (depth + 1)))
+    if currency:
+        totals = fold(
+            rows.values('node', 'account__currency').annotate(total=Sum(amount)).order_by(),
+            ('node',), ('total',), currency
+        )
+        totals.sort(key=lambda row: row['total'], reverse=True)
+    else:
+        totals = list(rows.values('node').annotate(total=Sum(amount)).order_by('-total'))
+    names = dict(Category.objects.filter(
+        pk__in=[path_id(row['node']) for row in totals if row['node']]
+    ).values_list('id', 'name'))
+    return [
+        {
+            'category_id': path_id(row['node']) if row['node'] else None,
+            'category__name': names.get(path_id(row['node'])) if row['node'] else None,
+            'total': row['total'],
+        }
+        for row in totals
+    ]
@@ -0,0 +1,80 @@
+# core/charts.py
+"""
+Chart data for the dashboard APIs, and concurrent fan-out for async views.
+
+The builders are plain synchronous functions returning JSON-ready data.
+``fan_out`` runs several of them at once, each in a worker thread with its
+own database connection, so a combined response takes as long as the
+slowest builder instead of the sum of all of them.
+"""
+import asyncio
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q, Sum
+
+from .budgets import evaluate_budgets
+from .categories import subtree_totals
+from .fx import user_currency
+from .models import DailySummary
+from .reporting import series
+
+def transaction_chart(user, date_from, date_to, granularity='day'):
+    """Income and expenses per ``granularity`` bucket, empty buckets included"""
+    return series(DailySummary.objects.filter(user=user), date_from, date_to, granularity, {
+        'income': Sum('amount', filter=Q(transaction_type='INCOME')),
+        'expenses': Sum('amount', filter=Q(transaction_type='EXPENSE')),
+    }, user_currency(user))
+
+
+def category_chart(user, date_from, date_to, parent=None):
+    """Totals per top-level category, or per child of ``parent``"""
+    return subtree_totals(DailySummary.objects.filter(
+        user=user,
+        date__gte=date_from,
+        date__lte=date_to
+    ), parent=parent, currency=user_currency(user))
+
+
+def budget_progress(user, today):
+    return [
+        {
+            'name': progress['budget'].name,
+            'category': progress['budget'].category.name if progress['budget'].category else None,
+            'budget': float(progress['limit']),
+            'spent': float(progress['spent']),
+            'remaining': float(progress['remaining']),
+            'percentage': float(progress['percentage']),
+            'period_start': progress['period_start'],
+            'period_end': progress['period_end'],
+        }
+        for progress in evaluate_budgets(user, today)
+    ]
+
+
+def _close_connections(builder):
+    # Worker threads are pooled; their connections follow CONN_MAX_AGE like a request's
+    def run(*args, **kwargs):
+        close_old_connections()
+        try:
+            return builder(*args, **kwargs)
+        finally:
+            close_old_connections()
+    return run
+
+
+def in_thread(builder):
+    """
+    Awaitable version of a builder that runs in a worker thread of its own.
+    With CORE_CONCURRENT_QUERIES off it runs on the request's own thread and
+    connection instead, e.g. where uncommitted data must be visible.
+    """
+    if not getattr(settings, 'CORE_CONCURRENT_QUERIES', True):
+        return sync_to_async(builder)
+    return sync_to_async(_close_connections(builder), thread_sensitive=False)
+
+
+async def fan_out(builders):
+    """Run ``{name: callable}`` concurrently and return ``{name: result}``"""
+    results = await asyncio.gather(*(in_thread(builder)() for builder in builders.values()))
+    return dict(zip(builders, results))
@@ -0,0 +1,172 @@
+# core/dashboard.py
+"""
+Dashboard fragments.
+
+Each fragment builds one independent piece of the dashboard context and
+returns plain, picklable data, so it can be cached per user and data
+version by core.cache. The dashboard page itself renders no data: each
+widget is a server-rendered partial built from a few fragments and fetched
+after first paint, so the slowest widget no longer holds up the page.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Q, Sum
+from django.db.models.functions import TruncMonth
+
+from .budgets import evaluate_budgets
+from .cache import cached_fragments, data_version
+from .fx import convert, fold, rates_version, user_currency
+from .goals import progress
+from .models import Account, DailySummary, Goal, RecurringTransaction, Transaction
+
+
+def accounts_fragment(user, today):
+    accounts = list(Account.objects.filter(
+        user=user,
+        is_archived=False
+    ).annotate(
+        transaction_count=Count('transaction')
+    ))
+    currency = user_currency(user)
+    return {
+        'accounts': accounts,
+        'currency': currency,
+        'total_balance': sum(
+            convert(account.balance, account.currency, currency, today) for account in accounts
+        ),
+    }
+
+
+def monthly_summary_fragment(user, today):
+    # Read from the daily rollups, one row per bucket
+    monthly_totals = fold(DailySummary.objects.filter(
+        user=user,
+        date__gte=today.replace(day=1),
+        date__lte=today
+    ).values('account__currency').annotate(
+        income=Sum('amount', filter=Q(transaction_type='INCOME')),
+        expenses=Sum('amount', filter=Q(transaction_type='EXPENSE'))
+    ).order_by(), (), ('income', 'expenses'), user_currency(user), today) or [{}]
+    return {
+        'monthly_income': monthly_totals[0].get('income') or 0,
+        'monthly_expenses': monthly_totals[0].get('expenses') or 0,
+    }
+
+
+def recent_transactions_fragment(user, today):
+    return {
+        'recent_transactions': list(Transaction.objects.filter(
+            user=user
+        ).select_related('account', 'category')[:5]),
+    }
+
+
+def budget_progress_fragment(user, today):
+    # All budgets in one aggregate query
+    return {'budget_progress': evaluate_budgets(user, today)}
+
+
+def goals_fragment(user, today):
+    # Linked goals keep current_amount up to date, so progress needs no extra queries
+    return {
+        'active_goals': [
+            progress(goal, today)
+            for goal in Goal.objects.filter(
+                user=user,
+                status='IN_PROGRESS'
+            ).select_related('account', 'category')
+        ],
+    }
+
+
+def category_spending_fragment(user, today):
+    # Last 30 days
+    spending = fold(DailySummary.objects.filter(
+        user=user,
+        transaction_type='EXPENSE',
+        date__gte=today - timedelta(days=30)
+    ).values('category__name', 'account__currency').annotate(
+        total=Sum('amount')
+    ).order_by(), ('category__name',), ('total',), user_currency(user), today)
+    spending.sort(key=lambda row: row['total'], reverse=True)
+    return {'category_spending': spending[:5]}
+
+
+def monthly_trend_fragment(user, today):
+    # Last 6 months
+    return {
+        'monthly_trend': fold(DailySummary.objects.filter(
+            user=user,
+            date__gte=today - timedelta(days=180)
+        ).annotate(
+            month=TruncMonth('date')
+        ).values('month', 'transaction_type', 'account__currency').annotate(
+            total=Sum('amount')
+        ).order_by('month'), ('month', 'transaction_type'), ('total',), user_currency(user), date_key='month'),
+    }
+
+
+def upcoming_recurring_fragment(user, today):
+    return {
+        'upcoming_recurring': list(RecurringTransaction.objects.filter(
+            user=user,
+            status='ACTIVE',
+            next_due__gt=today
+        ).select_related('account', 'category').order_by('next_due')[:3]),
+    }
+
+
+FRAGMENTS = {
+    'accounts': accounts_fragment,
+    'monthly_summary': monthly_summary_fragment,
+    'recent_transactions': recent_transactions_fragment,
+    'budget_progress': budget_progress_fragment,
+    'goals': goals_fragment,
+    'category_spending': category_spending_fragment,
+    'monthly_trend': monthly_trend_fragment,
+    'upcoming_recurring': upcoming_recurring_fragment,
+}
+
+
+# Widgets loaded separately by the dashboard page, and the fragments each one renders
+WIDGETS = {
+    'summary': ('accounts', 'monthly_summary'),
+    'monthly_trend': ('monthly_trend',),
+    'category_spending': ('category_spending',),
+    'budgets': ('budget_progress',),
+    'goals': ('goals',),
+    'recent_transactions': ('recent_transactions',),
+    'upcoming_recurring': ('upcoming_recurring',),
+}
+
+
+def scope(user, today):
+    """What cached dashboard data depends on besides the user's data version"""
+    # The currency is not part of the data version: changing it bumps nothing
+    return f'dashboard:{today.isoformat()}:{user_currency(user)}:{rates_version()}'
+
+
+def dashboard_context(user, today, fragments=FRAGMENTS):
+    """Build the dashboard context, serving unchanged fragments from the cache"""
+    values = cached_fragments(
+        user.pk,
+        {name: (lambda build=build: build(user, today)) for name, build in fragments.items()},
+        scope=scope(user, today),
+    )
+    context = {}
+    for name in fragments:
+        context.update(values[name])
+    return context
+
+
+def widget_context(user, today, name):
+    """Context of one dashboard widget"""
+    return dashboard_context(user, today, {fragment: FRAGMENTS[fragment] for fragment in WIDGETS[name]})
+
+
+def widget_version(user, today, name):
+    """
+    Identifies what a widget renders for ``user``: it only changes with
+    their data version, the day, their currency or the exchange rates
+    """
+    return f'{name}:{scope(user, today)}:{data_version(user.pk)}'
@@ -0,0 +1,39 @@
+# core/dates.py
+"""Calendar arithmetic shared by budgets, recurrences and reports"""
+import calendar
+from datetime import timedelta
+
+
+def add_months(day, months):
+    """Shift ``day`` by a number of months, clamping to the end of shorter months"""
+    month_index = day.month - 1 + months
+    year = day.year + month_index // 12
+    month = month_index % 12 + 1
+    return day.replace(year=year, month=month, day=min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def months_between(start, end):
+    """Number of whole months from ``start`` to ``end``"""
+    months = (end.year - start.year) * 12 + end.month - start.month
+    if add_months(start, months) > end:
+        months -= 1
+    return months
+
+
+def period_start(anchor, period, day):
+    """First day of the ``period`` (WEEKLY/MONTHLY/YEARLY) cycle anchored on ``anchor`` that contains ``day``"""
+    if period == 'WEEKLY':
+        return anchor + timedelta(days=(day - anchor).days // 7 * 7)
+    months = months_between(anchor, day)
+    if period == 'YEARLY':
+        months -= months % 12
+    return add_months(anchor, months)
+
+
+def next_period_start(anchor, period, start):
+    """First day of the cycle following the one starting at ``start``"""
+    if period == 'WEEKLY':
+        return start + timedelta(days=7)
+    # Count from the anchor, not the clamped start, so the 31st does not drift to the 28th
+    months = months_between(anchor, start) + (12 if period == 'YEARLY' else 1)
+    return add_months(anchor, months)
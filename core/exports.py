@@ -0,0 +1,152 @@
+# core/exports.py
+"""
+Streaming CSV exports.
+
+Rows are read with ``values_list(...).iterator()`` and written to the
+response as they are produced, so memory use stays flat no matter how
+long the exported history is.
+"""
+import csv
+import zlib
+
+from django.db.models import Q, Sum
+from django.http import StreamingHttpResponse
+
+from . import search, tags
+from .fx import fold, user_currency
+from .models import DailySummary, Transaction
+from .reporting import series
+
+EXPORT_CHUNK_SIZE = 2000
+
+TRANSACTION_HEADER = ['Date', 'Category', 'Account', 'Type', 'Amount', 'Description']
+TRANSACTION_COLUMNS = ('date', 'category__name', 'account__name', 'transaction_type', 'amount', 'description')
+
+REPORT_TYPES = ('expense', 'income', 'tags', 'cash-flow')
+
+
+class Echo:
+    """Pseudo-buffer that hands each written line straight back to the caller"""
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(header, rows):
+    """Yield CSV-encoded lines for a header and an iterable of rows"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def gzip_chunks(chunks, level=6):
+    """Compress an iterable of text chunks into a gzip stream"""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, zlib.MAX_WBITS | 16)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def filter_transactions(user, transactions, filters):
+    """
+    Apply TransactionFilterForm-style cleaned data to ``user``'s transaction
+    queryset, including the ``q`` search
+    """
+    if filters.get('category'):
+        transactions = transactions.filter(category=filters['category'])
+    if filters.get('account'):
+        transactions = transactions.filter(account=filters['account'])
+    if filters.get('date_from'):
+        transactions = transactions.filter(date__gte=filters['date_from'])
+    if filters.get('date_to'):
+        transactions = transactions.filter(date__lte=filters['date_to'])
+    matches = search.matching(user, filters.get('q'))
+    if matches is not None:
+        transactions = transactions.filter(pk__in=matches)
+    return transactions
+
+
+def transaction_rows(user, filters=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """Stream export rows as plain tuples, without instantiating models"""
+    transactions = filter_transactions(user, Transaction.objects.filter(user=user), filters or {})
+    return transactions.order_by('-date', '-id').values_list(*TRANSACTION_COLUMNS).iterator(
+        chunk_size=chunk_size
+    )
+
+
+def transaction_batches(user, filters=None, batch_size=EXPORT_CHUNK_SIZE, columns=TRANSACTION_COLUMNS, keyed=False):
+    """
+    Export rows in lists of ``batch_size``, each read by its own keyset
+    query, so no read stays open while the caller writes between batches.
+    ``keyed`` rows start with the id and date the pages are keyed on.
+    """
+    transactions = filter_transactions(user, Transaction.objects.filter(user=user), filters or {}).order_by(
+        '-date', '-id'
+    )
+    page = transactions
+    while True:
+        rows = list(page.values_list('id', 'date', *columns)[:batch_size])
+        if not rows:
+            return
+        yield rows if keyed else [row[2:] for row in rows]
+        last_id, last_date = rows[-1][0], rows[-1][1]
+        page = transactions.filter(Q(date__lt=last_date) | Q(date=last_date, id__lt=last_id))
+
+
+def report_rows(user, report_type, filters):
+    """
+    ``(header, rows)`` of a report for TransactionFilterForm and
+    ReportRangeForm cleaned data, amounts in the user's currency
+    """
+    # Rollups cannot be searched, so a searched report totals the matching transactions
+    model = Transaction if filters.get('q') else DailySummary
+    summaries = filter_transactions(user, model.objects.filter(user=user), filters)
+    currency = user_currency(user)
+
+    # Grouped rows are few, so they are built in memory
+    if report_type in ('expense', 'income'):
+        header = ['Category', 'Total Expenses' if report_type == 'expense' else 'Total Income']
+        totals = fold(summaries.filter(
+            transaction_type=report_type.upper()
+        ).values('category__name', 'account__currency').annotate(
+            total=Sum('amount')
+        ).order_by(), ('category__name',), ('total',), currency, filters.get('date_to'))
+        totals.sort(key=lambda row: row['total'], reverse=True)
+        return header, [(row['category__name'], row['total']) for row in totals]
+
+    if report_type == 'tags':
+        return ['Tag', 'Total Expenses', 'Transactions'], [
+            (row['tag__name'], row['total'], row['transactions'])
+            for row in tags.tag_totals(
+                user,
+                date_from=filters['date_from'],
+                date_to=filters.get('date_to'),
+                currency=currency
+            )
+        ]
+
+    if report_type == 'cash-flow':
+        return ['Date', 'Income', 'Expenses'], [
+            (row['date'], row['income'], row['expenses'])
+            for row in series(summaries, filters['date_from'], filters['date_to'], filters['granularity'], {
+                'income': Sum('amount', filter=Q(transaction_type='INCOME')),
+                'expenses': Sum('amount', filter=Q(transaction_type='EXPENSE')),
+            }, currency)
+        ]
+
+    raise ValueError(f'Unknown report type: {report_type}')
+
+
+def csv_response(filename, header, rows, compress=False):
+    """Build a streaming CSV (optionally gzip-compressed) download"""
+    chunks = csv_rows(header, rows)
+    if compress:
+        response = StreamingHttpResponse(gzip_chunks(chunks), content_type='application/gzip')
+        filename += '.gz'
+    else:
+        response = StreamingHttpResponse(chunks, content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
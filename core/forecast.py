@@ -0,0 +1,247 @@
+# core/forecast.py
+"""
+Cash-flow forecast.
+
+Per-account balances are projected day by day: the active recurrences are
+expanded onto the future days, and every other day gets the account's
+average non-recurring net flow for that calendar month over the last two
+years of history. Everything is a NumPy array of accounts x days, so five
+years of daily buckets cost a few vectorized operations per user, and
+``forecast_users`` loads the inputs of a whole chunk of users in a handful
+of grouped queries.
+
+NumPy is optional; without it ``available()`` is False and the forecast
+API answers 503.
+"""
+import logging
+from collections import defaultdict
+from datetime import timedelta
+from functools import lru_cache
+
+from django.contrib.auth import get_user_model
+from django.db.models import Q, Sum
+
+from . import cache, ledger
+from .dates import add_months
+from .fx import MissingRate, rate, rates_version, user_currency
+from .models import Account, DailySummary, Goal, RecurringTransaction, Transaction
+from .recurring import due_dates, occurrence, occurrence_index
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MONTHS = 12
+MAX_MONTHS = 60
+HISTORY_DAYS = 730
+FORECAST_CHUNK_SIZE = 500
+
+
+def available():
+    return np is not None
+
+
+def forecast_months(value, default=DEFAULT_MONTHS):
+    """Parse a requested horizon, clamped to MAX_MONTHS"""
+    try:
+        return max(1, min(int(value), MAX_MONTHS))
+    except (TypeError, ValueError):
+        return default
+
+
+def _days(start, end):
+    """datetime64 days from ``start`` to ``end``, both included"""
+    return np.arange(np.datetime64(start, 'D'), np.datetime64(end, 'D') + 1)
+
+
+def _month_of_year(days):
+    return days.astype('datetime64[M]').astype(int) % 12
+
+
+@lru_cache(maxsize=32)
+def horizon(today, months):
+    """
+    Days forecast for ``today`` (tomorrow up to ``months`` later), their
+    calendar month, and the indexes of the month ends that are reported
+    """
+    end = add_months(today, months)
+    days = _days(today + timedelta(days=1), end)
+    month_of_year = _month_of_year(days)
+    month_ends = np.flatnonzero(np.append(month_of_year[1:] != month_of_year[:-1], True))
+    return days, month_of_year, month_ends
+
+
+def _seasonal_averages(history, first_day, today):
+    """Average daily net flow per calendar month for an accounts x days history"""
+    window = _days(first_day, today)
+    months = _month_of_year(window)
+    totals = np.zeros((history.shape[0], 12))
+    for month in range(12):
+        totals[:, month] = history[:, months == month].sum(axis=1)
+    days_per_month = np.bincount(months, minlength=12)
+    averages = totals / np.maximum(days_per_month, 1)
+    # Calendar months missing from the history fall back to the overall average
+    overall = history.sum(axis=1, keepdims=True) / len(window)
+    return np.where(days_per_month > 0, averages, overall)
+
+
+def _occurrence_offsets(recurrence, today, end):
+    """Day offsets from tomorrow of the occurrences up to ``end``"""
+    if recurrence.end_date:
+        end = min(end, recurrence.end_date)
+    first = today + timedelta(days=1)
+    index = occurrence_index(recurrence, max(first, recurrence.next_due))
+    day = occurrence(recurrence, index)
+    if day > end:
+        return np.zeros(0, dtype=int)
+    if recurrence.frequency in ('DAILY', 'WEEKLY'):
+        return np.arange((day - first).days, (end - first).days + 1, 1 if recurrence.frequency == 'DAILY' else 7)
+    offsets = []
+    while day <= end:
+        offsets.append((day - first).days)
+        index += 1
+        day = occurrence(recurrence, index)
+    return np.array(offsets, dtype=int)
+
+
+def _load(user_ids, first_day, today):
+    """Inputs of a chunk of users, grouped by user id, in six queries"""
+    inputs = defaultdict(lambda: {'accounts': [], 'flows': [], 'recurring_flows': [], 'recurrences': [], 'goals': []})
+    for user in get_user_model().objects.filter(pk__in=user_ids):
+        inputs[user.pk]['user'] = user
+    for account in Account.objects.filter(user__in=user_ids, is_archived=False).order_by('pk'):
+        inputs[account.user_id]['accounts'].append(account)
+
+    flows = {
+        'income': Sum('amount', filter=Q(transaction_type='INCOME')),
+        'expenses': Sum('amount', filter=Q(transaction_type='EXPENSE')),
+    }
+    window = Q(user__in=user_ids, date__gte=first_day, date__lte=today)
+    for row in DailySummary.objects.filter(window).values('user_id', 'account_id', 'date').annotate(**flows).order_by():
+        inputs[row['user_id']]['flows'].append(row)
+    # Materialized recurrences are projected from their schedule, not from history
+    for row in Transaction.objects.filter(window, is_recurring=True).values(
+        'user_id', 'account_id', 'date'
+    ).annotate(**flows).order_by():
+        inputs[row['user_id']]['recurring_flows'].append(row)
+
+    for recurrence in RecurringTransaction.objects.filter(user__in=user_ids, status='ACTIVE'):
+        inputs[recurrence.user_id]['recurrences'].append(recurrence)
+    for goal in Goal.objects.filter(user__in=user_ids, status='IN_PROGRESS', deadline__gt=today).order_by('deadline'):
+        inputs[goal.user_id]['goals'].append(goal)
+    return inputs
+
+
+def _factor(source, target, today):
+    try:
+        return float(rate(source, target, today))
+    except MissingRate as exc:
+        logger.warning('%s; leaving the forecast unconverted', exc)
+        return 1.0
+
+
+def _project(inputs, today, months):
+    days, month_of_year, month_ends = horizon(today, months)
+    end = add_months(today, months)
+    first_day = today - timedelta(days=HISTORY_DAYS - 1)
+    accounts = inputs['accounts']
+    rows = {account.pk: row for row, account in enumerate(accounts)}
+
+    history = np.zeros((len(accounts), HISTORY_DAYS))
+    for flows, sign in ((inputs['flows'], 1), (inputs['recurring_flows'], -1)):
+        for flow in flows:
+            if flow['account_id'] in rows:
+                history[rows[flow['account_id']], (flow['date'] - first_day).days] += sign * float(
+                    (flow['income'] or 0) - (flow['expenses'] or 0)
+                )
+    # Average over the days the user actually has history for
+    active = np.flatnonzero(history.any(axis=0))
+    start = active[0] if len(active) else HISTORY_DAYS - 1
+    daily = _seasonal_averages(history[:, start:], first_day + timedelta(days=int(start)), today)[:, month_of_year]
+
+    for recurrence in inputs['recurrences']:
+        overdue, _ = due_dates(recurrence, today)
+        offsets = _occurrence_offsets(recurrence, today, end)
+        for account_id, delta in ledger.effects({
+            'account_id': recurrence.account_id,
+            'transfer_account_id': recurrence.transfer_account_id,
+            'transaction_type': recurrence.transaction_type,
+            'amount': recurrence.amount,
+            'status': 'COMPLETED',
+        }).items():
+            if account_id in rows:
+                # Occurrences the scheduler has not materialized yet land tomorrow
+                daily[rows[account_id], 0] += float(delta) * len(overdue)
+                np.add.at(daily[rows[account_id]], offsets, float(delta))
+
+    balances = np.array([float(account.balance) for account in accounts]).reshape(-1, 1)
+    projected = balances + np.cumsum(daily, axis=1)
+
+    currency = user_currency(inputs.get('user'))
+    factors = np.array([_factor(account.currency, currency, today) for account in accounts]).reshape(-1, 1)
+    total = (projected * factors).sum(axis=0)
+    dates = days[month_ends].astype(object)
+    return {
+        'currency': currency,
+        'months': months,
+        'dates': list(dates),
+        'accounts': [
+            {
+                'id': account.pk,
+                'name': account.name,
+                'currency': account.currency,
+                'balance': float(account.balance),
+                'projection': np.round(projected[row, month_ends], 2).tolist(),
+            }
+            for row, account in enumerate(accounts)
+        ],
+        'total': np.round(total[month_ends], 2).tolist(),
+        'goals': [
+            {
+                'id': goal.pk,
+                'name': goal.name,
+                'deadline': goal.deadline,
+                'target': float(goal.target_amount),
+                'projected_balance': round(float(total[(min(goal.deadline, end) - today).days - 1]), 2),
+            }
+            for goal in inputs['goals']
+        ],
+    }
+
+
+def forecast_users(user_ids, today, months=DEFAULT_MONTHS):
+    """``{user_id: forecast}`` for a chunk of users"""
+    if np is None:
+        raise RuntimeError('Forecasting requires NumPy')
+    inputs = _load(user_ids, today - timedelta(days=HISTORY_DAYS - 1), today)
+    return {user_id: _project(inputs[user_id], today, months) for user_id in user_ids}
+
+
+def _scope(today, months, currency, rates):
+    # The currency is not part of the data version: changing it bumps nothing
+    return f'forecast:{today.isoformat()}:{months}:{currency}:{rates}'
+
+
+def forecast(user, today, months=DEFAULT_MONTHS):
+    """Forecast of one user, cached until their data, their currency or the exchange rates change"""
+    return cache.cached_fragment(
+        user.pk, 'forecast', lambda: forecast_users([user.pk], today, months)[user.pk],
+        scope=_scope(today, months, user_currency(user), rates_version()),
+    )
+
+
+def precompute(user_ids, today, months=DEFAULT_MONTHS, chunk_size=FORECAST_CHUNK_SIZE):
+    """Compute and cache the forecasts of many users, chunk by chunk; returns the number of users"""
+    rates = rates_version()
+    user_ids = list(user_ids)
+    for start in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[start:start + chunk_size]
+        # Read versions first: a write during the computation makes the result unreachable
+        versions = {user_id: cache.data_version(user_id) for user_id in chunk}
+        for user_id, values in forecast_users(chunk, today, months).items():
+            scope = _scope(today, months, values['currency'], rates)
+            cache.store_fragments(user_id, {'forecast': values}, scope=scope, version=versions[user_id])
+    return len(user_ids)
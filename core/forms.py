@@ -1,11 +1,32 @@
 # core/forms.py
+from datetime import timedelta
+
 from django import forms
+from django.db import transaction as db_transaction
+from django.utils import timezone
+from . import ledger
 from .models import Transaction, Budget, Goal, Category, RecurringTransaction, Account
+from .bulk import MAX_IDS, OPERATIONS
+from .categories import TreeError, check_move
+from .reporting import DEFAULT_DAYS, GRANULARITIES, MAX_BUCKETS, bucket_count
+
+def clean_transfer(form, cleaned_data):
+    """A transfer needs a second account; other types drop one"""
+    transaction_type = cleaned_data.get('transaction_type')
+    transfer_account = cleaned_data.get('transfer_account')
+    if transaction_type == 'TRANSFER':
+        if not transfer_account:
+            form.add_error('transfer_account', 'Choose the account this transfer goes to.')
+        elif transfer_account == cleaned_data.get('account'):
+            form.add_error('transfer_account', 'A transfer needs two different accounts.')
+    elif transfer_account:
+        cleaned_data['transfer_account'] = None
+    return cleaned_data
 
 class TransactionForm(forms.ModelForm):
     class Meta:
         model = Transaction
-        fields = ['account', 'category', 'transaction_type', 'amount', 'date', 'description']
+        fields = ['account', 'transfer_account', 'category', 'transaction_type', 'amount', 'date', 'description']
     
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)  # Get the user from the kwargs
@@ -14,10 +35,15 @@ class TransactionForm(forms.ModelForm):
         # Filter the account and category fields to show only the user's data
         if user:
             self.fields['account'].queryset = self.fields['account'].queryset.filter(user=user)
+            self.fields['transfer_account'].queryset = self.fields['transfer_account'].queryset.filter(user=user)
             self.fields['category'].queryset = self.fields['category'].queryset.filter(user=user)
 
         # Add custom labels and widgets if needed
         self.fields['date'].widget = forms.DateInput(attrs={'type': 'date'})
+        self.fields['transfer_account'].label = 'Transfer to'
+
+    def clean(self):
+        return clean_transfer(self, super().clean())
 class BudgetForm(forms.ModelForm):
     class Meta:
         model = Budget
@@ -37,12 +63,33 @@ class BudgetForm(forms.ModelForm):
 class GoalForm(forms.ModelForm):
     class Meta:
         model = Goal
-        fields = ['name', 'target_amount', 'deadline', 'description']
+        fields = ['name', 'target_amount', 'deadline', 'description', 'account', 'category', 'start_date']
     
     def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
-        self.fields['target_date'].widget = forms.DateInput(attrs={'type': 'date'})
+        
+        # Progress is tracked from one of the user's accounts or categories, if linked
+        if user:
+            self.fields['account'].queryset = self.fields['account'].queryset.filter(user=user)
+            self.fields['category'].queryset = self.fields['category'].queryset.filter(user=user)
+        self.fields['account'].help_text = 'Track the net amount flowing into this account'
+        self.fields['category'].help_text = 'Or track the transactions of this category'
+        self.fields['deadline'].widget = forms.DateInput(attrs={'type': 'date'})
+        self.fields['start_date'].widget = forms.DateInput(attrs={'type': 'date'})
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('account') and cleaned_data.get('category'):
+            self.add_error('category', 'Link a goal to an account or a category, not both.')
+        return cleaned_data
 class TransactionFilterForm(forms.Form):
+    q = forms.CharField(
+        required=False,
+        max_length=200,
+        label='Search',
+        widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'coffee, star*, tag:travel'})
+    )
     category = forms.ModelChoiceField(
         queryset=None,
         required=False,
@@ -72,6 +119,99 @@ class TransactionFilterForm(forms.Form):
         if user:
             self.fields['category'].queryset = Category.objects.filter(user=user)
             self.fields['account'].queryset = Account.objects.filter(user=user)
+class ReportRangeForm(forms.Form):
+    date_from = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label='From'
+    )
+    date_to = forms.DateField(
+        required=False,
+        widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}),
+        label='To'
+    )
+    granularity = forms.ChoiceField(
+        choices=[(name, name.title()) for name in GRANULARITIES],
+        required=False,
+        label='Group by',
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
+    
+    def __init__(self, *args, **kwargs):
+        # Missing values default to the last 30 days, bucketed by ``granularity``
+        self.today = kwargs.pop('today', None) or timezone.now().date()
+        self.default_granularity = kwargs.pop('granularity', 'day')
+        super().__init__(*args, **kwargs)
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        date_to = cleaned_data.get('date_to') or self.today
+        date_from = cleaned_data.get('date_from') or date_to - timedelta(days=DEFAULT_DAYS)
+        granularity = cleaned_data.get('granularity') or self.default_granularity
+        if date_from > date_to:
+            self.add_error('date_from', 'The start date must be on or before the end date.')
+        elif bucket_count(date_from, date_to, granularity) > MAX_BUCKETS:
+            self.add_error('granularity', f'More than {MAX_BUCKETS} buckets; choose a coarser granularity.')
+        cleaned_data.update(date_from=date_from, date_to=date_to, granularity=granularity)
+        return cleaned_data
+class TransactionImportForm(forms.Form):
+    file = forms.FileField(label='Statement file')
+    account = forms.ModelChoiceField(
+        queryset=None,
+        required=False,
+        label='Account',
+        help_text='Used for rows that do not name an account'
+    )
+    file_format = forms.ChoiceField(
+        choices=[('', 'Detect from file name'), ('csv', 'CSV'), ('ofx', 'OFX / QFX'), ('json', 'JSON')],
+        required=False,
+        label='Format'
+    )
+    reject_unknown_categories = forms.BooleanField(
+        required=False,
+        label='Reject rows with unknown categories',
+        help_text='By default missing categories are created'
+    )
+    
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['account'].queryset = Account.objects.filter(user=user)
+class BulkOperationForm(forms.Form):
+    operation = forms.ChoiceField(choices=[(name, name.replace('_', ' ').title()) for name in OPERATIONS])
+    ids = forms.JSONField(required=False, help_text='Transaction ids; the filter is used when omitted')
+    category = forms.ModelChoiceField(queryset=None, required=False, help_text='Empty clears the category')
+    tags = forms.JSONField(required=False, help_text='Tag names replacing the current ones')
+    status = forms.ChoiceField(choices=Transaction.STATUS_CHOICES, required=False)
+    
+    def __init__(self, *args, **kwargs):
+        user = kwargs.pop('user', None)
+        super().__init__(*args, **kwargs)
+        if user:
+            self.fields['category'].queryset = Category.objects.filter(user=user)
+    
+    def clean_ids(self):
+        ids = self.cleaned_data['ids']
+        if ids in (None, ''):
+            return None
+        if not isinstance(ids, list) or not all(isinstance(pk, int) and not isinstance(pk, bool) for pk in ids):
+            raise forms.ValidationError('Enter a list of transaction ids.')
+        if len(ids) > MAX_IDS:
+            raise forms.ValidationError(f'At most {MAX_IDS} ids; use a filter for larger selections.')
+        return ids
+    
+    def clean_tags(self):
+        value = self.cleaned_data['tags']
+        if value is not None and not isinstance(value, (list, str)):
+            raise forms.ValidationError('Enter a list of tag names.')
+        return value
+    
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get('operation') == 'set_status' and not cleaned_data.get('status'):
+            self.add_error('status', 'Choose the new status.')
+        return cleaned_data
 class BaseUserForm(forms.ModelForm):
     """A base form class to filter user-specific data"""
     
@@ -87,17 +227,23 @@ class BaseUserForm(forms.ModelForm):
 class RecurringTransactionForm(forms.ModelForm):
     class Meta:
         model = RecurringTransaction
-        fields = ['account', 'category', 'amount', 'description', 'frequency', 'start_date', 'end_date', 'status']
+        fields = ['account', 'transfer_account', 'category', 'transaction_type', 'amount', 'description', 'frequency', 'start_date', 'end_date', 'status']
     
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
         if user:
             self.fields['account'].queryset = Account.objects.filter(user=user)
+            self.fields['transfer_account'].queryset = Account.objects.filter(user=user)
             self.fields['category'].queryset = Category.objects.filter(user=user)
         
         self.fields['start_date'].widget = forms.DateInput(attrs={'type': 'date'})
         self.fields['end_date'].widget = forms.DateInput(attrs={'type': 'date'})
+        self.fields['transfer_account'].label = 'Transfer to'
+
+    def clean(self):
+        return clean_transfer(self, super().clean())
+
 class CategoryForm(forms.ModelForm):
     class Meta:
         model = Category
@@ -108,13 +254,22 @@ class CategoryForm(forms.ModelForm):
         super().__init__(*args, **kwargs)
         if user:
             self.fields['parent'].queryset = Category.objects.filter(user=user, is_archived=False)
+    
+    def clean_parent(self):
+        parent = self.cleaned_data.get('parent')
+        try:
+            check_move(self.instance, parent)
+        except TreeError as exc:
+            raise forms.ValidationError(str(exc))
+        return parent
 from django import forms
 from .models import Account, User
 
 class AccountForm(forms.ModelForm):
     class Meta:
         model = Account
-        fields = ['name', 'account_type', 'balance', 'currency', 'is_default', 'icon', 'color']
+        # Never the balance: the ledger moves it with increments a form would overwrite
+        fields = ['name', 'account_type', 'opening_balance', 'currency', 'is_default', 'icon', 'color']
         widgets = {
             'color': forms.TextInput(attrs={'type': 'color'}),
         }
@@ -122,9 +277,11 @@ class AccountForm(forms.ModelForm):
     def __init__(self, *args, **kwargs):
         user = kwargs.pop('user', None)
         super().__init__(*args, **kwargs)
+        self.stored_opening_balance = self.instance.opening_balance
         
         # Add any custom field attributes or validation
-        self.fields['balance'].widget.attrs['step'] = '0.01'
+        self.fields['opening_balance'].widget.attrs['step'] = '0.01'
+        self.fields['opening_balance'].help_text = 'Balance before the first recorded transaction'
         self.fields['is_default'].help_text = 'Make this your default account'
         
         # Optional: Add Bootstrap classes or other styling
@@ -132,6 +289,22 @@ class AccountForm(forms.ModelForm):
             self.fields[field].widget.attrs['class'] = 'form-control'
         self.fields['is_default'].widget.attrs['class'] = 'form-check-input'
 
+    def save(self, commit=True):
+        """
+        Save an edited account without its balance; a changed opening balance
+        shifts the balance by the same amount, as a ledger increment
+        """
+        if self.instance._state.adding or not commit:
+            return super().save(commit)
+        account = super().save(commit=False)
+        adjustment = account.opening_balance - self.stored_opening_balance
+        with db_transaction.atomic():
+            account.save(update_fields=self._meta.fields + ['updated_at'])
+            if adjustment:
+                ledger.apply_deltas({account.pk: adjustment})
+        account.refresh_from_db(fields=['balance'])
+        return account
+
 class UserProfileForm(forms.ModelForm):
     class Meta:
         model = User
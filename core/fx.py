@@ -0,0 +1,123 @@
+# core/fx.py
+"""
+Currency conversion.
+
+Rates live in the local ``ExchangeRate`` table, quoted against
+settings.CORE_FX_BASE and loaded from a file by the load_fx_rates command.
+Lookups of "the rate of a currency on a day" are memoized per process and
+keyed by a rate table version, so loading new rates invalidates them
+everywhere.
+
+Reports group their aggregates by account currency as well and ``fold``
+the handful of per-currency sums into the user's currency, so nothing is
+converted row by row.
+"""
+import logging
+from decimal import Decimal
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import transaction as db_transaction
+from django.utils import timezone
+
+from .cache import get_cache
+from .models import ExchangeRate
+
+logger = logging.getLogger(__name__)
+
+RATES_VERSION_KEY = 'core:fx:version'
+CENT = Decimal('0.01')
+PRECISION = Decimal('1e-10')
+
+
+class MissingRate(LookupError):
+    """No exchange rate is known for a currency"""
+
+
+def base_currency():
+    return getattr(settings, 'CORE_FX_BASE', 'USD')
+
+
+def user_currency(user):
+    """Currency reports are shown in for ``user``"""
+    return getattr(user, 'currency', None) or getattr(settings, 'CORE_DEFAULT_CURRENCY', base_currency())
+
+
+def rates_version():
+    return get_cache().get(RATES_VERSION_KEY, 0)
+
+
+def rates_changed():
+    """Invalidate memoized rates in every process once the current transaction commits"""
+    def bump():
+        try:
+            get_cache().incr(RATES_VERSION_KEY)
+        except ValueError:
+            get_cache().set(RATES_VERSION_KEY, 1, timeout=None)
+    db_transaction.on_commit(bump)
+
+
+@lru_cache(maxsize=8192)
+def _base_rate(currency, day, version):
+    if currency == base_currency():
+        return Decimal('1')
+    rates = ExchangeRate.objects.filter(currency=currency).values_list('rate', flat=True)
+    # The latest rate on or before the day; before the first known rate, the first one
+    rate = rates.filter(date__lte=day).order_by('-date').first()
+    if rate is None:
+        rate = rates.filter(date__gt=day).order_by('date').first()
+    if rate is None:
+        raise MissingRate(f'No exchange rate for {currency}')
+    return rate
+
+
+def rate(source, target, day=None, version=None):
+    """Factor converting an amount in ``source`` into ``target`` on ``day``"""
+    if source == target:
+        return Decimal('1')
+    day = day or timezone.now().date()
+    version = rates_version() if version is None else version
+    return (_base_rate(target, day, version) / _base_rate(source, day, version)).quantize(PRECISION)
+
+
+def report_rate(source, target, day=None, version=None):
+    """rate() for display: without a known rate amounts are left unconverted"""
+    try:
+        return rate(source, target, day, version)
+    except MissingRate as exc:
+        logger.warning('%s; leaving amounts unconverted', exc)
+        return Decimal('1')
+
+
+def convert(amount, source, target, day=None):
+    return (amount * report_rate(source, target, day)).quantize(CENT)
+
+
+def fold(rows, keys, fields, target, day=None, currency='account__currency', date_key=None, counts=()):
+    """
+    Merge aggregate rows that differ only in ``currency`` into one row per
+    ``keys``, with ``fields`` converted into ``target`` and ``counts``
+    simply added up. Rates are taken on ``row[date_key]`` when given, else
+    on ``day`` (default today). Keeps the order in which keys first appear.
+    """
+    day = day or timezone.now().date()
+    version = rates_version()
+    merged = {}
+    for row in rows:
+        key = tuple(row[name] for name in keys)
+        folded = merged.get(key)
+        if folded is None:
+            folded = merged[key] = {name: row[name] for name in keys}
+            folded.update((field, None) for field in fields)
+            folded.update((field, 0) for field in counts)
+        factor = report_rate(row[currency], target, row[date_key] if date_key else day, version)
+        for field in fields:
+            if row[field] is not None:
+                folded[field] = (folded[field] or 0) + row[field] * factor
+        for field in counts:
+            folded[field] += row[field] or 0
+    for folded in merged.values():
+        for field in fields:
+            if folded[field] is not None:
+                folded[field] = Decimal(folded[field]).quantize(CENT)
+    return list(merged.values())
@@ -0,0 +1,181 @@
+# core/goals.py
+"""
+Goal progress tracking.
+
+A goal linked to an account tracks the net amount flowing into that
+account; one linked to a category tracks the amount of that category's
+transactions, subcategories included. Both count from the goal's start
+date. Every transaction write adds its contribution to ``current_amount``
+with a database-side increment, like the ledger does for balances, so
+reading progress never scans transactions. ``recompute`` rebuilds the
+amounts from the history.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, Concat
+
+from . import cache, ledger
+from .categories import STEP, path_id
+from .models import Category, Goal, Transaction
+
+# Fields of a transaction that determine its contribution to goals
+GOAL_FIELDS = ('user_id', 'date', 'category_id') + ledger.LEDGER_FIELDS
+
+MAX_ETA_DAYS = 100 * 365
+
+ZERO = Value(Decimal('0'), output_field=DecimalField(max_digits=15, decimal_places=2))
+
+
+def state(transaction):
+    return {field: getattr(transaction, field) for field in GOAL_FIELDS}
+
+
+def linked_goals():
+    return Goal.objects.filter(Q(account__isnull=False) | Q(category__isnull=False))
+
+
+def _ancestors(path):
+    """Ids of a category and of all its ancestors, from its path"""
+    return {path_id(path[:end]) for end in range(STEP, len(path) + 1, STEP)}
+
+
+def apply(changes, chunk_size=500):
+    """
+    Add the contributions of ``(state, sign)`` pairs (sign 1 for a new
+    state, -1 for one that went away) to the goals they count towards
+    """
+    changes = [(state, sign) for state, sign in changes if state and state['status'] != 'CANCELLED']
+    if not changes:
+        return
+    goals = list(linked_goals().filter(user__in={state['user_id'] for state, sign in changes}).values(
+        'pk', 'account_id', 'category_id', 'start_date'
+    ))
+    if not goals:
+        return
+
+    paths = {}
+    if any(goal['category_id'] for goal in goals):
+        paths = dict(Category.objects.filter(
+            pk__in={state['category_id'] for state, sign in changes if state['category_id']}
+        ).values_list('id', 'path'))
+    by_account = defaultdict(list)
+    by_category = defaultdict(list)
+    for goal in goals:
+        if goal['account_id']:
+            by_account[goal['account_id']].append(goal)
+        else:
+            by_category[goal['category_id']].append(goal)
+
+    deltas = defaultdict(Decimal)
+    for state, sign in changes:
+        for account_id, delta in ledger.effects(state).items():
+            for goal in by_account.get(account_id, ()):
+                if state['date'] >= goal['start_date']:
+                    deltas[goal['pk']] += sign * delta
+        for category_id in _ancestors(paths.get(state['category_id'], '')):
+            for goal in by_category.get(category_id, ()):
+                if state['date'] >= goal['start_date']:
+                    deltas[goal['pk']] += sign * Decimal(str(state['amount']))
+
+    goal_ids = sorted(pk for pk, delta in deltas.items() if delta)
+    for start in range(0, len(goal_ids), chunk_size):
+        chunk = goal_ids[start:start + chunk_size]
+        Goal.objects.filter(pk__in=chunk).update(current_amount=F('current_amount') + Case(
+            *(When(pk=pk, then=Value(deltas[pk])) for pk in chunk),
+            output_field=DecimalField(max_digits=15, decimal_places=2),
+        ))
+
+
+def transition(previous, current):
+    """Apply the change of moving a transaction from ``previous`` to ``current``"""
+    apply([(previous, -1), (current, 1)])
+
+
+def record(transactions):
+    """Count newly created transactions, e.g. after ``bulk_create``"""
+    apply((state(transaction), 1) for transaction in transactions)
+
+
+def _total(queryset, expression):
+    return Coalesce(Subquery(
+        queryset.exclude(status='CANCELLED').order_by().values('user').annotate(total=expression).values('total')
+    ), ZERO)
+
+
+def recompute(goals=None, user=None, batch_size=1000):
+    """Rebuild ``current_amount`` of linked goals from the history; returns the number of goals"""
+    if goals is None:
+        goals = linked_goals()
+        if user is not None:
+            goals = goals.filter(user=user)
+    since = Q(date__gte=OuterRef('start_date'))
+    account = Transaction.objects.filter(since, account=OuterRef('account'))
+    received = Transaction.objects.filter(since, transfer_account=OuterRef('account'), transaction_type='TRANSFER')
+    subtree = Transaction.objects.filter(
+        since,
+        user=OuterRef('user'),
+        category__path__gte=OuterRef('category__path'),
+        category__path__lt=Concat(OuterRef('category__path'), Value('~')),
+    )
+    goals = goals.annotate(
+        account_progress=_total(account, Sum(Case(
+            When(transaction_type='INCOME', then=F('amount')),
+            default=-F('amount'),
+        ))) + _total(received, Sum('amount')),
+        category_progress=_total(subtree, Sum('amount')),
+    )
+
+    count = 0
+    batch = []
+    user_ids = set()
+    for goal in goals.iterator(chunk_size=batch_size):
+        goal.current_amount = goal.account_progress if goal.account_id else goal.category_progress
+        batch.append(goal)
+        user_ids.add(goal.user_id)
+        if len(batch) >= batch_size:
+            Goal.objects.bulk_update(batch, ['current_amount'])
+            count += len(batch)
+            batch = []
+    Goal.objects.bulk_update(batch, ['current_amount'])
+    cache.bump(*user_ids)
+    return count + len(batch)
+
+
+def recompute_ancestors(*paths):
+    """Rebuild the goals of the categories along ``paths``, whose subtrees gained or lost transactions"""
+    category_ids = set().union(*(_ancestors(path) for path in paths if path))
+    if not category_ids:
+        return 0
+    return recompute(Goal.objects.filter(category__in=category_ids))
+
+
+def progress(goal, today):
+    """
+    Progress of a goal and, at the pace since its start date, the day it
+    will be reached and whether that is before its deadline
+    """
+    target = goal.target_amount
+    current = goal.current_amount
+    remaining = max(target - current, Decimal('0'))
+    elapsed = max((today - goal.start_date).days, 1)
+    daily = current / elapsed if current > 0 else Decimal('0')
+
+    eta = None
+    if not remaining:
+        eta = today
+    elif daily > 0 and remaining / daily < MAX_ETA_DAYS:
+        eta = today + timedelta(days=int(remaining / daily) + 1)
+    required_monthly = None
+    if goal.deadline and goal.deadline > today and remaining:
+        required_monthly = (remaining / Decimal((goal.deadline - today).days) * 30).quantize(Decimal('0.01'))
+    return {
+        'goal': goal,
+        'percentage': min(current / target * 100, Decimal('100')).quantize(Decimal('0.01')) if target else Decimal('100'),
+        'remaining': remaining,
+        'eta': eta,
+        'on_track': eta is not None and (goal.deadline is None or eta <= goal.deadline),
+        'required_monthly': required_monthly,
+    }
@@ -0,0 +1,318 @@
+# core/importers.py
+"""
+Bulk transaction import from CSV, OFX and JSON statements.
+
+Files are parsed one record at a time, inserted with ``bulk_create`` in
+batches, and the derived data (account balances, daily rollups) is brought
+up to date once at the end instead of per row.
+"""
+import csv
+import hashlib
+import json
+import re
+import time
+from collections import Counter, defaultdict
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from functools import lru_cache
+
+from django.db import transaction as db_transaction
+
+from . import cache, goals, ledger, rollups, search, tags
+from .models import Account, Category, Transaction
+
+IMPORT_BATCH_SIZE = 2000
+MAX_REPORTED_ERRORS = 50
+
+FORMATS = ('csv', 'ofx', 'json')
+EXTENSIONS = {
+    '.csv': 'csv',
+    '.ofx': 'ofx',
+    '.qfx': 'ofx',
+    '.json': 'json',
+    '.jsonl': 'json',
+}
+
+
+class StatementError(ValueError):
+    """A statement record that cannot be turned into a transaction"""
+
+
+def detect_format(filename):
+    """Guess the statement format from a file name"""
+    for extension, file_format in EXTENSIONS.items():
+        if filename.lower().endswith(extension):
+            return file_format
+    raise StatementError(f'Cannot tell the format of {filename!r}; choose one of {", ".join(FORMATS)}')
+
+
+# Parsers: each yields plain dicts with (some of) the keys date, amount,
+# transaction_type, description, category, account, tags and external_id.
+
+def parse_csv(stream):
+    reader = csv.DictReader(stream)
+    for row in reader:
+        yield {key.strip().lower(): (value or '').strip() for key, value in row.items() if key}
+
+
+def parse_json(stream, chunk_size=64 * 1024):
+    """Parse JSON Lines, or a top-level array of objects, without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = ''
+    in_array = False
+    for chunk in iter(lambda: stream.read(chunk_size), ''):
+        buffer += chunk
+        while True:
+            buffer = buffer.lstrip()
+            if not in_array and buffer.startswith('['):
+                in_array = True
+                buffer = buffer[1:]
+                continue
+            if in_array and buffer[:1] in (',', ']'):
+                buffer = buffer[1:]
+                continue
+            if not buffer:
+                break
+            try:
+                record, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break  # Incomplete record, wait for more data
+            buffer = buffer[end:]
+            yield record
+    if buffer.strip():
+        raise StatementError('Truncated JSON document')
+
+
+OFX_TAG = re.compile(r'<(/?)([A-Z0-9.]+)>([^<\r\n]*)')
+OFX_FIELDS = {
+    'DTPOSTED': 'date',
+    'TRNAMT': 'amount',
+    'FITID': 'external_id',
+    'NAME': 'description',
+    'MEMO': 'memo',
+}
+
+
+def parse_ofx(stream):
+    """Parse STMTTRN blocks from OFX 1.x (SGML) or 2.x (XML) statements"""
+    record = None
+    for line in stream:
+        for closing, tag, value in OFX_TAG.findall(line):
+            if tag == 'STMTTRN':
+                if closing:
+                    if record is not None:
+                        if not record.get('description'):
+                            record['description'] = record.get('memo', '')
+                        yield record
+                    record = None
+                else:
+                    record = {}
+            elif record is not None and not closing and tag in OFX_FIELDS:
+                record[OFX_FIELDS[tag]] = value.strip()
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ofx': parse_ofx,
+    'json': parse_json,
+}
+
+
+@lru_cache(maxsize=65536)
+def _parse_date_text(text):
+    # Statements repeat the same few dates over and over
+    try:
+        if len(text) >= 8 and text[:8].isdigit():
+            return datetime.strptime(text[:8], '%Y%m%d').date()
+        return date.fromisoformat(text[:10])
+    except ValueError:
+        raise StatementError(f'Invalid date {text!r}')
+
+
+def parse_date(value):
+    """Parse ISO (2024-01-31) or OFX (20240131[hhmmss...]) dates"""
+    if isinstance(value, date):
+        return value
+    return _parse_date_text(str(value).strip())
+
+
+def parse_amount(value):
+    try:
+        amount = Decimal(str(value).replace(',', '').strip())
+    except InvalidOperation:
+        raise StatementError(f'Invalid amount {value!r}')
+    if not amount.is_finite():
+        raise StatementError(f'Invalid amount {value!r}')
+    return amount
+
+
+def record_text(record, *keys):
+    """The first non-empty field among ``keys`` as stripped text; JSON values may be of any type"""
+    for key in keys:
+        value = record.get(key)
+        if value is None or value == '':
+            continue
+        if isinstance(value, (dict, list)):
+            raise StatementError(f'Invalid {key} {value!r}')
+        return str(value).strip()
+    return ''
+
+
+class TransactionImporter:
+    """Map parsed records onto a user's accounts and categories and bulk insert them"""
+
+    def __init__(self, user, account=None, create_categories=True, batch_size=IMPORT_BATCH_SIZE):
+        self.user = user
+        self.default_account = account
+        self.create_categories = create_categories
+        self.batch_size = batch_size
+
+        self.accounts = {
+            name.lower(): pk
+            for pk, name in Account.objects.filter(user=user).values_list('id', 'name')
+        }
+        self.categories = {
+            name.lower(): pk
+            for pk, name in Category.objects.filter(user=user).values_list('id', 'name')
+        }
+        self.seen = Counter()
+        self.result = {
+            'created': 0,
+            'duplicates': 0,
+            'failed': 0,
+            'errors': [],
+            'seconds': 0.0,
+        }
+
+    def run(self, records):
+        """Import an iterable of parsed records; returns the result summary"""
+        started = time.monotonic()
+        deltas = defaultdict(Decimal)
+        first_day = last_day = None
+
+        with db_transaction.atomic():
+            batch = []
+            for number, record in enumerate(records, start=1):
+                try:
+                    batch.append(self.build(record))
+                except StatementError as exc:
+                    self.fail(number, exc)
+                    continue
+                if len(batch) >= self.batch_size:
+                    first_day, last_day = self.flush(batch, deltas, first_day, last_day)
+                    batch = []
+            if batch:
+                first_day, last_day = self.flush(batch, deltas, first_day, last_day)
+
+            # Derived data is updated once for the whole file
+            ledger.apply_deltas(deltas)
+            if first_day is not None:
+                rollups.rebuild(user=self.user, date_from=first_day, date_to=last_day)
+            cache.bump(self.user.pk)
+
+        self.result['seconds'] = round(time.monotonic() - started, 3)
+        return self.result
+
+    def fail(self, number, exc):
+        self.result['failed'] += 1
+        if len(self.result['errors']) < MAX_REPORTED_ERRORS:
+            self.result['errors'].append(f'Record {number}: {exc}')
+
+    def account_id(self, record):
+        name = record_text(record, 'account')
+        if name:
+            try:
+                return self.accounts[name.lower()]
+            except KeyError:
+                raise StatementError(f'Unknown account {name!r}')
+        if self.default_account is None:
+            raise StatementError('No account given')
+        return self.default_account.pk
+
+    def category_id(self, record):
+        name = record_text(record, 'category')
+        if not name:
+            return None
+        key = name.lower()
+        if key not in self.categories:
+            if not self.create_categories:
+                raise StatementError(f'Unknown category {name!r}')
+            self.categories[key] = Category.objects.create(user=self.user, name=name).pk
+        return self.categories[key]
+
+    def build(self, record):
+        if not isinstance(record, dict):
+            raise StatementError('Expected an object')
+        amount = parse_amount(record.get('amount', ''))
+        transaction_type = record_text(record, 'transaction_type', 'type').upper()
+        if not transaction_type:
+            # Signed statement amounts: money out is negative
+            transaction_type = 'EXPENSE' if amount < 0 else 'INCOME'
+        if transaction_type not in ('EXPENSE', 'INCOME', 'TRANSFER'):
+            raise StatementError(f'Invalid transaction type {transaction_type!r}')
+
+        tag_value = record.get('tags')
+        if not isinstance(tag_value, list):
+            tag_value = record_text(record, 'tags')
+
+        transaction = Transaction(
+            user=self.user,
+            account_id=self.account_id(record),
+            category_id=self.category_id(record),
+            amount=abs(amount),
+            transaction_type=transaction_type,
+            description=record_text(record, 'description')[:200],
+            date=parse_date(record.get('date', '')),
+            tags=tags.tag_names(tag_value) or None,
+        )
+        transaction.import_id = self.import_id(transaction, record.get('external_id'))
+        return transaction
+
+    def import_id(self, transaction, external_id):
+        """Stable identity used to skip rows that were already imported"""
+        if external_id:
+            return str(external_id)[:64]
+        key = (transaction.account_id, transaction.date, transaction.amount,
+               transaction.transaction_type, transaction.description)
+        # Identical rows within one file are distinct transactions
+        self.seen[key] += 1
+        return hashlib.sha1(repr(key + (self.seen[key],)).encode()).hexdigest()
+
+    def flush(self, batch, deltas, first_day, last_day):
+        existing = set(Transaction.objects.filter(
+            account_id__in={transaction.account_id for transaction in batch},
+            import_id__in=[transaction.import_id for transaction in batch],
+        ).values_list('account_id', 'import_id'))
+
+        new = []
+        for transaction in batch:
+            key = (transaction.account_id, transaction.import_id)
+            if key in existing:
+                self.result['duplicates'] += 1
+                continue
+            existing.add(key)
+            new.append(transaction)
+            for account_id, delta in ledger.effects({
+                'account_id': transaction.account_id,
+                'transfer_account_id': None,
+                'transaction_type': transaction.transaction_type,
+                'amount': transaction.amount,
+                'status': transaction.status,
+            }).items():
+                deltas[account_id] += delta
+            first_day = min(first_day, transaction.date) if first_day else transaction.date
+            last_day = max(last_day, transaction.date) if last_day else transaction.date
+
+        Transaction.objects.bulk_create(new, batch_size=self.batch_size)
+        search.index_transactions(new, batch_size=self.batch_size)
+        tags.sync(new, created=True, batch_size=self.batch_size)
+        goals.record(new)
+        self.result['created'] += len(new)
+        return first_day, last_day
+
+
+def import_file(user, stream, file_format, **options):
+    """Parse a text stream in the given format and import it for ``user``"""
+    if file_format not in PARSERS:
+        raise StatementError(f'Unsupported format {file_format!r}')
+    return TransactionImporter(user, **options).run(PARSERS[file_format](stream))
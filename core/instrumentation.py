@@ -0,0 +1,248 @@
+# core/instrumentation.py
+"""
+Per-view request instrumentation.
+
+``InstrumentationMiddleware`` wraps every request's database calls with an
+execute wrapper and records the number of queries, database time, total
+time and response size. Statements that run many times with the same
+shape (same SQL once literals and IN lists are collapsed) are flagged as
+likely N+1 loops. Each request is logged as a structured record on the
+``core.instrumentation`` logger, and per-view histograms are kept in
+process for the staff-only stats endpoint.
+
+The request's recorder is held in a ContextVar, which asgiref copies into
+the worker threads of ``sync_to_async`` (and so of ``charts.fan_out``).
+Every connection carries one permanent execute wrapper that hands its
+queries to the recorder of the current context, so queries an async view
+runs on other threads and connections count towards that request too.
+"""
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds, in milliseconds, of the latency histogram buckets
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+DEFAULT_N_PLUS_ONE_THRESHOLD = 10
+
+_IN_LIST = re.compile(r'\bIN \([^()]*\)', re.IGNORECASE)
+_LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+
+_views = {}
+_views_lock = threading.Lock()
+
+# Recorder of the request being handled, if any
+_recorder = ContextVar('core_instrumentation_recorder', default=None)
+
+
+def shape(sql):
+    """SQL with literals and IN lists collapsed, so repeats of a statement compare equal"""
+    return _IN_LIST.sub('IN (...)', _LITERALS.sub('?', sql))
+
+
+def _threshold():
+    return getattr(settings, 'CORE_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+
+
+class QueryRecorder:
+    """Database execute wrapper counting queries, their time and their shapes, from any thread"""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+        self.lock = threading.Lock()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self.lock:
+                self.seconds += elapsed
+                self.count += 1
+                self.shapes[shape(sql)] += 1
+
+    def repeated(self, threshold=None):
+        """``[(shape, times)]`` of statements run at least ``threshold`` times"""
+        threshold = threshold or _threshold()
+        return [(sql, times) for sql, times in self.shapes.most_common() if times >= threshold]
+
+
+def _dispatch(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def _install(connection):
+    if _dispatch not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_dispatch)
+
+
+@receiver(connection_created)
+def install_dispatch(sender, connection, **kwargs):
+    """Give every new connection, on any thread, the recording wrapper"""
+    _install(connection)
+
+
+@contextmanager
+def recording(recorder):
+    """Attribute the queries of this context, worker threads started from it included, to ``recorder``"""
+    # Connections of this thread may predate the receiver
+    for alias in connections:
+        _install(connections[alias])
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
+
+
+def _new_stats():
+    return {
+        'requests': 0,
+        'errors': 0,
+        'queries': 0,
+        'max_queries': 0,
+        'db_ms': 0.0,
+        'total_ms': 0.0,
+        'max_ms': 0.0,
+        'bytes': 0,
+        'n_plus_one': 0,
+        'latency': [0] * (len(LATENCY_BUCKETS) + 1),
+    }
+
+
+def observe(record):
+    """Add one request record to the per-view aggregates"""
+    bucket = next(
+        (index for index, bound in enumerate(LATENCY_BUCKETS) if record['total_ms'] <= bound),
+        len(LATENCY_BUCKETS)
+    )
+    with _views_lock:
+        stats = _views.setdefault(record['view'], _new_stats())
+        stats['requests'] += 1
+        stats['errors'] += record['status'] >= 500
+        stats['queries'] += record['queries']
+        stats['max_queries'] = max(stats['max_queries'], record['queries'])
+        stats['db_ms'] += record['db_ms']
+        stats['total_ms'] += record['total_ms']
+        stats['max_ms'] = max(stats['max_ms'], record['total_ms'])
+        stats['bytes'] += record['bytes'] or 0
+        stats['n_plus_one'] += bool(record['repeated'])
+        stats['latency'][bucket] += 1
+
+
+def stats():
+    """Per-view aggregates of this process, with averages and histogram labels"""
+    with _views_lock:
+        views = {name: dict(values, latency=list(values['latency'])) for name, values in _views.items()}
+    labels = [f'<={bound}ms' for bound in LATENCY_BUCKETS] + [f'>{LATENCY_BUCKETS[-1]}ms']
+    for values in views.values():
+        requests = values['requests']
+        values['avg_queries'] = round(values['queries'] / requests, 2)
+        values['avg_db_ms'] = round(values['db_ms'] / requests, 2)
+        values['avg_ms'] = round(values['total_ms'] / requests, 2)
+        values['db_ms'] = round(values['db_ms'], 2)
+        values['total_ms'] = round(values['total_ms'], 2)
+        values['latency'] = dict(zip(labels, values['latency']))
+    return views
+
+
+def reset_stats():
+    with _views_lock:
+        _views.clear()
+
+
+class InstrumentationMiddleware:
+    """Record queries, timings and response sizes of every request, sync or async"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not getattr(settings, 'CORE_INSTRUMENTATION', True):
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        return self._respond(request, response, recorder, started)
+
+    async def __acall__(self, request):
+        if not getattr(settings, 'CORE_INSTRUMENTATION', True):
+            return await self.get_response(request)
+
+        recorder = QueryRecorder()
+        started = time.perf_counter()
+        with recording(recorder):
+            response = await self.get_response(request)
+        return self._respond(request, response, recorder, started)
+
+    def _respond(self, request, response, recorder, started):
+        if response.streaming:
+            # Streamed bodies run their queries while being sent; finish the record then
+            response.streaming_content = self._stream(response.streaming_content, request, response, recorder, started)
+        else:
+            self._finish(request, response, recorder, started, len(response.content))
+            response['Server-Timing'] = (
+                f'db;dur={recorder.seconds * 1000:.1f}, total;dur={(time.perf_counter() - started) * 1000:.1f}'
+            )
+        return response
+
+    def _stream(self, chunks, request, response, recorder, started):
+        size = 0
+        try:
+            with recording(recorder):
+                for chunk in chunks:
+                    size += len(chunk)
+                    yield chunk
+        finally:
+            self._finish(request, response, recorder, started, size)
+
+    def _finish(self, request, response, recorder, started, size):
+        match = getattr(request, 'resolver_match', None)
+        repeated = recorder.repeated()
+        record = {
+            'view': match.view_name if match else 'unresolved',
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': recorder.count,
+            'db_ms': round(recorder.seconds * 1000, 2),
+            'total_ms': round((time.perf_counter() - started) * 1000, 2),
+            'bytes': size,
+            'repeated': [{'sql': sql, 'times': times} for sql, times in repeated],
+        }
+        observe(record)
+        logger.info(
+            '%(method)s %(path)s %(status)s view=%(view)s queries=%(queries)d db_ms=%(db_ms).2f '
+            'total_ms=%(total_ms).2f bytes=%(bytes)d', record, extra={'instrumentation': record}
+        )
+        for sql, times in repeated:
+            logger.warning(
+                'Possible N+1 in %s: %d queries shaped like %s', record['view'], times, sql[:500],
+                extra={'instrumentation': record}
+            )
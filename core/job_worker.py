@@ -0,0 +1,21 @@
+# core/job_worker.py
+"""
+Entry points of the worker processes ``jobs.work`` spawns. Spawned
+processes import this module before Django is set up, so it must not
+import models at module level.
+"""
+
+
+def setup():
+    import django
+    django.setup()
+
+
+def run(job_id):
+    from django.db import connections
+
+    from . import jobs
+    try:
+        return jobs.run(job_id)
+    finally:
+        connections.close_all()
@@ -0,0 +1,216 @@
+# core/jobs.py
+"""
+Background export jobs.
+
+Export views called with ``background=1`` queue a ``Job`` holding their
+query string instead of streaming the file. The ``run_jobs`` worker claims
+pending jobs and runs them in a process pool, writing each result under
+MEDIA_ROOT; clients poll the job and download the file once it is done.
+Jobs left running by a worker that died are failed after CORE_JOB_TIMEOUT.
+
+Jobs are claimed with a conditional UPDATE rather than row locks (which
+SQLite lacks), so several workers can share the queue.
+"""
+import logging
+import multiprocessing
+import tempfile
+import time
+from datetime import timedelta
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from itertools import chain
+
+from django.conf import settings
+from django.core.files import File
+from django.db import close_old_connections
+from django.utils import timezone
+
+from . import columnar, job_worker
+from .exports import TRANSACTION_HEADER, csv_rows, filter_transactions, gzip_chunks, report_rows, transaction_batches
+from .forms import ReportRangeForm, TransactionFilterForm
+from .models import Job, Transaction
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_WORKERS = 2
+DEFAULT_TIMEOUT = 60 * 60
+POLL_INTERVAL = 2
+# Rows written between two progress updates
+PROGRESS_EVERY = 5000
+
+
+def worker_count():
+    return getattr(settings, 'CORE_JOB_WORKERS', DEFAULT_WORKERS)
+
+
+def timeout():
+    """Seconds a job may run before it is taken for abandoned"""
+    return getattr(settings, 'CORE_JOB_TIMEOUT', DEFAULT_TIMEOUT)
+
+
+def enqueue(user, kind, params):
+    return Job.objects.create(user=user, kind=kind, params=params)
+
+
+def filename(job):
+    """Name the result is downloaded as"""
+    if job.kind == 'REPORT':
+        name = f"{job.params.get('report_type')}_report.csv"
+    elif job.params.get('format') in columnar.FORMATS:
+        return f"transactions.{columnar.FORMATS[job.params['format']][0]}"
+    else:
+        name = 'transactions.csv'
+    return name + '.gz' if job.params.get('gzip') == '1' else name
+
+
+def claim(limit):
+    """Mark up to ``limit`` pending jobs as running; returns their ids, oldest first"""
+    claimed = []
+    pending = Job.objects.filter(status='PENDING').order_by('created_at', 'pk').values_list('pk', flat=True)
+    for pk in pending[:limit]:
+        # Another worker may have claimed it since
+        if Job.objects.filter(pk=pk, status='PENDING').update(status='RUNNING', started_at=timezone.now()):
+            claimed.append(pk)
+    return claimed
+
+
+def fail_stale():
+    """
+    Fail running jobs started more than timeout() ago, which a crashed or
+    killed worker will never finish; returns how many there were
+    """
+    now = timezone.now()
+    return Job.objects.filter(status='RUNNING', started_at__lt=now - timedelta(seconds=timeout())).update(
+        status='FAILED', error='The worker stopped before the job finished', finished_at=now
+    )
+
+
+def _filters(job):
+    """Cleaned filters of a job, its params validated like the export views do"""
+    form = TransactionFilterForm(job.params, user=job.user)
+    range_form = ReportRangeForm(job.params)
+    if not form.is_valid() or (job.kind == 'REPORT' and not range_form.is_valid()):
+        raise ValueError(f'Invalid parameters: {dict(form.errors, **range_form.errors)}')
+    if job.kind == 'REPORT':
+        return {**form.cleaned_data, **range_form.cleaned_data}
+    return form.cleaned_data
+
+
+def _progress(job, items, total, size=None):
+    """
+    Pass rows (or batches of ``size(item)`` rows) through, counting them
+    into ``job.rows`` and saving the progress every PROGRESS_EVERY rows
+    """
+    saved = 0
+    for item in items:
+        job.rows += size(item) if size else 1
+        yield item
+        if job.rows - saved >= PROGRESS_EVERY:
+            saved = job.rows
+            Job.objects.filter(pk=job.pk).update(rows=job.rows, progress=min(job.rows * 100 // max(total, 1), 99))
+
+
+def _chunks(job):
+    """Encoded chunks of the job's result file"""
+    filters = _filters(job)
+    if job.kind == 'REPORT':
+        header, rows = report_rows(job.user, job.params.get('report_type'), filters)
+        rows = _progress(job, rows, len(rows))
+    else:
+        total = filter_transactions(job.user, Transaction.objects.filter(user=job.user), filters).count()
+        if job.params.get('format') in columnar.FORMATS:
+            batches = columnar.record_batches(job.user, filters, batch_size=PROGRESS_EVERY)
+            return columnar.stream(_progress(job, batches, total, size=len), job.params['format'])
+        # Batches rather than one streaming cursor: an open SQLite read cannot
+        # be upgraded to the progress writes once another worker has committed
+        header = TRANSACTION_HEADER
+        rows = _progress(job, chain.from_iterable(
+            transaction_batches(job.user, filters, batch_size=PROGRESS_EVERY)
+        ), total)
+
+    chunks = csv_rows(header, rows)
+    if job.params.get('gzip') == '1':
+        return gzip_chunks(chunks)
+    return (chunk.encode('utf-8') for chunk in chunks)
+
+
+def _fail(job_id, exc):
+    Job.objects.filter(pk=job_id).update(status='FAILED', error=str(exc), finished_at=timezone.now())
+
+
+def run(job_id):
+    """Run one claimed job to completion; returns its final status"""
+    job = Job.objects.select_related('user').get(pk=job_id)
+    try:
+        with tempfile.TemporaryFile() as output:
+            for chunk in _chunks(job):
+                output.write(chunk)
+            output.seek(0)
+            job.file.save(filename(job), File(output), save=False)
+    except Exception as exc:
+        logger.exception('Job %s failed', job.pk)
+        _fail(job.pk, exc)
+        return 'FAILED'
+
+    job.status = 'COMPLETED'
+    job.progress = 100
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'status', 'progress', 'rows', 'finished_at'])
+    return job.status
+
+
+def work(workers=None, once=False, interval=POLL_INTERVAL):
+    """
+    Worker loop: keep up to ``workers`` jobs running in a process pool (in
+    this process with 0). ``once`` returns when the queue is empty instead
+    of polling every ``interval`` seconds. Returns the number of jobs run.
+    """
+    workers = worker_count() if workers is None else workers
+    if not workers:
+        count = 0
+        while True:
+            close_old_connections()
+            fail_stale()
+            claimed = claim(1)
+            if claimed:
+                run(claimed[0])
+                count += 1
+            elif once:
+                return count
+            else:
+                time.sleep(interval)
+
+    count = 0
+    running = {}
+    # Spawned, not forked, workers: they must not share this process' connections
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=job_worker.setup
+    ) as executor:
+        while True:
+            close_old_connections()
+            fail_stale()
+            claimed = claim(workers - len(running))
+            for index, pk in enumerate(claimed):
+                try:
+                    running[executor.submit(job_worker.run, pk)] = pk
+                except BrokenProcessPool as exc:
+                    # A crashed worker took the pool down; release what this worker holds
+                    for pk in claimed[index:] + list(running.values()):
+                        _fail(pk, exc)
+                    raise
+            if not running:
+                if once:
+                    return count
+                time.sleep(interval)
+                continue
+
+            done, _ = wait(running, timeout=interval, return_when=FIRST_COMPLETED)
+            for future in done:
+                pk = running.pop(future)
+                count += 1
+                try:
+                    future.result()
+                except Exception as exc:
+                    # The worker process died before it could record the failure
+                    logger.exception('Job %s failed', pk)
+                    _fail(pk, exc)
@@ -0,0 +1,108 @@
+# core/ledger.py
+"""
+Account balance ledger.
+
+Balances are only ever changed by database-side ``F()`` increments, so
+concurrent writers never overwrite each other's updates, and a transaction
+edit applies the difference between its old and new effect exactly once.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import transaction as db_transaction
+from django.db.models import Case, DecimalField, F, Q, Sum, Value, When
+
+from . import cache
+from .models import Account, Transaction
+
+# Fields of a transaction that determine its effect on balances
+LEDGER_FIELDS = ('account_id', 'transfer_account_id', 'transaction_type', 'amount', 'status')
+
+
+def effects(state):
+    """Map each account id touched by a transaction state to its balance delta"""
+    deltas = defaultdict(Decimal)
+    if not state or state['status'] == 'CANCELLED':
+        return deltas
+
+    amount = Decimal(str(state['amount']))
+    if state['transaction_type'] == 'INCOME':
+        deltas[state['account_id']] += amount
+    elif state['transaction_type'] == 'EXPENSE':
+        deltas[state['account_id']] -= amount
+    elif state['transaction_type'] == 'TRANSFER':
+        deltas[state['account_id']] -= amount
+        if state['transfer_account_id']:
+            deltas[state['transfer_account_id']] += amount
+    return deltas
+
+
+def apply_deltas(deltas, chunk_size=500):
+    """Increment balances in the database with one UPDATE per chunk of accounts"""
+    # A stable order keeps concurrent writers from deadlocking each other
+    account_ids = sorted(account_id for account_id, delta in deltas.items() if delta)
+    with db_transaction.atomic():
+        for start in range(0, len(account_ids), chunk_size):
+            chunk = account_ids[start:start + chunk_size]
+            if len(chunk) == 1:
+                delta = Value(deltas[chunk[0]])
+            else:
+                delta = Case(
+                    *(When(pk=account_id, then=Value(deltas[account_id])) for account_id in chunk),
+                    output_field=DecimalField(max_digits=15, decimal_places=2),
+                )
+            Account.objects.filter(pk__in=chunk).update(balance=F('balance') + delta)
+
+
+def transition(previous, current):
+    """Apply the balance change of moving a transaction from ``previous`` to ``current``"""
+    deltas = effects(current)
+    for account_id, delta in effects(previous).items():
+        deltas[account_id] -= delta
+    apply_deltas(deltas)
+
+
+def net_changes(transactions):
+    """Net balance delta per account for a transaction queryset, in two grouped queries"""
+    transactions = transactions.exclude(status='CANCELLED').order_by()
+    deltas = defaultdict(Decimal)
+
+    outgoing = transactions.values('account_id').annotate(
+        income=Sum('amount', filter=Q(transaction_type='INCOME')),
+        spent=Sum('amount', filter=Q(transaction_type__in=['EXPENSE', 'TRANSFER'])),
+    )
+    for row in outgoing:
+        deltas[row['account_id']] += (row['income'] or 0) - (row['spent'] or 0)
+
+    incoming = transactions.filter(
+        transaction_type='TRANSFER',
+        transfer_account__isnull=False,
+    ).values('transfer_account_id').annotate(received=Sum('amount'))
+    for row in incoming:
+        deltas[row['transfer_account_id']] += row['received']
+
+    return deltas
+
+
+def recompute_balances(accounts=None, batch_size=1000):
+    """Rebuild balances from opening balances and the full transaction history"""
+    if accounts is None:
+        accounts = Account.objects.all()
+        transactions = Transaction.objects.all()
+    else:
+        transactions = Transaction.objects.filter(
+            Q(account__in=accounts) | Q(transfer_account__in=accounts)
+        )
+
+    with db_transaction.atomic():
+        accounts = list(accounts.select_for_update().only('id', 'user_id', 'opening_balance', 'balance'))
+        deltas = net_changes(transactions)
+        changed = []
+        for account in accounts:
+            balance = account.opening_balance + deltas.get(account.pk, 0)
+            if balance != account.balance:
+                account.balance = balance
+                changed.append(account)
+        Account.objects.bulk_update(changed, ['balance'], batch_size=batch_size)
+        cache.bump(*{account.user_id for account in changed})
+    return len(changed)
@@ -0,0 +1,57 @@
+import csv
+import os
+import random
+import tempfile
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction as db_transaction
+
+from core.importers import IMPORT_BATCH_SIZE, import_file
+from core.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Measure bulk import throughput with a synthetic statement file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=100000)
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark user and its data')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        categories = ['Groceries', 'Rent', 'Transport', 'Dining', 'Utilities', 'Salary', 'Health']
+        start = date.today() - timedelta(days=5 * 365)
+
+        fd, path = tempfile.mkstemp(suffix='.csv')
+        try:
+            with os.fdopen(fd, 'w', newline='') as stream:
+                writer = csv.writer(stream)
+                writer.writerow(['date', 'amount', 'description', 'category'])
+                for number in range(options['rows']):
+                    writer.writerow([
+                        start + timedelta(days=rng.randrange(5 * 365)),
+                        f'{rng.uniform(-500, 500):.2f}',
+                        f'Benchmark row {number}',
+                        rng.choice(categories),
+                    ])
+
+            with db_transaction.atomic():
+                user = get_user_model().objects.create_user(username=f'import-benchmark-{time.time_ns()}')
+                account = Account.objects.create(user=user, name='Benchmark', account_type='BANK')
+                with open(path, encoding='utf-8', newline='') as stream:
+                    result = import_file(user, stream, 'csv', account=account, batch_size=options['batch_size'])
+                # Throw the benchmark data away unless asked to keep it
+                db_transaction.set_rollback(not options['keep'])
+        finally:
+            os.unlink(path)
+
+        rate = result['created'] / result['seconds'] if result['seconds'] else 0
+        self.stdout.write(
+            f"{result['created']} rows in {result['seconds']}s: {rate:.0f} rows/s "
+            f"(batch size {options['batch_size']})"
+        )
@@ -0,0 +1,103 @@
+import json
+import platform
+import subprocess
+import time
+
+import django
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction as db_transaction
+from django.test import override_settings
+from django.utils import timezone
+
+from core.benchmarking import BENCHMARK_VIEWS, BenchmarkError, compare, profile_views, seed_user
+
+
+def current_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Seed a large synthetic dataset and record query counts, plans and timings per view'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transactions', type=int, default=50000)
+        parser.add_argument('--repeat', type=int, default=5, help='Requests per view; the median is kept')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--user', help='Profile this (e.g. seed_benchmark_data) user instead of seeding one')
+        parser.add_argument('--view', action='append', dest='views', help='Only profile these views (repeatable)')
+        parser.add_argument('--output', help='Write the results as JSON to this file')
+        parser.add_argument('--compare', help='Earlier JSON results to check for regressions')
+
+    def handle(self, *args, **options):
+        previous = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as stream:
+                    previous = json.load(stream)
+            except (OSError, ValueError) as exc:
+                raise CommandError(f'Cannot read {options["compare"]}: {exc}')
+
+        selected = BENCHMARK_VIEWS
+        if options['views']:
+            selected = [view for view in BENCHMARK_VIEWS if view[0] in options['views']]
+            if not selected:
+                raise CommandError(f"Unknown views: {', '.join(options['views'])}")
+
+        try:
+            if options['user']:
+                try:
+                    user = get_user_model().objects.get(username=options['user'])
+                except get_user_model().DoesNotExist:
+                    raise CommandError(f"User '{options['user']}' does not exist")
+                transactions = user.transaction_set.count()
+                views = profile_views(user, views=selected, repeat=options['repeat'])
+            else:
+                transactions = options['transactions']
+                # The replica's connection could not see the uncommitted seed data
+                with db_transaction.atomic(), override_settings(CORE_READ_REPLICA=None):
+                    started = time.perf_counter()
+                    user = seed_user(
+                        f'query-benchmark-{time.time_ns()}',
+                        transactions=transactions,
+                        seed=options['seed'],
+                    )
+                    self.stdout.write(f'Seeded {transactions} transactions in {time.perf_counter() - started:.1f}s')
+                    views = profile_views(user, views=selected, repeat=options['repeat'])
+                    # Leave the database exactly as we found it
+                    db_transaction.set_rollback(True)
+        except BenchmarkError as exc:
+            raise CommandError(f'Benchmark views failed: {exc}')
+
+        # Enough context to tell whether two result files are comparable
+        results = {
+            'commit': current_commit(),
+            'created': timezone.now().isoformat(),
+            'database': connection.vendor,
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'transactions': transactions,
+            'repeat': options['repeat'],
+            'views': views,
+        }
+        for name, result in views.items():
+            self.stdout.write(
+                f"{name:<30} {result['status']} {result['queries']:>3} queries {result['bytes']:>9} bytes "
+                f"{result['db_ms']:>9.2f}ms db {result['total_ms']:>9.2f}ms total"
+            )
+
+        if options['output']:
+            with open(options['output'], 'w') as stream:
+                json.dump(results, stream, indent=2, default=str)
+
+        if previous is not None:
+            regressions = compare(previous['views'], views)
+            for regression in regressions:
+                self.stderr.write(self.style.WARNING(regression))
+            if regressions:
+                raise CommandError(f'{len(regressions)} regressions against {options["compare"]}')
@@ -0,0 +1,59 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.importers import FORMATS, IMPORT_BATCH_SIZE, StatementError, detect_format, import_file
+from core.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Bulk import transactions from a CSV, OFX or JSON statement file'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Statement file to import')
+        parser.add_argument('--user', required=True, help='Username that owns the transactions')
+        parser.add_argument('--account', help='Account name for rows that do not name one')
+        parser.add_argument('--format', choices=FORMATS, help='File format (default: from the extension)')
+        parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE)
+        parser.add_argument(
+            '--no-create-categories',
+            action='store_true',
+            help='Reject rows whose category does not exist instead of creating it',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            user = get_user_model().objects.get(username=options['user'])
+        except get_user_model().DoesNotExist:
+            raise CommandError(f"User '{options['user']}' does not exist")
+
+        account = None
+        if options['account']:
+            try:
+                account = Account.objects.get(user=user, name=options['account'])
+            except Account.DoesNotExist:
+                raise CommandError(f"Account '{options['account']}' does not exist")
+
+        try:
+            file_format = options['format'] or detect_format(options['path'])
+            with open(options['path'], encoding='utf-8', newline='') as stream:
+                result = import_file(
+                    user,
+                    stream,
+                    file_format,
+                    account=account,
+                    create_categories=not options['no_create_categories'],
+                    batch_size=options['batch_size'],
+                )
+        except (OSError, StatementError) as exc:
+            raise CommandError(str(exc))
+        except UnicodeDecodeError as exc:
+            raise CommandError(f"{options['path']} is not UTF-8 text: {exc}")
+
+        for error in result['errors']:
+            self.stderr.write(error)
+        rate = result['created'] / result['seconds'] if result['seconds'] else 0
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {result['created']} transactions "
+            f"({result['duplicates']} duplicates skipped, {result['failed']} failed) "
+            f"in {result['seconds']}s, {rate:.0f} rows/s"
+        ))
@@ -0,0 +1,57 @@
+import csv
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+
+from core import fx
+from core.importers import StatementError, parse_amount, parse_date
+from core.models import ExchangeRate
+
+
+class Command(BaseCommand):
+    help = (
+        'Load exchange rates from a CSV (date,currency,rate) or JSON file. Rates are '
+        'units of the currency per unit of settings.CORE_FX_BASE; existing days are overwritten.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON file of rates')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        try:
+            with open(path, newline='', encoding='utf-8') as stream:
+                if path.lower().endswith('.json'):
+                    records = json.load(stream)
+                else:
+                    records = list(csv.DictReader(stream))
+        except (OSError, ValueError) as exc:
+            raise CommandError(f'Cannot read {path}: {exc}')
+
+        rates = {}
+        for number, record in enumerate(records, start=1):
+            try:
+                currency = str(record['currency']).strip().upper()
+                day = parse_date(record['date'])
+                rate = parse_amount(record['rate'])
+            except (KeyError, StatementError) as exc:
+                raise CommandError(f'Record {number}: {exc}')
+            if len(currency) != 3 or rate <= 0:
+                raise CommandError(f'Record {number}: invalid currency or rate')
+            rates[(currency, day)] = rate
+
+        with db_transaction.atomic():
+            ExchangeRate.objects.bulk_create(
+                [ExchangeRate(currency=currency, date=day, rate=rate) for (currency, day), rate in rates.items()],
+                batch_size=options['batch_size'],
+                update_conflicts=True,
+                unique_fields=['currency', 'date'],
+                update_fields=['rate'],
+            )
+            fx.rates_changed()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Loaded {len(rates)} rates for {len({currency for currency, _ in rates})} currencies'
+        ))
@@ -0,0 +1,46 @@
+import time
+from datetime import date
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core import forecast
+
+
+class Command(BaseCommand):
+    help = 'Compute and cache the cash-flow forecast of every user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only compute the forecast of this username')
+        parser.add_argument('--months', type=int, default=forecast.DEFAULT_MONTHS)
+        parser.add_argument('--date', help='Forecast as if today were this day (YYYY-MM-DD)')
+        parser.add_argument('--chunk-size', type=int, default=forecast.FORECAST_CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        if not forecast.available():
+            raise CommandError('Forecasting requires NumPy')
+
+        users = get_user_model().objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        today = timezone.now().date()
+        if options['date']:
+            try:
+                today = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date '{options['date']}'")
+
+        started = time.monotonic()
+        count = forecast.precompute(
+            users.order_by('pk').values_list('pk', flat=True).iterator(),
+            today,
+            months=forecast.forecast_months(options['months']),
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Computed {count} forecasts in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,36 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.recurring import RECURRING_BATCH_SIZE, process_due, run_forever
+
+
+class Command(BaseCommand):
+    help = 'Create the transactions of every due recurring transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Process as if today were this day (YYYY-MM-DD)')
+        parser.add_argument('--batch-size', type=int, default=RECURRING_BATCH_SIZE)
+        parser.add_argument('--loop', action='store_true', help='Keep running as a worker')
+        parser.add_argument('--interval', type=int, default=60, help='Seconds between runs with --loop')
+
+    def handle(self, *args, **options):
+        if options['loop']:
+            self.stdout.write(f"Processing recurring transactions every {options['interval']}s")
+            run_forever(interval=options['interval'], batch_size=options['batch_size'])
+            return
+
+        today = None
+        if options['date']:
+            try:
+                today = date.fromisoformat(options['date'])
+            except ValueError:
+                raise CommandError(f"Invalid date '{options['date']}'")
+
+        started = time.monotonic()
+        processed, created = process_due(today, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {processed} recurring transactions, created {created} transactions '
+            f'in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,28 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the DailySummary rollup table from the transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild rollups for this username')
+        parser.add_argument('--date-from', help='First day to rebuild (YYYY-MM-DD)')
+        parser.add_argument('--date-to', help='Last day to rebuild (YYYY-MM-DD)')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        count = rollups.rebuild(
+            user=user,
+            date_from=options['date_from'],
+            date_to=options['date_to'],
+        )
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} daily summary rows'))
@@ -0,0 +1,22 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import search
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the transaction full-text search index'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild the index for this username (token backend only)')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        count = search.rebuild(user=user)
+        self.stdout.write(self.style.SUCCESS(f'Indexed {count} transactions ({search.backend()} backend)'))
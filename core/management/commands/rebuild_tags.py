@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import tags
+
+
+class Command(BaseCommand):
+    help = 'Backfill the Tag and TransactionTag index from the tags stored on transactions'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only rebuild tags for this username')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Transactions per batch')
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        count = tags.rebuild(user=user, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Indexed tags of {count} transactions'))
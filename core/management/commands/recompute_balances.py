@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core.ledger import recompute_balances
+from core.models import Account
+
+
+class Command(BaseCommand):
+    help = 'Rebuild account balances from opening balances and the transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only recompute accounts of this username')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        accounts = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+            accounts = Account.objects.filter(user=user)
+
+        changed = recompute_balances(accounts, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Corrected {changed} account balances'))
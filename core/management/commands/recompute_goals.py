@@ -0,0 +1,23 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import goals
+
+
+class Command(BaseCommand):
+    help = 'Recompute the progress of goals linked to accounts or categories from the transaction history'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only recompute goals of this username')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = get_user_model().objects.get(username=options['user'])
+            except get_user_model().DoesNotExist:
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        count = goals.recompute(user=user, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Recomputed {count} goals'))
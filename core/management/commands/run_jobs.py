@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background export jobs in a pool of worker processes'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=jobs.worker_count(),
+                            help='Worker processes; 0 runs jobs one by one in this process')
+        parser.add_argument('--once', action='store_true', help='Exit once the queue is empty')
+        parser.add_argument('--interval', type=int, default=jobs.POLL_INTERVAL, help='Seconds between queue polls')
+
+    def handle(self, *args, **options):
+        if options['workers'] < 0:
+            raise CommandError('--workers must be 0 or more')
+
+        if not options['once']:
+            self.stdout.write(f"Running jobs with {options['workers']} workers")
+        started = time.monotonic()
+        count = jobs.work(workers=options['workers'], once=options['once'], interval=options['interval'])
+        self.stdout.write(self.style.SUCCESS(f'Ran {count} jobs in {time.monotonic() - started:.2f}s'))
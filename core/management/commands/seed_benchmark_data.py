@@ -0,0 +1,49 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction as db_transaction
+
+from core.benchmarking import seed_users
+
+
+class Command(BaseCommand):
+    help = 'Create users with a reproducible synthetic dataset for benchmarks'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1)
+        parser.add_argument('--transactions', type=int, default=10000, help='Transactions per user')
+        parser.add_argument('--accounts', type=int, default=5)
+        parser.add_argument('--budgets', type=int, default=20)
+        parser.add_argument('--recurring', type=int, default=50)
+        parser.add_argument('--goals', type=int, default=5)
+        parser.add_argument('--years', type=int, default=3, help='Years of history')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--prefix', default='benchmark', help='Users are named <prefix>-<n>')
+        parser.add_argument('--replace', action='store_true', help='Delete existing users with the prefix first')
+
+    def handle(self, *args, **options):
+        existing = get_user_model().objects.filter(username__startswith=f"{options['prefix']}-")
+        if existing.exists():
+            if not options['replace']:
+                raise CommandError(f"Users named {options['prefix']}-<n> already exist; use --replace")
+            existing.delete()
+
+        started = time.perf_counter()
+        with db_transaction.atomic():
+            users = seed_users(
+                options['prefix'],
+                users=options['users'],
+                transactions=options['transactions'],
+                accounts=options['accounts'],
+                budgets=options['budgets'],
+                recurring=options['recurring'],
+                goals=options['goals'],
+                years=options['years'],
+                seed=options['seed'],
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(users)} users with {options['transactions']} transactions each "
+            f'in {time.perf_counter() - started:.1f}s: {", ".join(user.username for user in users[:5])}'
+            + (' ...' if len(users) > 5 else '')
+        ))
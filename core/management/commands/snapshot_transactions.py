@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from core import columnar
+
+
+class Command(BaseCommand):
+    help = 'Write a memory-mappable Arrow snapshot of every user\'s transactions under MEDIA_ROOT'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help='Only snapshot this username')
+        parser.add_argument('--batch-size', type=int, default=columnar.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if not columnar.available():
+            raise CommandError('Snapshots require PyArrow')
+
+        users = get_user_model().objects.filter(is_active=True)
+        if options['user']:
+            users = users.filter(username=options['user'])
+            if not users.exists():
+                raise CommandError(f"User '{options['user']}' does not exist")
+
+        started = time.monotonic()
+        count = 0
+        for user in users.order_by('pk').iterator():
+            path = columnar.write_snapshot(user, batch_size=options['batch_size'])
+            count += 1
+            if options['verbosity'] > 1:
+                self.stdout.write(path)
+        self.stdout.write(self.style.SUCCESS(
+            f'Wrote {count} snapshots in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from core.routers import replica_alias
+
+
+class Command(BaseCommand):
+    help = 'Copy the SQLite database into the SQLite replica file the reporting views read from'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=1024,
+                            help='Pages copied per step; writers may interleave between steps')
+
+    def handle(self, *args, **options):
+        alias = replica_alias()
+        if not alias:
+            raise CommandError('No replica is configured; set EXPENSE_TRACKER_DB_REPLICA')
+        source, target = connections[DEFAULT_DB_ALIAS], connections[alias]
+        if source.vendor != 'sqlite' or target.vendor != 'sqlite':
+            raise CommandError('sync_replica only copies SQLite files; server replicas replicate themselves')
+        if source.settings_dict['NAME'] == target.settings_dict['NAME']:
+            raise CommandError('The replica is the primary database file')
+
+        source.ensure_connection()
+        target.ensure_connection()
+        started = time.monotonic()
+        # SQLite's online backup gives the replica a consistent snapshot
+        source.connection.backup(target.connection, pages=options['pages'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Copied {source.settings_dict['NAME']} to {target.settings_dict['NAME']} "
+            f'in {time.monotonic() - started:.2f}s'
+        ))
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('EXPENSE', 'Expense'), ('INCOME', 'Income'), ('TRANSFER', 'Transfer')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=15)),
+                ('count', models.IntegerField(default=0)),
+                ('account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.account')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.category')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['date'],
+                'indexes': [models.Index(fields=['user', 'date'], name='dailysummary_user_date')],
+                'constraints': [models.UniqueConstraint(condition=models.Q(('category__isnull', False)), fields=('user', 'date', 'account', 'category', 'transaction_type'), name='dailysummary_unique_bucket'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('user', 'date', 'account', 'transaction_type'), name='dailysummary_unique_uncategorised_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:39
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Q, Sum
+
+
+def set_opening_balances(apps, schema_editor):
+    # Back out the existing history so recompute_balances reproduces today's balances,
+    # with ledger.effects' rules: transfers leave their account (none has a destination yet)
+    Account = apps.get_model('core', 'Account')
+    Transaction = apps.get_model('core', 'Transaction')
+    net = {
+        row['account_id']: (row['income'] or 0) - (row['spent'] or 0)
+        for row in Transaction.objects.exclude(status='CANCELLED').order_by().values('account_id').annotate(
+            income=Sum('amount', filter=Q(transaction_type='INCOME')),
+            spent=Sum('amount', filter=Q(transaction_type__in=['EXPENSE', 'TRANSFER'])),
+        )
+    }
+    for account in Account.objects.all():
+        account.opening_balance = account.balance - net.get(account.pk, 0)
+        account.save(update_fields=['opening_balance'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0002_dailysummary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='account',
+            name='opening_balance',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=15),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='transfer_account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='incoming_transfers', to='core.account'),
+        ),
+        migrations.RunPython(set_opening_balances, migrations.RunPython.noop),
+    ]
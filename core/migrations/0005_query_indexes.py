@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:43
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_transaction_import_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='budget',
+            index=models.Index(fields=['user', 'start_date', 'end_date'], name='budget_user_dates'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysummary',
+            index=models.Index(fields=['user', 'transaction_type', 'date'], name='dailysummary_user_type_date'),
+        ),
+        migrations.AddIndex(
+            model_name='dailysummary',
+            index=models.Index(fields=['user', 'category', 'date'], name='dailysummary_user_cat_date'),
+        ),
+        migrations.AddIndex(
+            model_name='goal',
+            index=models.Index(fields=['user', 'status'], name='goal_user_status'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringtransaction',
+            index=models.Index(fields=['status', 'next_due'], name='recurring_status_next_due'),
+        ),
+        migrations.AddIndex(
+            model_name='recurringtransaction',
+            index=models.Index(fields=['user', 'status', 'next_due'], name='recurring_user_status_due'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', '-date', '-created_at'], name='transaction_user_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'transaction_type', 'date'], name='transaction_user_type_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['user', 'category', 'date'], name='transaction_user_cat_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['account', 'date'], name='transaction_account_date'),
+        ),
+    ]
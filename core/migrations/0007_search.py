@@ -0,0 +1,128 @@
+# Generated by Django 5.2.18 on 2026-10-18 17:56
+
+import re
+import unicodedata
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+# Frozen copy of core.search as of this migration: later changes to the live
+# module must not change what this migration creates on a fresh database
+FTS_TABLE = 'core_transaction_fts'
+TOKEN_LENGTH = 64
+WORD = re.compile(r'[^\W_]+')
+# Tags are a JSON array; index their text, not the JSON (which escapes accents)
+FTS_TAGS = "(SELECT group_concat(value, ' ') FROM json_each({}.tags))"
+
+FTS_SCHEMA = [
+    f"""CREATE VIEW {FTS_TABLE}_content AS
+        SELECT id, description, {FTS_TAGS.format('core_transaction')} AS tags, user_id
+        FROM core_transaction""",
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        description, tags, user_id UNINDEXED,
+        content='{FTS_TABLE}_content', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON core_transaction BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description, tags, user_id)
+        VALUES (new.id, new.description, {FTS_TAGS.format('new')}, new.user_id);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON core_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, tags, user_id)
+        VALUES ('delete', old.id, old.description, {FTS_TAGS.format('old')}, old.user_id);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF description, tags, user_id ON core_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, tags, user_id)
+        VALUES ('delete', old.id, old.description, {FTS_TAGS.format('old')}, old.user_id);
+        INSERT INTO {FTS_TABLE}(rowid, description, tags, user_id)
+        VALUES (new.id, new.description, {FTS_TAGS.format('new')}, new.user_id);
+    END""",
+]
+
+# FTS5's own 'rebuild' cannot read a view with a subquery, so refill it by hand
+FTS_REBUILD = [
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')",
+    f"""INSERT INTO {FTS_TABLE}(rowid, description, tags, user_id)
+        SELECT id, description, tags, user_id FROM {FTS_TABLE}_content""",
+]
+
+FTS_DROP = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+    f'DROP VIEW IF EXISTS {FTS_TABLE}_content',
+]
+
+
+def fts5_supported(conn):
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT sqlite_compileoption_used(%s)', ['ENABLE_FTS5'])
+        return bool(cursor.fetchone()[0])
+
+
+def words(text):
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [word[:TOKEN_LENGTH] for word in WORD.findall(text)]
+
+
+def tag_words(tags):
+    if isinstance(tags, str):
+        tags = [tags]
+    return [word for tag in tags or [] for word in words(tag)]
+
+
+def create_fts_index(apps, schema_editor):
+    if fts5_supported(schema_editor.connection):
+        for statement in FTS_SCHEMA + FTS_REBUILD:
+            schema_editor.execute(statement)
+        return
+
+    # No FTS5: backfill the token index instead
+    Transaction = apps.get_model('core', 'Transaction')
+    SearchToken = apps.get_model('core', 'SearchToken')
+    batch = []
+    for transaction in Transaction.objects.only('id', 'user_id', 'description', 'tags').iterator(chunk_size=2000):
+        for field, values in (('D', words(transaction.description)), ('T', tag_words(transaction.tags))):
+            for token in dict.fromkeys(values):
+                batch.append(SearchToken(user_id=transaction.user_id, transaction_id=transaction.pk, field=field, token=token))
+        if len(batch) >= 2000:
+            SearchToken.objects.bulk_create(batch)
+            batch = []
+    SearchToken.objects.bulk_create(batch)
+
+
+def drop_fts_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        for statement in FTS_DROP:
+            schema_editor.execute(statement)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_recurring_transaction_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchToken',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('field', models.CharField(choices=[('D', 'Description'), ('T', 'Tag')], max_length=1)),
+                ('token', models.CharField(max_length=64)),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_tokens', to='core.transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', 'token'], name='searchtoken_user_token')],
+                'constraints': [models.UniqueConstraint(fields=('transaction', 'field', 'token'), name='searchtoken_unique_token')],
+            },
+        ),
+        migrations.RunPython(create_fts_index, drop_fts_index),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:01
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0007_search'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Tag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50)),
+                ('key', models.CharField(editable=False, max_length=50)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['key'],
+            },
+        ),
+        migrations.CreateModel(
+            name='TransactionTag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('transaction_type', models.CharField(choices=[('EXPENSE', 'Expense'), ('INCOME', 'Income'), ('TRANSFER', 'Transfer')], max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=15)),
+                ('tag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='transaction_links', to='core.tag')),
+                ('transaction', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='tag_links', to='core.transaction')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='tag_unique_key'),
+        ),
+        migrations.AddIndex(
+            model_name='transactiontag',
+            index=models.Index(fields=['user', 'transaction_type', 'date'], name='transactiontag_user_type_date'),
+        ),
+        migrations.AddIndex(
+            model_name='transactiontag',
+            index=models.Index(fields=['tag', 'date'], name='transactiontag_tag_date'),
+        ),
+        migrations.AddConstraint(
+            model_name='transactiontag',
+            constraint=models.UniqueConstraint(fields=('transaction', 'tag'), name='transactiontag_unique_tag'),
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:02
+
+from django.conf import settings
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def set_paths(apps, schema_editor):
+    Category = apps.get_model('core', 'Category')
+    nodes = list(Category.objects.only('id', 'parent_id'))
+    known = {node.pk for node in nodes}
+    children = defaultdict(list)
+    for node in nodes:
+        children[node.parent_id if node.parent_id in known else None].append(node)
+
+    stack = [(node, '', 0) for node in children[None]]
+    while stack:
+        node, parent_path, depth = stack.pop()
+        node.path, node.depth = f'{parent_path}{node.pk:010d}/', depth
+        stack.extend((child, node.path, depth + 1) for child in children[node.pk])
+    Category.objects.bulk_update(nodes, ['path', 'depth'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_tags'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='depth',
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='path',
+            field=models.CharField(default='', editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name='category',
+            index=models.Index(fields=['user', 'path'], name='category_user_path'),
+        ),
+        migrations.RunPython(set_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_accounts(apps, schema_editor):
+    Transaction = apps.get_model('core', 'Transaction')
+    TransactionTag = apps.get_model('core', 'TransactionTag')
+    TransactionTag.objects.update(account_id=Subquery(
+        Transaction.objects.filter(pk=OuterRef('transaction_id')).values('account_id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transactiontag',
+            name='account',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='core.account'),
+        ),
+        migrations.RunPython(copy_accounts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 18:15
+
+import datetime
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def set_start_dates(apps, schema_editor):
+    # Existing goals count from the day they were created
+    Goal = apps.get_model('core', 'Goal')
+    Goal.objects.update(start_date=TruncDate('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_transactiontag_account'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='goal',
+            name='account',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='goals', to='core.account'),
+        ),
+        migrations.AddField(
+            model_name='goal',
+            name='category',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='goals', to='core.category'),
+        ),
+        migrations.AddField(
+            model_name='goal',
+            name='start_date',
+            field=models.DateField(default=datetime.date.today),
+        ),
+        migrations.RunPython(set_start_dates, migrations.RunPython.noop),
+    ]
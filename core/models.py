@@ -1,7 +1,9 @@
 
 # Create your models here.
 # core/models.py
-from django.db import models
+from datetime import date
+
+from django.db import models, transaction as db_transaction
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
@@ -47,6 +49,7 @@ class Account(models.Model):
     name = models.CharField(max_length=100)
     account_type = models.CharField(max_length=20, choices=ACCOUNT_TYPES)
     balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    opening_balance = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     currency = models.CharField(max_length=3, default='USD')
     is_default = models.BooleanField(default=False)
     icon = models.CharField(max_length=50, null=True, blank=True)
@@ -61,6 +64,14 @@ class Account(models.Model):
     def __str__(self):
         return f"{self.name} ({self.get_account_type_display()})"
 
+    def save(self, *args, **kwargs):
+        # A new account's ledger starts at whichever of the two was entered
+        if self._state.adding and not self.opening_balance:
+            self.opening_balance = self.balance
+        elif self._state.adding and not self.balance:
+            self.balance = self.opening_balance
+        super().save(*args, **kwargs)
+
 class Category(models.Model):
     """Expense or income category."""
     name = models.CharField(max_length=100)
@@ -73,9 +84,18 @@ class Category(models.Model):
     category_type = models.CharField(max_length=50, null=True, blank=True)  # Optional for categorization type
     icon = models.CharField(max_length=50, null=True, blank=True)  # Optional for storing an icon name
     
+    # Materialized path of zero-padded ids from the root, maintained by core.categories
+    path = models.CharField(max_length=255, default='', editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'path'], name='category_user_path'),
+        ]
+
     def __str__(self):
         return self.name
 
@@ -96,6 +116,13 @@ class Transaction(models.Model):
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    transfer_account = models.ForeignKey(
+        Account,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='incoming_transfers'
+    )
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
     transaction_type = models.CharField(max_length=20, choices=TRANSACTION_TYPES)
@@ -107,23 +134,39 @@ class Transaction(models.Model):
     tags = models.JSONField(null=True, blank=True)  # Store tags as JSON array
     is_recurring = models.BooleanField(default=False)
     recurring = models.ForeignKey('RecurringTransaction', null=True, blank=True, on_delete=models.SET_NULL)
+    import_id = models.CharField(max_length=64, null=True, blank=True, editable=False)  # Statement id, for de-duplication
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         ordering = ['-date', '-created_at']
+        indexes = [
+            # Every listing and report filters by user and a date range first
+            models.Index(fields=['user', '-date', '-created_at'], name='transaction_user_date'),
+            models.Index(fields=['user', 'transaction_type', 'date'], name='transaction_user_type_date'),
+            models.Index(fields=['user', 'category', 'date'], name='transaction_user_cat_date'),
+            models.Index(fields=['account', 'date'], name='transaction_account_date'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['account', 'import_id'],
+                condition=models.Q(import_id__isnull=False),
+                name='transaction_unique_import_id',
+            ),
+        ]
 
     def __str__(self):
         return f"{self.description} ({self.amount})"
 
     def save(self, *args, **kwargs):
-        # Update account balance on transaction save
-        if self.transaction_type == 'EXPENSE':
-            self.account.balance -= self.amount
-        elif self.transaction_type == 'INCOME':
-            self.account.balance += self.amount
-        self.account.save()
-        super().save(*args, **kwargs)
+        # Account balances and rollups are adjusted by the receivers in
+        # core.signals; keep them in the same database transaction as the row
+        with db_transaction.atomic():
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with db_transaction.atomic():
+            return super().delete(*args, **kwargs)
 
 class RecurringTransaction(models.Model):
     """Recurring transactions setup"""
@@ -138,12 +181,21 @@ class RecurringTransaction(models.Model):
         ('ACTIVE', 'Active'),
         ('PAUSED', 'Paused'),
         ('CANCELLED', 'Cancelled'),
+        ('COMPLETED', 'Completed'),
     ]
 
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    transfer_account = models.ForeignKey(
+        Account,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='incoming_recurring_transfers'
+    )
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
     amount = models.DecimalField(max_digits=15, decimal_places=2)
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES, default='EXPENSE')
     description = models.CharField(max_length=200)
     frequency = models.CharField(max_length=20, choices=FREQUENCY_CHOICES)
     start_date = models.DateField()
@@ -154,6 +206,21 @@ class RecurringTransaction(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_due'], name='recurring_status_next_due'),
+            models.Index(fields=['user', 'status', 'next_due'], name='recurring_user_status_due'),
+        ]
+
+    def __str__(self):
+        return f"{self.description} ({self.get_frequency_display()})"
+
+    def save(self, *args, **kwargs):
+        # The first occurrence is due on the start date
+        if self.next_due is None:
+            self.next_due = self.start_date
+        super().save(*args, **kwargs)
+
 class Budget(models.Model):
     """Budget tracking"""
     PERIOD_CHOICES = [
@@ -179,6 +246,11 @@ class Budget(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'start_date', 'end_date'], name='budget_user_dates'),
+        ]
+
 
 class Goal(models.Model):
     """Financial goals"""
@@ -206,8 +278,171 @@ class Goal(models.Model):
     target_amount = models.DecimalField(max_digits=15, decimal_places=2)
     current_amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
     deadline = models.DateField(null=True, blank=True)
+    # Linked goals track their progress from transactions, see core.goals
+    account = models.ForeignKey(Account, on_delete=models.SET_NULL, null=True, blank=True, related_name='goals')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, related_name='goals')
+    start_date = models.DateField(default=date.today)
     goal_type = models.CharField(max_length=20, choices=GOAL_TYPES)
     priority = models.CharField(max_length=20, choices=PRIORITY_CHOICES)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='IN_PROGRESS')
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
\ No newline at end of file
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'status'], name='goal_user_status'),
+        ]
+
+class DailySummary(models.Model):
+    """Per-day transaction totals, maintained incrementally by core.rollups"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    date = models.DateField()
+    account = models.ForeignKey(Account, on_delete=models.CASCADE)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2, default=0)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        ordering = ['date']
+        indexes = [
+            models.Index(fields=['user', 'date'], name='dailysummary_user_date'),
+            models.Index(fields=['user', 'transaction_type', 'date'], name='dailysummary_user_type_date'),
+            models.Index(fields=['user', 'category', 'date'], name='dailysummary_user_cat_date'),
+        ]
+        constraints = [
+            # NULL never compares equal, so uncategorised buckets need their own constraint
+            models.UniqueConstraint(
+                fields=['user', 'date', 'account', 'category', 'transaction_type'],
+                condition=models.Q(category__isnull=False),
+                name='dailysummary_unique_bucket',
+            ),
+            models.UniqueConstraint(
+                fields=['user', 'date', 'account', 'transaction_type'],
+                condition=models.Q(category__isnull=True),
+                name='dailysummary_unique_uncategorised_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.transaction_type} ({self.amount})"
+
+class ExchangeRate(models.Model):
+    """Units of ``currency`` per unit of settings.CORE_FX_BASE on ``date``, loaded by load_fx_rates"""
+    currency = models.CharField(max_length=3)
+    date = models.DateField()
+    rate = models.DecimalField(max_digits=20, decimal_places=10)
+
+    class Meta:
+        ordering = ['currency', '-date']
+        constraints = [
+            # Also the index behind "latest rate on or before a day" lookups
+            models.UniqueConstraint(fields=['currency', 'date'], name='exchangerate_unique_day'),
+        ]
+
+    def __str__(self):
+        return f"{self.currency} {self.rate} ({self.date})"
+
+
+class Tag(models.Model):
+    """A user's transaction tag; ``Transaction.tags`` holds the names, this table indexes them"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    name = models.CharField(max_length=50)
+    key = models.CharField(max_length=50, editable=False)  # Case-folded name
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['key']
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='tag_unique_key'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def save(self, *args, **kwargs):
+        self.key = self.name.casefold()
+        super().save(*args, **kwargs)
+
+
+class TransactionTag(models.Model):
+    """Tag of a transaction, with the transaction fields tag reports group by copied in"""
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='tag_links')
+    tag = models.ForeignKey(Tag, on_delete=models.CASCADE, related_name='transaction_links')
+    account = models.ForeignKey(Account, on_delete=models.CASCADE, null=True)  # For its currency
+    date = models.DateField()
+    transaction_type = models.CharField(max_length=20, choices=Transaction.TRANSACTION_TYPES)
+    amount = models.DecimalField(max_digits=15, decimal_places=2)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'transaction_type', 'date'], name='transactiontag_user_type_date'),
+            models.Index(fields=['tag', 'date'], name='transactiontag_tag_date'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'tag'], name='transactiontag_unique_tag'),
+        ]
+
+    def __str__(self):
+        return f"{self.tag} ({self.amount})"
+
+
+class SearchToken(models.Model):
+    """Inverted index of transaction words, used by core.search where SQLite FTS5 is unavailable"""
+    FIELD_CHOICES = [
+        ('D', 'Description'),
+        ('T', 'Tag'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    transaction = models.ForeignKey(Transaction, on_delete=models.CASCADE, related_name='search_tokens')
+    field = models.CharField(max_length=1, choices=FIELD_CHOICES)
+    token = models.CharField(max_length=64)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'token'], name='searchtoken_user_token'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['transaction', 'field', 'token'], name='searchtoken_unique_token'),
+        ]
+
+    def __str__(self):
+        return self.token
+
+
+class Job(models.Model):
+    """Export run off the request path by the run_jobs worker; the result is a file under MEDIA_ROOT"""
+    KIND_CHOICES = [
+        ('TRANSACTIONS', 'Transaction export'),
+        ('REPORT', 'Report export'),
+    ]
+
+    STATUS_CHOICES = [
+        ('PENDING', 'Pending'),
+        ('RUNNING', 'Running'),
+        ('COMPLETED', 'Completed'),
+        ('FAILED', 'Failed'),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='jobs')
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    params = models.JSONField(default=dict, blank=True)  # The export's query string
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='PENDING')
+    progress = models.PositiveSmallIntegerField(default=0)  # Percent
+    rows = models.IntegerField(default=0)
+    file = models.FileField(upload_to='exports/%Y/%m/', blank=True)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='job_status_created'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} #{self.pk} ({self.status})"
@@ -0,0 +1,88 @@
+# core/pagination.py
+"""
+Keyset (seek) pagination over transactions.
+
+Pages are addressed by an opaque cursor holding the sort key of the last
+(or first) row seen, ordered by ``(date, created_at, id)`` descending. A
+page costs one indexed range read regardless of how deep it is, and no
+``COUNT(*)`` or ``OFFSET`` is ever issued.
+"""
+import base64
+import json
+from datetime import date, datetime
+
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+ORDERING = ('-date', '-created_at', '-id')
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(row):
+    """Opaque cursor for a row with date, created_at and id"""
+    key = [row['date'].isoformat(), row['created_at'].isoformat(), row['id']]
+    return base64.urlsafe_b64encode(json.dumps(key).encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        day, created_at, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return date.fromisoformat(day), datetime.fromisoformat(created_at), int(pk)
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor')
+
+
+def _seek(cursor, direction):
+    day, created_at, pk = decode_cursor(cursor)
+    return (
+        Q(**{f'date__{direction}': day})
+        | Q(date=day, **{f'created_at__{direction}': created_at})
+        | Q(date=day, created_at=created_at, **{f'id__{direction}': pk})
+    )
+
+
+def page_size(value, default=DEFAULT_PAGE_SIZE):
+    """Parse a requested page size, clamped to MAX_PAGE_SIZE"""
+    try:
+        return max(1, min(int(value), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return default
+
+
+def keyset_page(queryset, after=None, before=None, size=DEFAULT_PAGE_SIZE):
+    """
+    Return ``(rows, next_cursor, previous_cursor)`` for the page following
+    ``after`` or preceding ``before`` (the first page when neither is given).
+
+    ``queryset`` may be a model or a ``values()`` queryset, as long as each
+    row exposes ``date``, ``created_at`` and ``id``.
+    """
+    if before:
+        rows = list(queryset.filter(_seek(before, 'gt')).order_by('date', 'created_at', 'id')[:size + 1])
+        has_more = len(rows) > size
+        rows = rows[:size][::-1]
+        has_next, has_previous = True, has_more
+    else:
+        if after:
+            queryset = queryset.filter(_seek(after, 'lt'))
+        rows = list(queryset.order_by(*ORDERING)[:size + 1])
+        has_next = len(rows) > size
+        rows = rows[:size]
+        has_previous = bool(after)
+
+    keys = [_key(row) for row in rows[:1] + rows[-1:]]
+    next_cursor = encode_cursor(keys[-1]) if rows and has_next else None
+    previous_cursor = encode_cursor(keys[0]) if rows and has_previous else None
+    return rows, next_cursor, previous_cursor
+
+
+def _key(row):
+    if isinstance(row, dict):
+        return row
+    return {'date': row.date, 'created_at': row.created_at, 'id': row.pk}
@@ -0,0 +1,96 @@
+# core/reporting.py
+"""
+Date-range reporting engine.
+
+Reports take an arbitrary ``date_from``..``date_to`` range and a
+granularity. Rows are bucketed in the database with the matching
+``Trunc*`` function (one row per bucket and account currency), folded into
+the user's currency, and the buckets without data are filled with zeros,
+so a multi-year chart is a few dozen rows instead of every day.
+"""
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models.functions import TruncDay, TruncMonth, TruncQuarter, TruncWeek, TruncYear
+
+from .dates import add_months
+from .fx import fold
+
+GRANULARITIES = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+    'quarter': TruncQuarter,
+    'year': TruncYear,
+}
+DEFAULT_DAYS = 30
+MAX_BUCKETS = 3660
+
+
+def truncate(day, granularity):
+    """Python equivalent of the database truncation: the first day of the bucket"""
+    if granularity == 'day':
+        return day
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    if granularity == 'quarter':
+        return day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    return day.replace(month=1, day=1)
+
+
+def next_bucket(start, granularity):
+    if granularity == 'day':
+        return start + timedelta(days=1)
+    if granularity == 'week':
+        return start + timedelta(weeks=1)
+    return add_months(start, {'month': 1, 'quarter': 3, 'year': 12}[granularity])
+
+
+def bucket_count(date_from, date_to, granularity):
+    """Number of buckets in a range, without listing them"""
+    start, end = truncate(date_from, granularity), truncate(date_to, granularity)
+    if granularity == 'day':
+        return (end - start).days + 1
+    if granularity == 'week':
+        return (end - start).days // 7 + 1
+    months = (end.year - start.year) * 12 + end.month - start.month
+    return months // {'month': 1, 'quarter': 3, 'year': 12}[granularity] + 1
+
+
+def bucket_starts(date_from, date_to, granularity):
+    start = truncate(date_from, granularity)
+    while start <= date_to:
+        yield start
+        start = next_bucket(start, granularity)
+
+
+def series(rows, date_from, date_to, granularity, amounts, currency, counts=None, key='date'):
+    """
+    Gap-filled time series over ``rows`` (a queryset with ``date`` and
+    ``account``): one dict per bucket with ``key`` (the bucket's first day),
+    every aggregate of ``amounts`` converted into ``currency`` and every
+    aggregate of ``counts`` as is.
+    """
+    counts = counts or {}
+    grouped = rows.filter(
+        date__gte=date_from,
+        date__lte=date_to
+    ).annotate(
+        period=GRANULARITIES[granularity]('date')
+    ).values('period', 'account__currency').annotate(
+        **amounts, **counts
+    ).order_by('period')
+    buckets = {
+        row['period']: row
+        for row in fold(grouped, ('period',), list(amounts), currency, date_key='period', counts=list(counts))
+    }
+
+    empty = dict.fromkeys(amounts, Decimal('0.00'))
+    empty.update(dict.fromkeys(counts, 0))
+    result = []
+    for start in bucket_starts(date_from, date_to, granularity):
+        bucket = buckets.get(start, empty)
+        result.append({key: start, **{name: bucket[name] if bucket[name] is not None else empty[name] for name in empty}})
+    return result
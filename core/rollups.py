@@ -0,0 +1,168 @@
+# core/rollups.py
+"""
+Incrementally maintained per-day transaction totals.
+
+Every transaction write adjusts exactly one ``DailySummary`` bucket
+(user x day x account x category x type), so reports read O(days) rows
+instead of scanning the user's whole transaction history.
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction as db_transaction
+from django.db.models import Count, F, Sum
+
+from . import cache
+from .models import DailySummary, Transaction
+
+# Fields of a transaction that determine which bucket it lands in
+BUCKET_FIELDS = ('user_id', 'date', 'account_id', 'category_id', 'transaction_type', 'amount')
+
+
+def _bucket(state):
+    return {field: state[field] for field in BUCKET_FIELDS}
+
+
+def apply(user_id, date, account_id, category_id, transaction_type, amount, count=1, create=True):
+    """Add ``amount``/``count`` to a single bucket, creating it if needed"""
+    buckets = DailySummary.objects.filter(
+        user_id=user_id,
+        date=date,
+        account_id=account_id,
+        category_id=category_id,
+        transaction_type=transaction_type,
+    )
+    amount = Decimal(str(amount))
+
+    if buckets.update(amount=F('amount') + amount, count=F('count') + count) or not create:
+        return
+
+    try:
+        with db_transaction.atomic():
+            DailySummary.objects.create(
+                user_id=user_id,
+                date=date,
+                account_id=account_id,
+                category_id=category_id,
+                transaction_type=transaction_type,
+                amount=amount,
+                count=count,
+            )
+    except IntegrityError:
+        # Another writer created the bucket between our update and insert
+        buckets.update(amount=F('amount') + amount, count=F('count') + count)
+
+
+def add(state):
+    """Record a transaction state in its bucket"""
+    apply(**_bucket(state))
+
+
+def remove(state):
+    """Take a transaction state out of its bucket"""
+    state = dict(_bucket(state), amount=-Decimal(str(state['amount'])), count=-1)
+    # A removal always targets an existing bucket; never resurrect one that a
+    # cascading delete has already dropped
+    apply(create=False, **state)
+
+
+def apply_many(deltas, chunk_size=500):
+    """
+    Add a batch of ``{(user_id, date, account_id, category_id, type): [amount, count]}``
+    deltas: existing buckets sharing a delta get one ``F()`` UPDATE, new ones are bulk inserted
+    """
+    if not deltas:
+        return
+    with db_transaction.atomic():
+        existing = DailySummary.objects.filter(
+            user_id__in={key[0] for key in deltas},
+            date__in={key[1] for key in deltas},
+        ).values_list('pk', 'user_id', 'date', 'account_id', 'category_id', 'transaction_type')
+
+        remaining = dict(deltas)
+        by_delta = defaultdict(list)
+        for pk, *key in existing.iterator():
+            delta = remaining.pop(tuple(key), None)
+            if delta is not None:
+                by_delta[tuple(delta)].append(pk)
+
+        for (amount, count), pks in by_delta.items():
+            for start in range(0, len(pks), chunk_size):
+                DailySummary.objects.filter(pk__in=pks[start:start + chunk_size]).update(
+                    amount=F('amount') + amount, count=F('count') + count
+                )
+
+        DailySummary.objects.bulk_create(
+            [
+                DailySummary(
+                    user_id=user_id,
+                    date=date,
+                    account_id=account_id,
+                    category_id=category_id,
+                    transaction_type=transaction_type,
+                    amount=amount,
+                    count=count,
+                )
+                for (user_id, date, account_id, category_id, transaction_type), (amount, count)
+                in remaining.items()
+            ],
+            batch_size=1000,
+        )
+
+
+def merge_category(category):
+    """Fold a category's buckets into the uncategorised ones before it is deleted"""
+    buckets = DailySummary.objects.filter(category=category)
+    for bucket in buckets.values('user_id', 'date', 'account_id', 'transaction_type', 'amount', 'count'):
+        apply(
+            user_id=bucket['user_id'],
+            date=bucket['date'],
+            account_id=bucket['account_id'],
+            category_id=None,
+            transaction_type=bucket['transaction_type'],
+            amount=bucket['amount'],
+            count=bucket['count'],
+        )
+    buckets.delete()
+
+
+def rebuild(user=None, date_from=None, date_to=None):
+    """Recompute buckets from scratch with one grouped scan; returns the bucket count"""
+    transactions = Transaction.objects.all()
+    summaries = DailySummary.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+        summaries = summaries.filter(user=user)
+    if date_from is not None:
+        transactions = transactions.filter(date__gte=date_from)
+        summaries = summaries.filter(date__gte=date_from)
+    if date_to is not None:
+        transactions = transactions.filter(date__lte=date_to)
+        summaries = summaries.filter(date__lte=date_to)
+
+    rows = transactions.order_by().values(
+        'user_id', 'date', 'account_id', 'category_id', 'transaction_type'
+    ).annotate(total=Sum('amount'), transactions=Count('id'))
+
+    with db_transaction.atomic():
+        summaries.delete()
+        created = DailySummary.objects.bulk_create(
+            (
+                DailySummary(
+                    user_id=row['user_id'],
+                    date=row['date'],
+                    account_id=row['account_id'],
+                    category_id=row['category_id'],
+                    transaction_type=row['transaction_type'],
+                    amount=row['total'],
+                    count=row['transactions'],
+                )
+                for row in rows.iterator()
+            ),
+            batch_size=1000,
+        )
+        if user is not None:
+            cache.bump(user.pk)
+        else:
+            cache.bump_all()
+    return len(created)
@@ -0,0 +1,85 @@
+# core/routers.py
+"""
+Read replica routing.
+
+Views wrapped in ``replica_reads`` read through the alias named by
+``CORE_READ_REPLICA``; everything else, and every write, uses 'default'.
+The flag is a context variable, so it follows async views into the
+worker threads ``charts.fan_out`` runs their builders on.
+
+A replica may lag behind: only views that report on data, and never read
+back what they just wrote, are routed. Results cached under a data version
+are built on the primary (``reading_from_primary``), since a lagging replica
+would otherwise store stale data under the new version.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS
+
+_replica_reads = ContextVar('core_replica_reads', default=False)
+
+
+def replica_alias():
+    return getattr(settings, 'CORE_READ_REPLICA', None)
+
+
+@contextmanager
+def _reading(from_replica):
+    token = _replica_reads.set(from_replica)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def reading_from_replica():
+    """Route the reads of the enclosed block to the replica, if one is configured"""
+    return _reading(True)
+
+
+def reading_from_primary():
+    """Route the reads of the enclosed block to 'default', even within ``replica_reads``"""
+    return _reading(False)
+
+
+def replica_reads(view):
+    """Decorator routing the reads of a (sync or async) view to the replica"""
+    if iscoroutinefunction(view):
+        async def wrapper(*args, **kwargs):
+            with reading_from_replica():
+                return await view(*args, **kwargs)
+        markcoroutinefunction(wrapper)
+    else:
+        def wrapper(*args, **kwargs):
+            with reading_from_replica():
+                return view(*args, **kwargs)
+    return wraps(view)(wrapper)
+
+
+class ReplicaRouter:
+    """Send reads flagged by ``replica_reads`` to the replica and all writes to 'default'"""
+
+    def db_for_read(self, model, **hints):
+        if _replica_reads.get():
+            return replica_alias()
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Instances read from the replica are still saved to the primary
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, replica_alias()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica gets its schema from the primary
+        if db == replica_alias():
+            return False
+        return None
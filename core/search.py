@@ -0,0 +1,267 @@
+# core/search.py
+"""
+Full-text search over transaction descriptions and tags.
+
+On SQLite the index is an FTS5 virtual table whose content is read from
+``core_transaction`` (so the text is not stored twice), kept in sync by
+triggers, which also covers ``bulk_create`` and queryset updates. Other
+databases, or SQLite builds without FTS5, use the ``SearchToken`` inverted
+index instead, maintained by core.signals and by the bulk write paths.
+
+Queries are words (``coffee``), prefixes (``star*``) and tag filters
+(``tag:travel`` or ``#travel``); every part has to match.
+"""
+import re
+import unicodedata
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Case, IntegerField, Q, Sum, Value, When
+from django.db.models.expressions import RawSQL
+
+from .models import SearchToken, Transaction
+
+FTS_TABLE = 'core_transaction_fts'
+MAX_TERMS = 16
+TOKEN_LENGTH = 64
+DEFAULT_LIMIT = 50
+
+# Same splitting and folding as FTS5's unicode61 tokenizer with remove_diacritics
+WORD = re.compile(r'[^\W_]+')
+QUERY_PART = re.compile(r'(?:(tag:|#)("[^"]*"|\S+))|(\S+)', re.IGNORECASE)
+
+# Tags are a JSON array; index their text, not the JSON (which escapes accents)
+FTS_TAGS = "(SELECT group_concat(value, ' ') FROM json_each({}.tags))"
+
+FTS_SCHEMA = [
+    f"""CREATE VIEW {FTS_TABLE}_content AS
+        SELECT id, description, {FTS_TAGS.format('core_transaction')} AS tags, user_id
+        FROM core_transaction""",
+    f"""CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5(
+        description, tags, user_id UNINDEXED,
+        content='{FTS_TABLE}_content', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2'
+    )""",
+    f"""CREATE TRIGGER {FTS_TABLE}_insert AFTER INSERT ON core_transaction BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, description, tags, user_id)
+        VALUES (new.id, new.description, {FTS_TAGS.format('new')}, new.user_id);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_delete AFTER DELETE ON core_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, tags, user_id)
+        VALUES ('delete', old.id, old.description, {FTS_TAGS.format('old')}, old.user_id);
+    END""",
+    f"""CREATE TRIGGER {FTS_TABLE}_update AFTER UPDATE OF description, tags, user_id ON core_transaction BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, description, tags, user_id)
+        VALUES ('delete', old.id, old.description, {FTS_TAGS.format('old')}, old.user_id);
+        INSERT INTO {FTS_TABLE}(rowid, description, tags, user_id)
+        VALUES (new.id, new.description, {FTS_TAGS.format('new')}, new.user_id);
+    END""",
+]
+
+# FTS5's own 'rebuild' cannot read a view with a subquery, so refill it by hand
+FTS_REBUILD = [
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('delete-all')",
+    f"""INSERT INTO {FTS_TABLE}(rowid, description, tags, user_id)
+        SELECT id, description, tags, user_id FROM {FTS_TABLE}_content""",
+]
+
+FTS_DROP = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+    f'DROP VIEW IF EXISTS {FTS_TABLE}_content',
+]
+
+
+def fts5_supported(conn):
+    """Whether ``conn`` is SQLite compiled with FTS5"""
+    if conn.vendor != 'sqlite':
+        return False
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT sqlite_compileoption_used(%s)', ['ENABLE_FTS5'])
+        return bool(cursor.fetchone()[0])
+
+
+_backends = {}
+
+
+def backend():
+    """Name of the active search backend: 'fts5' or 'tokens'"""
+    configured = getattr(settings, 'CORE_SEARCH_BACKEND', 'auto')
+    if configured != 'auto':
+        return configured
+    key = (connection.alias, connection.settings_dict['NAME'])
+    if key not in _backends:
+        with connection.cursor() as cursor:
+            _backends[key] = 'fts5' if FTS_TABLE in connection.introspection.table_names(cursor) else 'tokens'
+    return _backends[key]
+
+
+def words(text):
+    """Lower-cased, accent-free words of ``text``"""
+    text = unicodedata.normalize('NFKD', str(text or '').lower())
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return [word[:TOKEN_LENGTH] for word in WORD.findall(text)]
+
+
+def tag_words(tags):
+    if isinstance(tags, str):
+        tags = [tags]
+    return [word for tag in tags or [] for word in words(tag)]
+
+
+def parse_query(text):
+    """
+    Split a query into ``(terms, tags)``: ``terms`` is a list of
+    ``(word, is_prefix)`` pairs and ``tags`` a list of word lists.
+    """
+    terms = []
+    tags = []
+    for tag_marker, tag, term in QUERY_PART.findall(text or ''):
+        if tag_marker:
+            tag = words(tag.strip('"'))
+            if tag:
+                tags.append(tag)
+            continue
+        is_prefix = term.endswith('*')
+        parts = words(term)
+        for number, word in enumerate(parts):
+            terms.append((word, is_prefix and number == len(parts) - 1))
+    return terms[:MAX_TERMS], tags[:MAX_TERMS]
+
+
+def _fts_expression(terms, tags):
+    parts = [f'"{word}"*' if is_prefix else f'"{word}"' for word, is_prefix in terms]
+    parts += ['tags:"{}"'.format(' '.join(tag)) for tag in tags]
+    return ' AND '.join(parts)
+
+
+def _token_condition(word, is_prefix=False, field=None, prefix=''):
+    if is_prefix:
+        # A range rather than LIKE, so the (user, token) index is used everywhere
+        condition = Q(**{f'{prefix}token__gte': word, f'{prefix}token__lt': word + '\uffff'})
+    else:
+        condition = Q(**{f'{prefix}token': word})
+    if field:
+        condition &= Q(**{f'{prefix}field': field})
+    return condition
+
+
+def _token_conditions(terms, tags, prefix=''):
+    conditions = [_token_condition(word, is_prefix, prefix=prefix) for word, is_prefix in terms]
+    conditions += [_token_condition(word, field='T', prefix=prefix) for tag in tags for word in tag]
+    return conditions
+
+
+def matching(user, text, tags=()):
+    """
+    Subquery of the ids of ``user``'s transactions matching the query, for
+    use as ``Transaction.objects.filter(pk__in=...)``; None for an empty query.
+    """
+    terms, tag_filters = parse_query(text)
+    tag_filters += [words(tag) for tag in tags if words(tag)]
+    if not terms and not tag_filters:
+        return None
+
+    if backend() == 'fts5':
+        return RawSQL(
+            f'SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s AND user_id = %s',
+            (_fts_expression(terms, tag_filters), user.pk),
+        )
+
+    ids = Transaction.objects.filter(user=user)
+    for condition in _token_conditions(terms, tag_filters):
+        ids = ids.filter(pk__in=SearchToken.objects.filter(condition, user=user).values('transaction_id'))
+    return ids.values('pk')
+
+
+def search(user, text, tags=(), limit=DEFAULT_LIMIT):
+    """Best matches first, as transactions with a ``search_rank`` attribute"""
+    terms, tag_filters = parse_query(text)
+    tag_filters += [words(tag) for tag in tags if words(tag)]
+    if not terms and not tag_filters:
+        return []
+
+    if backend() == 'fts5':
+        with connection.cursor() as cursor:
+            # bm25 is lower for better matches; tag hits weigh double
+            cursor.execute(
+                f'SELECT rowid, -bm25({FTS_TABLE}, 1.0, 2.0) AS rank FROM {FTS_TABLE} '
+                f'WHERE {FTS_TABLE} MATCH %s AND user_id = %s ORDER BY rank DESC LIMIT %s',
+                [_fts_expression(terms, tag_filters), user.pk, limit],
+            )
+            ranks = dict(cursor.fetchall())
+        transactions = Transaction.objects.select_related('account', 'category').in_bulk(list(ranks))
+        results = []
+        for pk, rank in ranks.items():
+            if pk in transactions:
+                transactions[pk].search_rank = round(rank, 4)
+                results.append(transactions[pk])
+        return results
+
+    hit = reduce(or_, _token_conditions(terms, tag_filters, prefix='search_tokens__'))
+    return list(
+        Transaction.objects.filter(pk__in=matching(user, text, tags)).annotate(
+            search_rank=Sum(
+                Case(When(search_tokens__field='T', then=Value(2)), default=Value(1)),
+                filter=hit,
+                output_field=IntegerField(),
+            )
+        ).select_related('account', 'category').order_by('-search_rank', '-date', '-created_at')[:limit]
+    )
+
+
+def index_tokens(transactions):
+    """SearchToken rows for transactions (with their primary keys set)"""
+    tokens = []
+    for transaction in transactions:
+        for field, values in (('D', words(transaction.description)), ('T', tag_words(transaction.tags))):
+            for token in dict.fromkeys(values):
+                tokens.append(SearchToken(
+                    user_id=transaction.user_id,
+                    transaction_id=transaction.pk,
+                    field=field,
+                    token=token,
+                ))
+    return tokens
+
+
+def index_transactions(transactions, batch_size=2000):
+    """
+    (Re)index transactions written without going through ``save()``.
+    The FTS5 table is maintained by triggers, so this is a no-op there.
+    """
+    if backend() != 'tokens':
+        return
+    transactions = [transaction for transaction in transactions if transaction.pk is not None]
+    SearchToken.objects.filter(transaction_id__in=[transaction.pk for transaction in transactions]).delete()
+    SearchToken.objects.bulk_create(index_tokens(transactions), batch_size=batch_size)
+
+
+def rebuild(user=None, batch_size=2000):
+    """Rebuild the search index from scratch; returns the number of transactions indexed"""
+    transactions = Transaction.objects.all()
+    if user is not None:
+        transactions = transactions.filter(user=user)
+
+    if backend() == 'fts5':
+        with connection.cursor() as cursor:
+            for statement in FTS_REBUILD:
+                cursor.execute(statement)
+        return transactions.count()
+
+    tokens = SearchToken.objects.all() if user is None else SearchToken.objects.filter(user=user)
+    tokens.delete()
+    count = 0
+    batch = []
+    for transaction in transactions.only('id', 'user_id', 'description', 'tags').iterator(chunk_size=batch_size):
+        batch.append(transaction)
+        if len(batch) >= batch_size:
+            SearchToken.objects.bulk_create(index_tokens(batch), batch_size=batch_size)
+            count += len(batch)
+            batch = []
+    SearchToken.objects.bulk_create(index_tokens(batch), batch_size=batch_size)
+    return count + len(batch)
@@ -0,0 +1,126 @@
+# core/signals.py
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import cache, categories, goals, ledger, rollups, search, tags
+from .models import Account, Budget, Category, Goal, RecurringTransaction, Tag, Transaction
+
+# Everything the derived data (rollups, balances, goal progress) depends on
+TRACKED_FIELDS = tuple(dict.fromkeys(rollups.BUCKET_FIELDS + ledger.LEDGER_FIELDS + goals.GOAL_FIELDS))
+
+
+def snapshot(instance):
+    """Return the tracked state of a transaction instance"""
+    return {field: getattr(instance, field) for field in TRACKED_FIELDS}
+
+
+def stored_snapshot(pk):
+    """Return the tracked state of a transaction as stored, locking its row"""
+    if pk is None:
+        return None
+    return Transaction.objects.select_for_update().filter(pk=pk).values(*TRACKED_FIELDS).first()
+
+
+@receiver(pre_save, sender=Transaction)
+def remember_previous_transaction(sender, instance, raw=False, **kwargs):
+    """Keep the stored state around so post_save can apply only the difference"""
+    instance._previous_state = None if raw else stored_snapshot(instance.pk)
+
+
+@receiver(post_save, sender=Transaction)
+def apply_transaction_save(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    previous = getattr(instance, '_previous_state', None)
+    current = snapshot(instance)
+    if previous:
+        rollups.remove(previous)
+    rollups.add(current)
+    ledger.transition(previous, current)
+    goals.transition(previous, current)
+    search.index_transactions([instance])
+    if instance.tags or not created:
+        tags.sync([instance], created=created)
+
+
+@receiver(post_delete, sender=Transaction)
+def apply_transaction_delete(sender, instance, **kwargs):
+    previous = snapshot(instance)
+    rollups.remove(previous)
+    ledger.transition(previous, None)
+    goals.transition(previous, None)
+
+
+# What a goal's progress is computed from
+GOAL_LINK_FIELDS = ('account_id', 'category_id', 'start_date')
+
+
+@receiver(pre_save, sender=Goal)
+def remember_goal_link(sender, instance, raw=False, **kwargs):
+    instance._previous_link = None
+    if not raw and instance.pk is not None:
+        instance._previous_link = Goal.objects.filter(pk=instance.pk).values_list(*GOAL_LINK_FIELDS).first()
+
+
+@receiver(post_save, sender=Goal)
+def track_goal_progress(sender, instance, raw=False, **kwargs):
+    # A new or changed link restarts progress from the transaction history
+    link = tuple(getattr(instance, field) for field in GOAL_LINK_FIELDS)
+    if raw or link == getattr(instance, '_previous_link', None) or not (instance.account_id or instance.category_id):
+        return
+    goals.recompute(Goal.objects.filter(pk=instance.pk))
+    instance.current_amount = Goal.objects.values_list('current_amount', flat=True).get(pk=instance.pk)
+
+
+@receiver(pre_delete, sender=Category)
+def merge_category_rollups(sender, instance, **kwargs):
+    rollups.merge_category(instance)
+
+
+@receiver(pre_save, sender=Category)
+def check_category_move(sender, instance, raw=False, **kwargs):
+    if not raw and instance.parent_id:
+        categories.check_move(instance, Category.objects.only('path', 'depth').get(pk=instance.parent_id))
+
+
+@receiver(post_save, sender=Category)
+def place_category(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_path = categories.place(instance)
+    if old_path:
+        # The subtree's transactions left the old ancestors' goals and joined the new ones'
+        goals.recompute_ancestors(old_path, instance.path)
+
+
+@receiver(pre_delete, sender=Category)
+def detach_category_children(sender, instance, **kwargs):
+    # Children are set to NULL parents by the delete; move their subtrees to the root
+    stored = Category.objects.filter(pk=instance.pk).only('path', 'depth', 'user_id').first()
+    instance._stored_path = stored.path if stored else ''
+    if stored and stored.path:
+        categories.detach(stored)
+
+
+@receiver(post_delete, sender=Category)
+def recount_ancestor_goals(sender, instance, **kwargs):
+    # The category's transactions are uncategorised now and its children are roots
+    goals.recompute_ancestors(getattr(instance, '_stored_path', ''))
+
+
+@receiver(post_save, sender=Transaction)
+@receiver(post_delete, sender=Transaction)
+@receiver(post_save, sender=Account)
+@receiver(post_delete, sender=Account)
+@receiver(post_save, sender=Budget)
+@receiver(post_delete, sender=Budget)
+@receiver(post_save, sender=Goal)
+@receiver(post_delete, sender=Goal)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=RecurringTransaction)
+@receiver(post_delete, sender=RecurringTransaction)
+def invalidate_user_cache(sender, instance, **kwargs):
+    cache.bump(instance.user_id)
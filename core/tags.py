@@ -0,0 +1,145 @@
+# core/tags.py
+"""
+Normalized tag index.
+
+``Transaction.tags`` stays the JSON list of names the user typed; every
+write mirrors it into ``Tag``/``TransactionTag`` rows carrying the
+transaction's date, type, amount and account, so per-tag totals are an
+indexed GROUP BY over ``TransactionTag`` instead of a JSON scan of every
+row.
+"""
+import re
+from collections import defaultdict
+
+from django.db.models import Count, Sum
+
+from .fx import fold, user_currency
+from .models import Tag, Transaction, TransactionTag
+from .reporting import GRANULARITIES
+
+TAG_SEPARATORS = re.compile(r'[,;|]')
+NAME_LENGTH = 50
+
+
+def normalize(name):
+    """Collapse whitespace; empty names become None"""
+    name = ' '.join(str(name).split())[:NAME_LENGTH]
+    return name or None
+
+
+def tag_names(value):
+    """Distinct tag names, in order, from a JSON list or a separated string"""
+    if not value:
+        return []
+    if isinstance(value, str):
+        value = TAG_SEPARATORS.split(value)
+    names = {}
+    for name in value:
+        name = normalize(name)
+        if name:
+            names.setdefault(name.casefold(), name)
+    return list(names.values())
+
+
+def get_tags(user_id, names):
+    """``{key: tag_id}`` for a user's tags, creating the missing ones"""
+    keys = {name.casefold(): name for name in names}
+    tags = dict(Tag.objects.filter(user_id=user_id, key__in=keys).values_list('key', 'id'))
+    missing = [
+        Tag(user_id=user_id, name=name, key=key)
+        for key, name in keys.items() if key not in tags
+    ]
+    if missing:
+        # Another writer may have created some of them in the meantime
+        Tag.objects.bulk_create(missing, ignore_conflicts=True)
+        tags.update(Tag.objects.filter(
+            user_id=user_id, key__in=[tag.key for tag in missing]
+        ).values_list('key', 'id'))
+    return tags
+
+
+def sync(transactions, created=False, batch_size=2000):
+    """
+    Mirror the ``tags`` of transactions (with their primary keys set) into
+    the tag index. ``created`` skips clearing links of brand new rows.
+    """
+    names = defaultdict(list)
+    for transaction in transactions:
+        names[transaction.user_id].extend(tag_names(transaction.tags))
+    tag_ids = {user_id: get_tags(user_id, user_names) for user_id, user_names in names.items() if user_names}
+
+    if not created:
+        TransactionTag.objects.filter(transaction__in=[transaction.pk for transaction in transactions]).delete()
+    TransactionTag.objects.bulk_create(
+        (
+            TransactionTag(
+                user_id=transaction.user_id,
+                transaction_id=transaction.pk,
+                account_id=transaction.account_id,
+                tag_id=tag_ids[transaction.user_id][name.casefold()],
+                date=transaction.date,
+                transaction_type=transaction.transaction_type,
+                amount=transaction.amount,
+            )
+            for transaction in transactions
+            for name in tag_names(transaction.tags)
+        ),
+        batch_size=batch_size,
+    )
+
+
+def rebuild(user=None, batch_size=2000):
+    """Rebuild the tag index from ``Transaction.tags``; returns the number of tagged transactions"""
+    links = TransactionTag.objects.all()
+    transactions = Transaction.objects.filter(tags__isnull=False)
+    if user is not None:
+        links = links.filter(user=user)
+        transactions = transactions.filter(user=user)
+    links.delete()
+
+    count = 0
+    batch = []
+    columns = ('id', 'user_id', 'account_id', 'tags', 'date', 'transaction_type', 'amount')
+    for transaction in transactions.only(*columns).iterator(chunk_size=batch_size):
+        batch.append(transaction)
+        if len(batch) >= batch_size:
+            sync(batch, created=True, batch_size=batch_size)
+            count += len(batch)
+            batch = []
+    sync(batch, created=True, batch_size=batch_size)
+    return count + len(batch)
+
+
+def tagged(user, transaction_type='EXPENSE', date_from=None, date_to=None, tags=None):
+    links = TransactionTag.objects.filter(user=user, transaction_type=transaction_type)
+    if date_from:
+        links = links.filter(date__gte=date_from)
+    if date_to:
+        links = links.filter(date__lte=date_to)
+    if tags:
+        links = links.filter(tag__in=tags)
+    return links
+
+
+def tag_totals(user, transaction_type='EXPENSE', date_from=None, date_to=None, tags=None, currency=None):
+    """Total amount (in ``currency``) and number of transactions per tag, largest first"""
+    totals = fold(tagged(user, transaction_type, date_from, date_to, tags).values(
+        'tag_id', 'tag__name', 'account__currency'
+    ).annotate(
+        total=Sum('amount'),
+        transactions=Count('id')
+    ).order_by('tag__name'), ('tag_id', 'tag__name'), ('total',), currency or user_currency(user), date_to,
+        counts=('transactions',))
+    totals.sort(key=lambda row: row['total'], reverse=True)
+    return totals
+
+
+def tag_trend(user, transaction_type='EXPENSE', date_from=None, date_to=None, tags=None, currency=None,
+              granularity='month'):
+    """Totals per tag (in ``currency``) per ``granularity`` bucket, oldest bucket first"""
+    return fold(tagged(user, transaction_type, date_from, date_to, tags).annotate(
+        period=GRANULARITIES[granularity]('date')
+    ).values('period', 'tag_id', 'tag__name', 'account__currency').annotate(
+        total=Sum('amount')
+    ).order_by('period', 'tag__name'), ('period', 'tag_id', 'tag__name'), ('total',), currency or user_currency(user),
+        date_key='period')
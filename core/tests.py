@@ -1,3 +1,1708 @@
-from django.test import TestCase
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import unittest
+import unittest.mock
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.contrib.auth import get_user_model
+from django.db import connection, connections
+from django.db.models import Count, Sum
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import reverse
+from django.utils import timezone
+
+from . import (
+    analytics, bulk, cache, categories, charts, columnar, dashboard, forecast, fx, goals, instrumentation, jobs, ledger,
+    recurring, reporting, rollups, search, tags,
+)
+from .importers import import_file, parse_json, parse_ofx
+from .budgets import evaluate_budgets
+from .dashboard import dashboard_context
+from .forms import AccountForm, RecurringTransactionForm
+from .models import (
+    Account, Budget, Category, DailySummary, ExchangeRate, Goal, Job, RecurringTransaction, SearchToken, Tag,
+    Transaction, TransactionTag,
+)
+from .routers import ReplicaRouter, reading_from_replica, replica_reads
+
+
+# Worker thread and replica connections cannot see the data of a test's open transaction
+@override_settings(CORE_CONCURRENT_QUERIES=False, CORE_READ_REPLICA=None)
+class CoreTestCase(TestCase):
+    """Shared fixtures: one user with an account and a couple of categories"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user(username='alice', password='secret')
+        cls.account = Account.objects.create(user=cls.user, name='Checking', account_type='BANK')
+        cls.groceries = Category.objects.create(user=cls.user, name='Groceries')
+        cls.salary = Category.objects.create(user=cls.user, name='Salary')
+
+    def setUp(self):
+        # Cached fragments must not leak between tests that reuse primary keys
+        cache.get_cache().clear()
+        cache.reset_stats()
+
+    def add_transaction(self, amount, transaction_type='EXPENSE', category=None, day=None, **kwargs):
+        return Transaction.objects.create(
+            user=self.user,
+            account=kwargs.pop('account', self.account),
+            category=category if category is not None else self.groceries,
+            amount=Decimal(amount),
+            transaction_type=transaction_type,
+            description=kwargs.pop('description', 'Test'),
+            date=day or date.today(),
+            **kwargs
+        )
+
+
+class DailySummaryTests(CoreTestCase):
+
+    def assertRollupsMatchTransactions(self):
+        expected = {
+            (row['date'], row['account_id'], row['category_id'], row['transaction_type']): (row['total'], row['n'])
+            for row in Transaction.objects.order_by().values(
+                'date', 'account_id', 'category_id', 'transaction_type'
+            ).annotate(total=Sum('amount'), n=Count('id'))
+        }
+        actual = {
+            (row.date, row.account_id, row.category_id, row.transaction_type): (row.amount, row.count)
+            for row in DailySummary.objects.exclude(count=0)
+        }
+        self.assertEqual(actual, expected)
+
+    def test_create_update_delete_keep_buckets_in_sync(self):
+        first = self.add_transaction('10.00')
+        self.add_transaction('5.50')
+        income = self.add_transaction('100.00', 'INCOME', category=self.salary)
+        self.assertRollupsMatchTransactions()
+
+        first.amount = Decimal('12.00')
+        first.category = self.salary
+        first.save()
+        self.assertRollupsMatchTransactions()
+
+        income.delete()
+        self.assertRollupsMatchTransactions()
+
+    def test_deleting_category_moves_buckets_to_uncategorised(self):
+        self.add_transaction('10.00')
+        self.add_transaction('7.00', category=self.salary)
+        self.groceries.delete()
+        self.assertRollupsMatchTransactions()
+
+    def test_rebuild_matches_incremental_maintenance(self):
+        self.add_transaction('10.00')
+        self.add_transaction('3.00', day=date(2024, 1, 31))
+        DailySummary.objects.all().delete()
+        self.assertEqual(rollups.rebuild(user=self.user), 2)
+        self.assertRollupsMatchTransactions()
+
+    def test_chart_data_reads_rollups(self):
+        self.add_transaction('10.00')
+        self.add_transaction('20.00', 'INCOME', category=self.salary)
+        self.client.force_login(self.user)
+
+        response = self.client.get(reverse('core:transaction_chart_data'))
+
+        self.assertEqual(response.status_code, 200)
+        # Buckets without data are filled in; today's is the last one
+        row = response.json()[-1]
+        self.assertEqual(Decimal(row['income']), Decimal('20.00'))
+        self.assertEqual(Decimal(row['expenses']), Decimal('10.00'))
+
+
+class BudgetEvaluationTests(CoreTestCase):
+
+    def add_budget(self, amount, category=None, period='MONTHLY', **kwargs):
+        return Budget.objects.create(
+            user=self.user,
+            category=category,
+            name=kwargs.pop('name', 'Budget'),
+            amount=Decimal(amount),
+            period=period,
+            start_date=kwargs.pop('start_date', date(2024, 1, 1)),
+            **kwargs
+        )
+
+    def test_spend_is_limited_to_current_period(self):
+        budget = self.add_budget('100.00', self.groceries)
+        self.add_transaction('30.00', day=date(2024, 3, 5))
+        self.add_transaction('50.00', day=date(2024, 2, 20))
+        self.add_transaction('9.00', category=self.salary, day=date(2024, 3, 6))
+
+        [progress] = evaluate_budgets(self.user, today=date(2024, 3, 15))
+
+        self.assertEqual(progress['budget'], budget)
+        self.assertEqual(progress['period_start'], date(2024, 3, 1))
+        self.assertEqual(progress['period_end'], date(2024, 3, 31))
+        self.assertEqual(progress['spent'], Decimal('30.00'))
+        self.assertEqual(progress['remaining'], Decimal('70.00'))
+        self.assertEqual(progress['percentage'], Decimal('30'))
+
+    def test_rollover_carries_unspent_amounts(self):
+        self.add_budget('100.00', self.groceries, rollover=True)
+        self.add_transaction('80.00', day=date(2024, 1, 10))
+        self.add_transaction('130.00', day=date(2024, 2, 10))
+        self.add_transaction('10.00', day=date(2024, 3, 2))
+
+        [progress] = evaluate_budgets(self.user, today=date(2024, 3, 15))
+
+        # Jan leaves 20, Feb overspends by 30: 100 + 20 - 30 = 90 available in March
+        self.assertEqual(progress['limit'], Decimal('90.00'))
+        self.assertEqual(progress['remaining'], Decimal('80.00'))
+
+    def test_month_end_anchors_do_not_drift(self):
+        self.add_budget('100.00', self.groceries, start_date=date(2026, 1, 31), rollover=True)
+        self.add_transaction('40.00', day=date(2026, 2, 27))
+        self.add_transaction('25.00', day=date(2026, 3, 29))
+
+        [progress] = evaluate_budgets(self.user, today=date(2026, 3, 29))
+
+        self.assertEqual((progress['period_start'], progress['period_end']), (date(2026, 2, 28), date(2026, 3, 30)))
+        self.assertEqual(progress['spent'], Decimal('25.00'))
+        # January's period (Jan 31 - Feb 27) left 60 unspent
+        self.assertEqual(progress['limit'], Decimal('160.00'))
+
+    def test_budget_without_category_caps_all_spending(self):
+        self.add_budget('50.00', period='WEEKLY')
+        self.add_transaction('10.00', day=date(2024, 1, 8))
+        self.add_transaction('15.00', category=self.salary, day=date(2024, 1, 9))
+
+        [progress] = evaluate_budgets(self.user, today=date(2024, 1, 10))
+
+        self.assertEqual(progress['period_start'], date(2024, 1, 8))
+        self.assertEqual(progress['spent'], Decimal('25.00'))
+
+    def test_expired_budgets_are_skipped(self):
+        self.add_budget('50.00', self.groceries, end_date=date(2024, 1, 31))
+        self.assertEqual(evaluate_budgets(self.user, today=date(2024, 3, 1)), [])
+
+    def test_query_count_does_not_grow_with_budgets(self):
+        today = date.today()
+        self.add_transaction('10.00', day=today)
+        self.add_budget('100.00', self.groceries, start_date=today - timedelta(days=40))
+        with self.assertNumQueries(2):
+            evaluate_budgets(self.user, today)
+
+        for i in range(39):
+            self.add_budget('100.00', self.salary, name=f'Budget {i}', start_date=today - timedelta(days=40))
+        with self.assertNumQueries(2):
+            self.assertEqual(len(evaluate_budgets(self.user, today)), 40)
+
+    def test_progress_api_query_count_is_constant(self):
+        self.client.force_login(self.user)
+        today = date.today()
+        self.add_budget('100.00', self.groceries, start_date=today)
+        url = reverse('core:budget_progress_data')
+
+        with self.assertNumQueries(4) as single:
+            self.client.get(url)
+        for i in range(20):
+            self.add_budget('100.00', self.salary, name=f'Budget {i}', start_date=today)
+        with self.assertNumQueries(len(single.captured_queries)):
+            response = self.client.get(url)
+
+        self.assertEqual(len(response.json()), 21)
+
+
+class LedgerTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.savings = Account.objects.create(
+            user=self.user, name='Savings', account_type='SAVINGS', balance=Decimal('50.00')
+        )
+
+    def assertBalance(self, account, expected):
+        account.refresh_from_db()
+        self.assertEqual(account.balance, Decimal(expected))
+
+    def test_edits_apply_only_the_difference(self):
+        expense = self.add_transaction('10.00')
+        self.assertBalance(self.account, '-10.00')
+
+        expense.amount = Decimal('25.00')
+        expense.save()
+        self.assertBalance(self.account, '-25.00')
+
+        expense.transaction_type = 'INCOME'
+        expense.save()
+        self.assertBalance(self.account, '25.00')
+
+        expense.account = self.savings
+        expense.save()
+        self.assertBalance(self.account, '0.00')
+        self.assertBalance(self.savings, '75.00')
+
+    def test_delete_reverses_the_transaction(self):
+        expense = self.add_transaction('10.00')
+        expense.delete()
+        self.assertBalance(self.account, '0.00')
+
+    def test_transfers_move_money_between_accounts(self):
+        transfer = self.add_transaction('20.00', 'TRANSFER', transfer_account=self.savings)
+        self.assertBalance(self.account, '-20.00')
+        self.assertBalance(self.savings, '70.00')
+
+        transfer.status = 'CANCELLED'
+        transfer.save()
+        self.assertBalance(self.account, '0.00')
+        self.assertBalance(self.savings, '50.00')
+
+    def test_recompute_repairs_drifted_balances(self):
+        self.add_transaction('10.00')
+        self.add_transaction('20.00', 'TRANSFER', transfer_account=self.savings)
+        Account.objects.update(balance=Decimal('999.00'))
+
+        self.assertEqual(ledger.recompute_balances(), 2)
+        self.assertBalance(self.account, '-30.00')
+        self.assertBalance(self.savings, '70.00')
+
+    def test_account_edits_keep_concurrent_balance_changes(self):
+        self.client.force_login(self.user)
+        stale = Account.objects.get(pk=self.savings.pk)
+        self.add_transaction('20.00', 'INCOME', account=self.savings)
+        form = AccountForm({
+            'name': 'Rainy day', 'account_type': 'SAVINGS', 'opening_balance': '50.00', 'currency': 'USD',
+        }, instance=stale)
+        self.assertTrue(form.is_valid(), form.errors)
+        form.save()
+        self.assertBalance(self.savings, '70.00')
+
+        response = self.client.post(reverse('core:edit_account', args=[self.savings.pk]), {
+            'name': 'Rainy day', 'account_type': 'SAVINGS', 'opening_balance': '60.00', 'currency': 'USD',
+        })
+
+        self.assertEqual(response.status_code, 302)
+        self.assertBalance(self.savings, '80.00')
+        self.assertEqual(ledger.recompute_balances(), 0)
+
+
+class ExportTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def test_transactions_export_streams_and_handles_missing_category(self):
+        self.add_transaction('10.00', description='Lunch')
+        uncategorised = self.add_transaction('4.00', description='Parking')
+        uncategorised.category = None
+        uncategorised.save()
+
+        response = self.client.get(reverse('core:export_transactions'))
+
+        self.assertTrue(response.streaming)
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Date,Category,Account,Type,Amount,Description')
+        self.assertEqual(len(lines), 3)
+        self.assertIn(',,Checking,EXPENSE,4.00,Parking', lines[1] + lines[2])
+
+    def test_transactions_export_filters_and_gzip(self):
+        self.add_transaction('10.00', day=date(2024, 1, 5))
+        self.add_transaction('20.00', day=date(2024, 2, 5))
+
+        response = self.client.get(reverse('core:export_transactions'), {
+            'date_from': '2024-02-01',
+            'gzip': '1',
+        })
+
+        self.assertEqual(response['Content-Type'], 'application/gzip')
+        lines = gzip.decompress(b''.join(response.streaming_content)).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('20.00', lines[1])
+
+    def test_exports_apply_the_search(self):
+        self.add_transaction('10.00', description='Coffee beans')
+        self.add_transaction('15.00', description='Bus pass')
+
+        response = self.client.get(reverse('core:export_transactions'), {'q': 'coffee'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 2)
+        self.assertIn('Coffee beans', lines[1])
+
+        response = self.client.get(reverse('core:export_report', args=['expense']), {'q': 'coffee'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        category, total = lines[1].split(',')
+        self.assertEqual((category, Decimal(total)), ('Groceries', Decimal('10.00')))
+
+    def test_report_export(self):
+        self.add_transaction('10.00')
+        self.add_transaction('15.00')
+
+        response = self.client.get(reverse('core:export_report', args=['expense']))
+
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Category,Total Expenses')
+        category, total = lines[1].split(',')
+        self.assertEqual((category, Decimal(total)), ('Groceries', Decimal('25.00')))
+        self.assertEqual(self.client.get(reverse('core:export_report', args=['bogus'])).status_code, 404)
+
+
+class BackgroundJobTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_root = override_settings(MEDIA_ROOT=media.name)
+        media_root.enable()
+        self.addCleanup(media_root.disable)
+
+    def download(self, job):
+        response = self.client.get(job['download_url'])
+        return b''.join(response.streaming_content)
+
+    def test_exports_run_off_the_request_path(self):
+        self.add_transaction('10.00', day=date(2024, 1, 5))
+        self.add_transaction('20.00', day=date(2024, 2, 5))
+        params = {'date_from': '2024-01-01', 'date_to': '2024-12-31'}
+
+        response = self.client.get(reverse('core:export_transactions'), {**params, 'background': '1', 'gzip': '1'})
+        self.assertEqual(response.status_code, 202)
+        transactions_job = response.json()
+        self.assertEqual((transactions_job['status'], transactions_job['download_url']), ('PENDING', None))
+        report_job = self.client.get(
+            reverse('core:export_report', args=['cash-flow']), {**params, 'granularity': 'month', 'background': '1'}
+        ).json()
+
+        call_command('run_jobs', workers=0, once=True, stdout=io.StringIO())
+
+        transactions_job = self.client.get(transactions_job['url']).json()
+        self.assertEqual((transactions_job['status'], transactions_job['progress']), ('COMPLETED', 100))
+        self.assertEqual(transactions_job['rows'], 2)
+        synchronous = self.client.get(reverse('core:export_transactions'), params)
+        self.assertEqual(
+            gzip.decompress(self.download(transactions_job)), b''.join(synchronous.streaming_content)
+        )
+
+        report_job = self.client.get(report_job['url']).json()
+        lines = self.download(report_job).decode().splitlines()
+        self.assertEqual(lines[0], 'Date,Income,Expenses')
+        self.assertEqual(len(lines), 13)
+
+    def test_failures_and_ownership(self):
+        job = jobs.enqueue(self.user, 'REPORT', {'report_type': 'bogus'})
+        self.assertEqual(jobs.claim(5), [job.pk])
+        self.assertEqual(jobs.claim(5), [])
+        with self.assertLogs('core.jobs', 'ERROR'):
+            self.assertEqual(jobs.run(job.pk), 'FAILED')
+        job.refresh_from_db()
+        self.assertIn('Unknown report type', job.error)
+        self.assertEqual(self.client.get(reverse('core:download_job', args=[job.pk])).status_code, 404)
+
+        other = get_user_model().objects.create_user(username='bob', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(reverse('core:job_status', args=[job.pk])).status_code, 404)
+
+    def test_jobs_abandoned_by_a_dead_worker_fail(self):
+        abandoned = jobs.enqueue(self.user, 'TRANSACTIONS', {})
+        running = jobs.enqueue(self.user, 'TRANSACTIONS', {})
+        jobs.claim(2)
+        Job.objects.filter(pk=abandoned.pk).update(
+            started_at=timezone.now() - timedelta(seconds=jobs.timeout() + 1)
+        )
+
+        call_command('run_jobs', workers=0, once=True, stdout=io.StringIO())
+
+        abandoned.refresh_from_db()
+        running.refresh_from_db()
+        self.assertEqual((abandoned.status, running.status), ('FAILED', 'RUNNING'))
+        self.assertIn('worker stopped', abandoned.error)
+
+
+@unittest.skipUnless(columnar.available(), 'PyArrow is not installed')
+class ColumnarExportTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.add_transaction('10.00', description='Lunch', day=date(2024, 1, 5), tags=['Work'])
+        self.add_transaction('2500.00', 'INCOME', category=self.salary, day=date(2024, 1, 31))
+        for day in range(1, 6):
+            self.add_transaction('1.25', description='Coffee', day=date(2024, 2, day))
+
+    def test_parquet_and_arrow_exports(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        response = self.client.get(reverse('core:export_transactions'), {'format': 'parquet', 'date_to': '2024-01-31'})
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.parquet"')
+        table = pq.read_table(io.BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(table.column('amount').to_pylist(), [Decimal('2500.00'), Decimal('10.00')])
+        self.assertEqual(table.column('tags').to_pylist(), [None, ['Work']])
+
+        # Several record batches still make one file
+        batches = columnar.record_batches(self.user, batch_size=2)
+        table = pa.ipc.open_file(b''.join(columnar.stream(batches, 'arrow'))).read_all()
+        self.assertEqual(table.num_rows, 7)
+        self.assertEqual(table.column('date').to_pylist()[0], date(2024, 2, 5))
+        self.assertEqual(table.column('category').to_pylist()[-1], 'Groceries')
+
+        self.assertEqual(self.client.get(reverse('core:export_transactions'), {'format': 'xlsx'}).status_code, 400)
+
+    def test_malformed_stored_tags_are_normalized(self):
+        coffee = Transaction.objects.filter(description='Coffee').order_by('date')
+        Transaction.objects.filter(pk=coffee[0].pk).update(tags='Work, Travel')
+        Transaction.objects.filter(pk=coffee[1].pk).update(tags=[7, 'Travel', None])
+        Transaction.objects.filter(pk=coffee[2].pk).update(tags=3)
+
+        table = columnar.pa.Table.from_batches(list(columnar.record_batches(self.user)))
+
+        tags_by_day = dict(zip(table.column('date').to_pylist(), table.column('tags').to_pylist()))
+        self.assertEqual(tags_by_day[date(2024, 2, 1)], ['Work', 'Travel'])
+        self.assertEqual(tags_by_day[date(2024, 2, 2)], ['7', 'Travel'])
+        self.assertEqual(tags_by_day[date(2024, 2, 3)], ['3'])
+
+    def test_snapshots_and_background_jobs(self):
+        with tempfile.TemporaryDirectory() as media, self.settings(MEDIA_ROOT=media):
+            call_command('snapshot_transactions', user='alice', batch_size=3, stdout=io.StringIO())
+            table = columnar.open_snapshot(columnar.snapshot_path(self.user.pk))
+            self.assertEqual(table.num_rows, 7)
+            self.assertEqual(sum(table.column('amount').to_pylist()), Decimal('2516.25'))
+
+            job = self.client.get(reverse('core:export_transactions'), {'format': 'arrow', 'background': '1'}).json()
+            call_command('run_jobs', workers=0, once=True, stdout=io.StringIO())
+            response = self.client.get(self.client.get(job['url']).json()['download_url'])
+            self.assertEqual(response['Content-Disposition'], 'attachment; filename="transactions.arrow"')
+            self.assertEqual(columnar.pa.ipc.open_file(b''.join(response.streaming_content)).read_all().num_rows, 7)
+
+
+class ImportTests(CoreTestCase):
+
+    CSV = (
+        'date,amount,description,category\n'
+        '2024-01-02,-12.50,Coffee beans,Groceries\n'
+        '2024-01-02,-12.50,Coffee beans,Groceries\n'
+        '2024-01-03,1000.00,Payroll,Salary\n'
+        '2024-01-04,-30.00,Bus pass,Transport\n'
+        'not-a-date,-1.00,Broken,\n'
+    )
+
+    def test_csv_import_updates_balances_and_rollups_once(self):
+        result = import_file(self.user, io.StringIO(self.CSV), 'csv', account=self.account)
+
+        self.assertEqual((result['created'], result['duplicates'], result['failed']), (4, 0, 1))
+        self.assertTrue(Category.objects.filter(user=self.user, name='Transport').exists())
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('945.00'))
+        self.assertEqual(
+            DailySummary.objects.get(date=date(2024, 1, 2)).count, 2
+        )
+
+    def test_reimport_skips_duplicates(self):
+        import_file(self.user, io.StringIO(self.CSV), 'csv', account=self.account)
+        result = import_file(self.user, io.StringIO(self.CSV), 'csv', account=self.account)
+
+        self.assertEqual((result['created'], result['duplicates']), (0, 4))
+        self.assertEqual(Transaction.objects.count(), 4)
+
+    def test_ofx_and_json_parsers(self):
+        ofx = (
+            '<OFX><BANKTRANLIST>\n<STMTTRN>\n<TRNTYPE>DEBIT\n<DTPOSTED>20240105120000\n'
+            '<TRNAMT>-42.10\n<FITID>abc123\n<NAME>Hardware store\n</STMTTRN>\n</BANKTRANLIST></OFX>\n'
+        )
+        self.assertEqual(list(parse_ofx(io.StringIO(ofx))), [{
+            'date': '20240105120000',
+            'amount': '-42.10',
+            'external_id': 'abc123',
+            'description': 'Hardware store',
+        }])
+
+        array = '[{"date": "2024-01-01", "amount": 5}, {"date": "2024-01-02", "amount": 6}]'
+        lines = '{"date": "2024-01-01", "amount": 5}\n{"date": "2024-01-02", "amount": 6}\n'
+        for document in (array, lines):
+            self.assertEqual([r['amount'] for r in parse_json(io.StringIO(document), chunk_size=7)], [5, 6])
+
+    def test_json_records_of_any_shape_fail_per_record(self):
+        document = json.dumps([
+            {'date': '2024-01-02', 'amount': -5, 'account': 'Checking', 'category': 7, 'tags': 3},
+            {'date': '2024-01-02', 'amount': -5, 'account': 42},
+            {'date': '2024-01-02', 'amount': 5, 'type': ['INCOME']},
+            {'date': '2024-01-02', 'amount': 'NaN', 'description': 9},
+            'not an object',
+        ])
+
+        result = import_file(self.user, io.StringIO(document), 'json', account=self.account)
+
+        self.assertEqual((result['created'], result['failed']), (1, 4))
+        transaction = Transaction.objects.get()
+        self.assertEqual((transaction.category.name, transaction.tags), ('7', ['3']))
+
+    def test_command_rejects_files_that_are_not_utf8(self):
+        with tempfile.NamedTemporaryFile(suffix='.csv') as statement:
+            statement.write('date,amount\n2024-01-02,-5.00,Café\n'.encode('latin-1'))
+            statement.flush()
+            with self.assertRaisesMessage(CommandError, 'is not UTF-8 text'):
+                call_command('import_transactions', statement.name, user=self.user.username, account='Checking')
+
+    def test_upload_endpoint(self):
+        self.client.force_login(self.user)
+        upload = SimpleUploadedFile('statement.csv', self.CSV.encode())
+
+        response = self.client.post(reverse('core:import_transactions'), {
+            'file': upload,
+            'account': self.account.pk,
+        })
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['failed'], 1)
+        self.assertEqual(response.json()['errors'], ['Record 5: Invalid date \'not-a-date\''])
+
+
+class RecurringSchedulerTests(CoreTestCase):
+
+    def add_recurrence(self, frequency, start_date, **kwargs):
+        return RecurringTransaction.objects.create(
+            user=self.user,
+            account=self.account,
+            category=self.groceries,
+            amount=Decimal(kwargs.pop('amount', '10.00')),
+            description='Subscription',
+            frequency=frequency,
+            start_date=start_date,
+            **kwargs
+        )
+
+    def test_missed_occurrences_are_materialized(self):
+        monthly = self.add_recurrence('MONTHLY', date(2024, 1, 31))
+        weekly = self.add_recurrence('WEEKLY', date(2024, 3, 1), end_date=date(2024, 3, 10))
+
+        self.assertEqual(recurring.process_due(date(2024, 4, 15)), (2, 5))
+
+        self.assertEqual(
+            list(monthly.transaction_set.order_by('date').values_list('date', flat=True)),
+            [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31)],
+        )
+        monthly.refresh_from_db()
+        self.assertEqual((monthly.last_processed, monthly.next_due), (date(2024, 3, 31), date(2024, 4, 30)))
+        weekly.refresh_from_db()
+        self.assertEqual(weekly.status, 'COMPLETED')
+
+        self.account.refresh_from_db()
+        self.assertEqual(self.account.balance, Decimal('-50.00'))
+        self.assertEqual(
+            DailySummary.objects.filter(date=date(2024, 2, 29)).values_list('amount', 'count').get(),
+            (Decimal('10.00'), 1),
+        )
+
+    def test_processing_is_idempotent(self):
+        self.add_recurrence('DAILY', date(2024, 1, 1))
+        recurring.process_due(date(2024, 1, 10))
+        self.assertEqual(recurring.process_due(date(2024, 1, 10)), (0, 0))
+        self.assertEqual(Transaction.objects.count(), 10)
+
+    def test_batches_cover_all_due_recurrences(self):
+        for _ in range(5):
+            self.add_recurrence('YEARLY', date(2023, 6, 1))
+        self.assertEqual(recurring.process_due(date(2024, 6, 1), batch_size=2), (5, 10))
+
+    def test_transfers_reach_their_destination(self):
+        savings = Account.objects.create(user=self.user, name='Savings', account_type='SAVINGS')
+        form = RecurringTransactionForm({
+            'account': self.account.pk, 'transaction_type': 'TRANSFER', 'amount': '100.00',
+            'description': 'Savings plan', 'frequency': 'MONTHLY', 'start_date': '2024-01-01', 'status': 'ACTIVE',
+        }, user=self.user)
+        self.assertIn('transfer_account', form.errors)
+
+        self.add_recurrence('MONTHLY', date(2024, 1, 1), transaction_type='TRANSFER', transfer_account=savings)
+        recurring.process_due(date(2024, 2, 15))
+
+        self.assertEqual(savings.incoming_transfers.count(), 2)
+        savings.refresh_from_db()
+        self.account.refresh_from_db()
+        self.assertEqual((self.account.balance, savings.balance), (Decimal('-20.00'), Decimal('20.00')))
+        self.assertEqual(ledger.recompute_balances(), 0)
+
+
+class DashboardCacheTests(CoreTestCase):
+
+    def test_repeat_loads_are_served_from_cache(self):
+        today = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_transaction('10.00')
+
+        first = dashboard_context(self.user, today)
+        with self.assertNumQueries(0):
+            second = dashboard_context(self.user, today)
+
+        self.assertEqual(second['monthly_expenses'], first['monthly_expenses'])
+        self.assertEqual(cache.stats()['hits'], 8)
+
+    def test_writes_invalidate_the_users_fragments(self):
+        today = date.today()
+        dashboard_context(self.user, today)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_transaction('10.00')
+
+        context = dashboard_context(self.user, today)
+        self.assertEqual(context['monthly_expenses'], Decimal('10.00'))
+        self.assertEqual(len(context['recent_transactions']), 1)
+
+    def test_currency_changes_are_not_served_from_cache(self):
+        today = date.today()
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.create(currency='EUR', date=today, rate=Decimal('0.5'))
+            fx.rates_changed()
+        self.account.balance = Decimal('10.00')
+        self.account.save()
+        self.assertEqual(dashboard_context(self.user, today)['total_balance'], Decimal('10.00'))
+        version = dashboard.widget_version(self.user, today, 'summary')
+
+        # Nothing bumps the data version when only the display currency changes
+        self.user.currency = 'EUR'
+        context = dashboard_context(self.user, today)
+        self.assertEqual((context['currency'], context['total_balance']), ('EUR', Decimal('5.00')))
+        self.assertNotEqual(dashboard.widget_version(self.user, today, 'summary'), version)
+
+    def test_widgets_are_rendered_and_cached_separately(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_transaction('10.00', description='Coffee beans')
+
+        # The page itself reads no data: only the session and the user
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('core:dashboard'))
+        self.assertContains(response, reverse('core:dashboard_widget', args=['recent_transactions']))
+        for name in dashboard.WIDGETS:
+            self.assertEqual(self.client.get(reverse('core:dashboard_widget', args=[name])).status_code, 200)
+        self.assertEqual(self.client.get(reverse('core:dashboard_widget', args=['nope'])).status_code, 404)
+
+        url = reverse('core:dashboard_widget', args=['recent_transactions'])
+        cache.get_cache().clear()
+        response = self.client.get(url)
+        self.assertContains(response, 'Coffee beans')
+        etag = response.headers['ETag']
+        # Cached HTML: the widget's data is not even read
+        with self.assertNumQueries(2):
+            self.assertContains(self.client.get(url), 'Coffee beans')
+        self.assertEqual(self.client.get(url, headers={'If-None-Match': etag}).status_code, 304)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_transaction('4.00', description='Croissant')
+        response = self.client.get(url, headers={'If-None-Match': etag})
+        self.assertContains(response, 'Croissant')
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('core:cache_stats_data')).status_code, 302)
+
+        self.user.is_staff = True
+        self.user.save()
+        response = self.client.get(reverse('core:cache_stats_data'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_rate', response.json())
+
+
+class TransactionPaginationTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        for day in range(1, 8):
+            for _ in range(2):
+                self.add_transaction('1.00', day=date(2024, 1, day))
+
+    def collect(self, **params):
+        url = reverse('core:transaction_list_data')
+        pages = []
+        response = self.client.get(url, dict(params, page_size=4)).json()
+        pages.append(response)
+        while response['next']:
+            response = self.client.get(url, dict(params, page_size=4, after=response['next'])).json()
+            pages.append(response)
+        return pages
+
+    def test_cursors_walk_every_row_once_in_order(self):
+        pages = self.collect()
+
+        ids = [row['id'] for page in pages for row in page['results']]
+        expected = list(Transaction.objects.order_by('-date', '-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+        self.assertEqual([len(page['results']) for page in pages], [4, 4, 4, 2])
+        self.assertIsNone(pages[0]['previous'])
+
+        # Stepping back from the second page returns the first one
+        response = self.client.get(reverse('core:transaction_list_data'), {
+            'page_size': 4, 'before': pages[1]['previous'],
+        }).json()
+        self.assertEqual(response['results'], pages[0]['results'])
+        self.assertIsNone(response['previous'])
+
+    def test_filters_and_no_count_or_offset(self):
+        pages = self.collect(date_from='2024-01-06')
+        self.assertEqual(sum(len(page['results']) for page in pages), 4)
+
+        deep = self.collect()[-1]
+        with self.assertNumQueries(3) as queries:
+            self.client.get(reverse('core:transaction_list_data'), {'page_size': 4, 'after': deep['previous']})
+        sql = ' '.join(query['sql'] for query in queries.captured_queries).upper()
+        self.assertNotIn('COUNT(', sql)
+        self.assertNotIn('OFFSET', sql)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('core:transaction_list_data'), {'after': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_list_page_renders(self):
+        response = self.client.get(reverse('core:transaction_list'), {'page_size': 5})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['transactions']), 5)
+        self.assertIn('after=', response.content.decode())
+
+
+class SearchTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.coffee = self.add_transaction('3.50', description='Starbucks coffee', tags=['Work', 'Café', 'Coffee'], category=self.salary)
+        self.beans = self.add_transaction('12.00', description='Coffee beans', category=self.groceries)
+        self.fuel = self.add_transaction('40.00', description='Fuel', tags=['Road trip'])
+        other = get_user_model().objects.create_user(username='bob')
+        Transaction.objects.create(
+            user=other, account=Account.objects.create(user=other, name='Other'),
+            amount=Decimal('1.00'), transaction_type='EXPENSE', description='coffee', date=date(2024, 1, 1),
+        )
+
+    def ids(self, query, **kwargs):
+        return {transaction.pk for transaction in search.search(self.user, query, **kwargs)}
+
+    def check_queries(self):
+        self.assertEqual(self.ids('coffee'), {self.coffee.pk, self.beans.pk})
+        self.assertEqual(self.ids('star*'), {self.coffee.pk})
+        self.assertEqual(self.ids('COFFEE tag:work'), {self.coffee.pk})
+        self.assertEqual(self.ids('#cafe'), {self.coffee.pk})
+        self.assertEqual(self.ids('', tags=['road trip']), {self.fuel.pk})
+        self.assertEqual(self.ids('coffee tea'), set())
+
+        # Edits, bulk writes and deletes keep the index current
+        self.beans.description = 'Tea leaves'
+        self.beans.save()
+        self.assertEqual(self.ids('coffee'), {self.coffee.pk})
+        imported = import_file(self.user, io.StringIO('date,amount,description\n2024-02-01,-2.00,Coffee refill\n'), 'csv', account=self.account)
+        self.assertEqual(imported['created'], 1)
+        self.assertEqual(len(self.ids('coffee')), 2)
+        self.coffee.delete()
+        self.assertEqual(len(self.ids('coffee')), 1)
+
+    def test_fts5_backend(self):
+        self.assertEqual(search.backend(), 'fts5')
+        self.check_queries()
+
+    @override_settings(CORE_SEARCH_BACKEND='tokens')
+    def test_token_backend(self):
+        search.rebuild()
+        self.check_queries()
+
+    def test_search_api_and_list_filter(self):
+        response = self.client.get(reverse('core:search_transactions'), {'q': 'coff*'})
+        results = response.json()['results']
+        self.assertEqual([row['id'] for row in results][0], self.coffee.pk)  # Matching the tags as well ranks higher
+        self.assertEqual(len(results), 2)
+        self.assertEqual(self.client.get(reverse('core:search_transactions')).status_code, 400)
+
+        response = self.client.get(reverse('core:transaction_list_data'), {'q': 'coffee', 'category': self.groceries.pk})
+        self.assertEqual([row['id'] for row in response.json()['results']], [self.beans.pk])
+
+
+class TagIndexTests(CoreTestCase):
+
+    def assertIndexMatchesTransactions(self):
+        expected = sorted(
+            (transaction.pk, name.casefold(), transaction.date, transaction.amount)
+            for transaction in Transaction.objects.filter(user=self.user)
+            for name in tags.tag_names(transaction.tags)
+        )
+        actual = sorted(TransactionTag.objects.values_list('transaction_id', 'tag__key', 'date', 'amount'))
+        self.assertEqual(actual, expected)
+
+    def test_index_follows_writes(self):
+        lunch = self.add_transaction('12.50', tags=['Work', 'food', 'work '])
+        self.add_transaction('30.00', tags=['Food'])
+        self.add_transaction('5.00')
+        self.assertEqual(list(Tag.objects.values_list('name', flat=True)), ['food', 'Work'])
+        self.assertIndexMatchesTransactions()
+
+        lunch.tags = ['Travel']
+        lunch.amount = Decimal('20.00')
+        lunch.save()
+        self.assertIndexMatchesTransactions()
+
+        lunch.delete()
+        self.assertIndexMatchesTransactions()
+
+        imported = import_file(self.user, io.StringIO(
+            'date,amount,description,tags\n2024-02-01,-2.00,Bus,"travel; work"\n'
+        ), 'csv', account=self.account)
+        self.assertEqual(imported['created'], 1)
+        self.assertIndexMatchesTransactions()
+
+    def test_rebuild_backfills_existing_rows(self):
+        self.add_transaction('12.50', tags=['Work'])
+        Transaction.objects.bulk_create([
+            Transaction(user=self.user, account=self.account, amount=Decimal('7.00'), transaction_type='EXPENSE',
+                        description='Legacy', date=date(2024, 1, 1), tags=['Legacy', 'Work']),
+        ])
+        self.assertEqual(tags.rebuild(), 2)
+        self.assertIndexMatchesTransactions()
+
+    def test_tag_spending_api_and_report(self):
+        self.client.force_login(self.user)
+        today = date.today()
+        self.add_transaction('12.50', tags=['Work', 'Food'], day=today)
+        self.add_transaction('30.00', tags=['Food'], day=today)
+        self.add_transaction('99.00', tags=['Food'], day=today - timedelta(days=90))
+        self.add_transaction('1000.00', 'INCOME', category=self.salary, tags=['Work'], day=today)
+
+        with self.assertNumQueries(4):
+            response = self.client.get(reverse('core:tag_spending_data'))
+        totals = {row['tag__name']: (Decimal(str(row['total'])), row['transactions']) for row in response.json()['totals']}
+        self.assertEqual(totals, {'Food': (Decimal('42.5'), 2), 'Work': (Decimal('12.5'), 1)})
+        self.assertEqual(len(response.json()['trend']), 2)
+
+        response = self.client.get(reverse('core:tag_spending_data'), {'type': 'income'})
+        self.assertEqual([row['tag__name'] for row in response.json()['totals']], ['Work'])
+        self.assertEqual(self.client.get(reverse('core:tag_spending_data'), {'type': 'bogus'}).status_code, 400)
+
+        response = self.client.get(reverse('core:export_report', args=['tags']))
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], 'Tag,Total Expenses,Transactions')
+        self.assertTrue(lines[1].startswith('Food,42.5'))
+
+
+class CategoryTreeTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.food = Category.objects.create(user=self.user, name='Food')
+        self.groceries.parent = self.food
+        self.groceries.save()
+        self.fruit = Category.objects.create(user=self.user, name='Fruit', parent=self.groceries)
+        self.dining = Category.objects.create(user=self.user, name='Dining', parent=self.food)
+
+    def assertPathsMatchParents(self):
+        stored = dict(Category.objects.values_list('pk', 'path'))
+        categories.rebuild()
+        self.assertEqual(dict(Category.objects.values_list('pk', 'path')), stored)
+
+    def test_paths_follow_moves_and_deletes(self):
+        self.fruit.refresh_from_db()
+        self.assertEqual(self.fruit.depth, 2)
+        self.assertTrue(self.fruit.path.startswith(self.food.path))
+        self.assertPathsMatchParents()
+
+        # Moving a category moves its whole subtree
+        self.groceries.parent = self.dining
+        self.groceries.save()
+        self.fruit.refresh_from_db()
+        self.assertEqual(self.fruit.depth, 3)
+        self.assertPathsMatchParents()
+
+        self.food.refresh_from_db()
+        self.food.parent = self.fruit
+        with self.assertRaises(categories.TreeError):
+            self.food.save()
+
+        Category.objects.get(pk=self.food.pk).delete()
+        self.dining.refresh_from_db()
+        self.assertEqual((self.dining.parent, self.dining.depth), (None, 0))
+        self.assertPathsMatchParents()
+
+    def test_reports_and_budgets_include_subcategories(self):
+        self.client.force_login(self.user)
+        today = date.today()
+        self.add_transaction('10.00', category=self.fruit, day=today)
+        self.add_transaction('20.00', category=self.groceries, day=today)
+        self.add_transaction('5.00', category=self.dining, day=today)
+        self.add_transaction('7.00', category=self.food, day=today)
+
+        with self.assertNumQueries(4):
+            data = self.client.get(reverse('core:category_chart_data')).json()
+        self.assertEqual([(row['category__name'], Decimal(str(row['total']))) for row in data], [('Food', Decimal('42'))])
+
+        data = self.client.get(reverse('core:category_chart_data'), {'parent': self.food.pk}).json()
+        self.assertEqual(
+            [(row['category_id'], Decimal(str(row['total']))) for row in data],
+            [(self.groceries.pk, Decimal('30')), (self.food.pk, Decimal('7')), (self.dining.pk, Decimal('5'))]
+        )
+        self.assertEqual(self.client.get(reverse('core:category_chart_data'), {'parent': 'food'}).status_code, 400)
+
+        budget = Budget.objects.create(
+            user=self.user, category=self.groceries, name='Groceries', amount=Decimal('100'),
+            period='MONTHLY', start_date=today.replace(day=1),
+        )
+        [progress] = evaluate_budgets(self.user, today, budgets=[budget])
+        self.assertEqual(progress['spent'], Decimal('30'))
+
+        response = self.client.get(reverse('core:category_analysis', args=[self.groceries.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total'], Decimal('30'))
+        self.assertEqual([ancestor.name for ancestor in response.context['ancestors']], ['Food'])
+
+
+class CurrencyConversionTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.euros = Account.objects.create(user=self.user, name='Euro account', account_type='BANK', currency='EUR')
+        handle, path = tempfile.mkstemp(suffix='.csv')
+        with os.fdopen(handle, 'w') as stream:
+            stream.write('date,currency,rate\n2024-01-01,EUR,0.5\n2024-02-01,EUR,0.8\n')
+        self.addCleanup(os.remove, path)
+        call_command('load_fx_rates', path, stdout=io.StringIO())
+
+    def test_rates_are_looked_up_as_of_a_day_and_memoized(self):
+        self.assertEqual(fx.rate('EUR', 'USD', date(2024, 1, 15)), Decimal('2'))
+        self.assertEqual(fx.rate('EUR', 'USD', date(2025, 1, 1)), Decimal('1.25'))
+        self.assertEqual(fx.rate('USD', 'EUR', date(2023, 6, 1)), Decimal('0.5'))
+        with self.assertNumQueries(0):
+            fx.rate('EUR', 'USD', date(2024, 1, 15))
+
+        # Loading rates again invalidates what was memoized
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.filter(currency='EUR', date=date(2024, 1, 1)).update(rate=Decimal('0.25'))
+            fx.rates_changed()
+        self.assertEqual(fx.rate('EUR', 'USD', date(2024, 1, 15)), Decimal('4'))
+
+    def test_reports_convert_mixed_currency_totals(self):
+        today = date.today()
+        self.account.balance = Decimal('100.00')
+        self.account.save()
+        self.euros.balance = Decimal('80.00')
+        self.euros.save()
+        self.add_transaction('10.00', day=today)
+        self.add_transaction('8.00', account=self.euros, day=today)
+
+        context = dashboard_context(self.user, today)
+        # 90 USD plus 72 EUR at today's 1.25
+        self.assertEqual(context['total_balance'], Decimal('180.00'))
+        self.assertEqual(context['monthly_expenses'], Decimal('20.00'))
+
+        budget = Budget.objects.create(
+            user=self.user, category=self.groceries, name='Groceries', amount=Decimal('100'),
+            period='MONTHLY', start_date=today.replace(day=1),
+        )
+        with self.assertNumQueries(1):
+            [progress] = evaluate_budgets(self.user, today, budgets=[budget])
+        self.assertEqual(progress['spent'], Decimal('20.00'))
+
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('core:category_chart_data')).json()
+        self.assertEqual([Decimal(row['total']) for row in data], [Decimal('20.00')])
+
+
+    def test_missing_rates_leave_balances_unconverted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ExchangeRate.objects.all().delete()
+            fx.rates_changed()
+        self.euros.balance = Decimal('80.00')
+        self.euros.save()
+        self.client.force_login(self.user)
+
+        with self.assertLogs('core.fx', 'WARNING'):
+            self.assertEqual(dashboard_context(self.user, date.today())['total_balance'], Decimal('80.00'))
+        self.assertEqual(self.client.get(reverse('core:dashboard_widget', args=['summary'])).status_code, 200)
+
+
+class DashboardApiTests(CoreTestCase):
+
+    def test_combined_payload_matches_the_single_endpoints(self):
+        self.client.force_login(self.user)
+        today = date.today()
+        self.add_transaction('10.00', day=today)
+        self.add_transaction('50.00', 'INCOME', category=self.salary, day=today)
+        Budget.objects.create(
+            user=self.user, category=self.groceries, name='Groceries', amount=Decimal('100'),
+            period='MONTHLY', start_date=today.replace(day=1),
+        )
+
+        payload = self.client.get(reverse('core:dashboard_data')).json()
+        self.assertEqual(payload['transactions'], self.client.get(reverse('core:transaction_chart_data')).json())
+        self.assertEqual(payload['categories'], self.client.get(reverse('core:category_chart_data')).json())
+        self.assertEqual(payload['budgets'], self.client.get(reverse('core:budget_progress_data')).json())
+        self.assertEqual(payload['budgets'][0]['spent'], 10.0)
+        self.assertEqual(self.client.get(reverse('core:category_chart_data'), {'parent': 0}).status_code, 404)
+
+
+class ReportingTests(CoreTestCase):
+
+    def test_buckets_match_database_truncation(self):
+        self.assertEqual(reporting.truncate(date(2024, 5, 16), 'week'), date(2024, 5, 13))
+        self.assertEqual(reporting.truncate(date(2024, 5, 16), 'quarter'), date(2024, 4, 1))
+        self.assertEqual(
+            list(reporting.bucket_starts(date(2023, 11, 20), date(2024, 2, 1), 'month')),
+            [date(2023, 11, 1), date(2023, 12, 1), date(2024, 1, 1), date(2024, 2, 1)],
+        )
+        self.assertEqual(reporting.bucket_count(date(2023, 11, 20), date(2024, 2, 1), 'month'), 4)
+        self.assertEqual(reporting.bucket_count(date(2024, 1, 1), date(2024, 1, 31), 'day'), 31)
+
+    def test_multi_year_series_is_bucketed_and_gap_filled(self):
+        self.add_transaction('10.00', day=date(2022, 2, 3))
+        self.add_transaction('5.00', day=date(2022, 2, 28))
+        self.add_transaction('40.00', 'INCOME', category=self.salary, day=date(2022, 8, 15))
+        self.add_transaction('7.00', day=date(2024, 12, 31))
+
+        rows = charts.transaction_chart(self.user, date(2022, 1, 1), date(2024, 12, 31), 'quarter')
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(rows[0], {'date': date(2022, 1, 1), 'income': Decimal('0.00'), 'expenses': Decimal('15.00')})
+        self.assertEqual(rows[2]['income'], Decimal('40.00'))
+        self.assertEqual(rows[5], {'date': date(2023, 4, 1), 'income': Decimal('0.00'), 'expenses': Decimal('0.00')})
+        self.assertEqual(rows[-1]['expenses'], Decimal('7.00'))
+
+        self.client.force_login(self.user)
+        data = self.client.get(reverse('core:transaction_chart_data'), {
+            'date_from': '2022-01-01', 'date_to': '2024-12-31', 'granularity': 'year',
+        }).json()
+        self.assertEqual([row['date'] for row in data], ['2022-01-01', '2023-01-01', '2024-01-01'])
+        self.assertEqual([Decimal(row['expenses']) for row in data], [Decimal('15.00'), 0, Decimal('7.00')])
+
+        export = self.client.get(reverse('core:export_report', args=['cash-flow']), {
+            'date_from': '2022-01-01', 'date_to': '2022-12-31', 'granularity': 'month',
+        })
+        lines = b''.join(export.streaming_content).decode().splitlines()
+        self.assertEqual(len(lines), 13)
+        self.assertEqual(lines[2], '2022-02-01,0.00,15.00')
+
+    def test_invalid_ranges_are_rejected(self):
+        self.client.force_login(self.user)
+        url = reverse('core:transaction_chart_data')
+        self.assertEqual(self.client.get(url, {'date_from': '2024-02-01', 'date_to': '2024-01-01'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'granularity': 'decade'}).status_code, 400)
+        response = self.client.get(url, {'date_from': '2000-01-01', 'date_to': '2024-01-01', 'granularity': 'day'})
+        self.assertIn('granularity', response.json()['errors'])
+        self.assertEqual(self.client.get(url, {'date_from': '2000-01-01', 'granularity': 'month'}).status_code, 200)
+
+
+@unittest.skipUnless(forecast.available(), 'NumPy is not installed')
+class ForecastTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.today = date(2024, 1, 15)
+        self.savings = Account.objects.create(user=self.user, name='Savings', account_type='SAVINGS', balance=1000)
+        self.add_transaction('310.00', day=date(2023, 12, 1), account=self.savings)
+        # Materialized recurrences are not part of the seasonal history
+        self.add_transaction('100.00', 'INCOME', category=self.salary, day=date(2023, 12, 20),
+                             account=self.savings, is_recurring=True)
+        RecurringTransaction.objects.create(
+            user=self.user, account=self.savings, category=self.salary, amount=Decimal('100'),
+            transaction_type='INCOME', description='Salary', frequency='MONTHLY', start_date=date(2024, 2, 1),
+        )
+
+    def test_recurrences_and_seasonal_averages_are_projected(self):
+        result = forecast.forecast_users([self.user.pk], self.today, months=3)[self.user.pk]
+
+        self.assertEqual(result['dates'], [date(2024, 1, 31), date(2024, 2, 29), date(2024, 3, 31), date(2024, 4, 15)])
+        [savings] = [account for account in result['accounts'] if account['id'] == self.savings.pk]
+        self.assertEqual(savings['balance'], 790.0)
+        # December 2023 to today is the history; months without history use its overall average
+        overall = -310 / 46
+        expected = [790, 890 + 29 * overall, 990 + 60 * overall, 1090 + 75 * overall]
+        for projected, value in zip(savings['projection'], expected):
+            self.assertAlmostEqual(projected, value, places=2)
+        # The checking account has no balance and no flows
+        self.assertEqual(result['total'], savings['projection'])
+
+    def test_recurring_transfers_credit_their_destination(self):
+        RecurringTransaction.objects.create(
+            user=self.user, account=self.savings, transfer_account=self.account, amount=Decimal('40'),
+            transaction_type='TRANSFER', description='Allowance', frequency='MONTHLY', start_date=date(2024, 2, 1),
+        )
+
+        result = forecast.forecast_users([self.user.pk], self.today, months=3)[self.user.pk]
+
+        [checking] = [account for account in result['accounts'] if account['id'] == self.account.pk]
+        self.assertEqual(checking['projection'], [0.0, 40.0, 80.0, 120.0])
+
+    def test_forecast_is_cached_until_data_changes(self):
+        first = forecast.forecast(self.user, self.today, 12)
+        with self.assertNumQueries(0):
+            self.assertEqual(forecast.forecast(self.user, self.today, 12), first)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_transaction('50.00', day=self.today, account=self.savings)
+        self.assertNotEqual(forecast.forecast(self.user, self.today, 12), first)
+
+    def test_batch_precompute_and_api(self):
+        other = get_user_model().objects.create_user(username='bob')
+        Account.objects.create(user=other, name='Cash', account_type='CASH', balance=50)
+        with self.assertNumQueries(6):
+            results = forecast.forecast_users([self.user.pk, other.pk], self.today, months=60)
+        self.assertEqual(len(results[other.pk]['dates']), 61)
+        self.assertEqual(set(results[other.pk]['total']), {50.0})
+
+        today = date.today()
+        call_command('precompute_forecasts', months=24, stdout=io.StringIO())
+        with self.assertNumQueries(0):
+            forecast.forecast(other, today, 24)
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:forecast_data'), {'months': 999})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['months'], forecast.MAX_MONTHS)
+
+
+@unittest.skipUnless(analytics.available(), 'NumPy is not installed')
+class AnalyticsTests(CoreTestCase):
+
+    def test_category_trends_percentiles_and_anomalies(self):
+        dining = Category.objects.create(user=self.user, name='Dining')
+        for month, amount in enumerate(['90', '100', '110', '95', '105', '100'], start=1):
+            self.add_transaction(amount, day=date(2024, month, 10))
+        outlier = self.add_transaction('1000', day=date(2024, 6, 20))
+        self.add_transaction('20', category=dining, day=date(2024, 3, 1))
+        self.add_transaction('5', category=dining, day=date(2024, 3, 2), status='CANCELLED')
+
+        # Categories, transactions and the flagged transactions' details
+        with self.assertNumQueries(3):
+            result = analytics.category_statistics(self.user, 'EXPENSE', date(2024, 1, 1), date(2024, 6, 30))
+        groceries, dining_row = result['categories']
+        self.assertEqual((groceries['name'], groceries['total'], groceries['transactions']), ('Groceries', 1600.0, 7))
+        self.assertEqual((dining_row['name'], dining_row['total']), ('Dining', 20.0))
+        self.assertEqual([month['month'] for month in groceries['months']][:2], ['2024-01', '2024-02'])
+        february, march = groceries['months'][1:3]
+        self.assertEqual((february['change'], february['change_percent']), (10.0, 11.11))
+        self.assertEqual(march['rolling_average'], 100.0)
+        self.assertIsNone(groceries['months'][0]['change'])
+        self.assertEqual(groceries['percentiles'], {'p50': 100.0, 'p90': 466.0})
+        self.assertEqual([month['anomaly'] for month in groceries['months']], [False] * 5 + [True])
+        self.assertEqual([row['id'] for row in result['anomalies']], [outlier.pk])
+
+        self.add_transaction('30')
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:category_analysis', args=[self.groceries.pk]))
+        self.assertEqual(response.context['analytics']['categories'][0]['category_id'], self.groceries.pk)
+        response = self.client.get(reverse('core:category_analysis_data'), {'category': dining.pk, 'months': 999})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['categories'][0]['name'], 'Dining')
+        response = self.client.get(reverse('core:category_analysis_data'), {'category': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_account_flows_and_month_end_balances(self):
+        savings = Account.objects.create(user=self.user, name='Savings', account_type='SAVINGS')
+        self.add_transaction('1000', 'INCOME', category=self.salary, day=date(2024, 1, 10))
+        self.add_transaction('200', day=date(2024, 1, 20))
+        self.add_transaction('300', 'TRANSFER', day=date(2024, 2, 5), transfer_account=savings)
+        self.add_transaction('50', day=date(2024, 2, 15))
+        # After the period: only moves the balance back
+        self.add_transaction('25', day=date(2024, 4, 1))
+        self.account.refresh_from_db()
+
+        result = analytics.account_statistics(self.account, date(2024, 1, 1), date(2024, 3, 31))
+        self.assertEqual(result['balance'], 425.0)
+        self.assertEqual(
+            [(month['income'], month['expenses'], month['transfers'], month['balance']) for month in result['months']],
+            [(1000.0, 200.0, 0.0, 800.0), (0.0, 50.0, -300.0, 450.0), (0.0, 0.0, 0.0, 450.0)]
+        )
+        self.assertEqual(result['months'][1]['expense_change_percent'], -75.0)
+        self.assertEqual(result['months'][2]['rolling_expenses'], 83.33)
+        self.assertEqual(result['percentiles'], {'p50': 125.0, 'p90': 185.0})
+
+        savings.refresh_from_db()
+        result = analytics.account_statistics(savings, date(2024, 1, 1), date(2024, 3, 31))
+        self.assertEqual([month['balance'] for month in result['months']], [0.0, 300.0, 300.0])
+
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('core:account_summary', args=[self.account.pk]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['summary']['months']), analytics.DEFAULT_MONTHS)
+        response = self.client.get(reverse('core:account_summary_data', args=[savings.pk]), {'months': 3})
+        self.assertEqual(len(response.json()['months']), 3)
+        other = Account.objects.create(user=get_user_model().objects.create_user(username='bob'), name='Cash',
+                                       account_type='CASH')
+        self.assertEqual(self.client.get(reverse('core:account_summary_data', args=[other.pk])).status_code, 404)
+
+
+class GoalProgressTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.today = date.today()
+        self.savings = Account.objects.create(user=self.user, name='Savings', account_type='SAVINGS')
+        self.account_goal = Goal.objects.create(
+            user=self.user, name='Rainy day', description='', target_amount=Decimal('300'),
+            goal_type='SAVINGS', priority='HIGH', account=self.savings, start_date=self.today - timedelta(days=10),
+            deadline=self.today + timedelta(days=30),
+        )
+        self.holiday = Category.objects.create(user=self.user, name='Holiday fund')
+        self.flights = Category.objects.create(user=self.user, name='Flights', parent=self.holiday)
+        self.category_goal = Goal.objects.create(
+            user=self.user, name='Holiday', description='', target_amount=Decimal('1000'),
+            goal_type='SAVINGS', priority='LOW', category=self.holiday, start_date=self.today - timedelta(days=10),
+        )
+
+    def current(self, goal):
+        goal.refresh_from_db()
+        return goal.current_amount
+
+    def test_progress_follows_transaction_writes(self):
+        self.add_transaction('500.00', 'INCOME', day=self.today - timedelta(days=20), account=self.savings)
+        income = self.add_transaction('100.00', 'INCOME', account=self.savings)
+        expense = self.add_transaction('30.00', category=self.flights, account=self.savings)
+        self.add_transaction('25.00', 'TRANSFER', transfer_account=self.savings)
+        self.assertEqual(self.current(self.account_goal), Decimal('95.00'))
+        self.assertEqual(self.current(self.category_goal), Decimal('30.00'))
+
+        expense.amount = Decimal('40.00')
+        expense.category = self.groceries
+        expense.save()
+        self.assertEqual(self.current(self.account_goal), Decimal('85.00'))
+        self.assertEqual(self.current(self.category_goal), Decimal('0.00'))
+
+        income.delete()
+        self.assertEqual(self.current(self.account_goal), Decimal('-15.00'))
+
+        Goal.objects.update(current_amount=0)
+        self.assertEqual(goals.recompute(user=self.user), 2)
+        self.assertEqual(self.current(self.account_goal), Decimal('-15.00'))
+        self.assertEqual(self.current(self.category_goal), Decimal('0.00'))
+
+    def test_category_moves_and_deletes_recount_ancestor_goals(self):
+        trips = Category.objects.create(user=self.user, name='Trips')
+        trips_goal = Goal.objects.create(
+            user=self.user, name='Trips', description='', target_amount=Decimal('500'),
+            goal_type='SAVINGS', priority='LOW', category=trips, start_date=self.today - timedelta(days=10),
+        )
+        self.add_transaction('30.00', category=self.flights)
+        self.assertEqual(self.current(self.category_goal), Decimal('30.00'))
+
+        self.flights.parent = trips
+        self.flights.save()
+        self.assertEqual(self.current(self.category_goal), Decimal('0.00'))
+        self.assertEqual(self.current(trips_goal), Decimal('30.00'))
+
+        self.flights.parent = self.holiday
+        self.flights.save()
+        trips.parent = self.holiday
+        trips.save()
+        self.add_transaction('20.00', category=trips)
+        self.assertEqual(self.current(self.category_goal), Decimal('50.00'))
+
+        # Its transactions become uncategorised, its child a root
+        trips.delete()
+        self.assertEqual(self.current(self.category_goal), Decimal('30.00'))
+
+    def test_bulk_writes_and_relinking(self):
+        RecurringTransaction.objects.create(
+            user=self.user, account=self.savings, category=self.flights, amount=Decimal('20'),
+            description='Holiday savings', frequency='DAILY', start_date=self.today - timedelta(days=4),
+        )
+        recurring.process_due(self.today)
+        self.assertEqual(self.current(self.category_goal), Decimal('100.00'))
+        self.assertEqual(self.current(self.account_goal), Decimal('-100.00'))
+
+        # Linking a goal counts the history from its start date
+        self.category_goal.category = self.flights
+        self.category_goal.start_date = self.today - timedelta(days=1)
+        self.category_goal.save()
+        self.assertEqual(self.category_goal.current_amount, Decimal('40.00'))
+
+        call_command('recompute_goals', user='alice', stdout=io.StringIO())
+        self.assertEqual(self.current(self.category_goal), Decimal('40.00'))
+
+    def test_eta_and_dashboard(self):
+        Goal.objects.filter(pk=self.account_goal.pk).update(current_amount=Decimal('100'))
+        self.account_goal.refresh_from_db()
+        result = goals.progress(self.account_goal, self.today)
+        self.assertEqual(result['percentage'], Decimal('33.33'))
+        self.assertEqual(result['eta'], self.today + timedelta(days=21))
+        self.assertTrue(result['on_track'])
+        self.assertEqual(result['required_monthly'], Decimal('200.00'))
+        self.assertIsNone(goals.progress(self.category_goal, self.today)['eta'])
+
+        with self.assertNumQueries(1):
+            fragment = dashboard.goals_fragment(self.user, self.today)
+        self.assertEqual(
+            {row['goal'].name: row['percentage'] for row in fragment['active_goals']},
+            {'Rainy day': Decimal('33.33'), 'Holiday': Decimal('0.00')},
+        )
+
+
+class BulkOperationTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+        self.today = date.today()
+        self.savings = Account.objects.create(user=self.user, name='Savings', account_type='SAVINGS')
+        self.goal = Goal.objects.create(
+            user=self.user, name='Rainy day', description='', target_amount=Decimal('500'), goal_type='SAVINGS',
+            priority='HIGH', category=self.salary, start_date=self.today - timedelta(days=30),
+        )
+        self.coffee = self.add_transaction('4.50', description='Coffee beans', tags=['Food'])
+        self.lunch = self.add_transaction('12.00', description='Lunch', day=self.today - timedelta(days=1))
+        self.transfer = self.add_transaction('50.00', 'TRANSFER', transfer_account=self.savings)
+        self.pay = self.add_transaction('200.00', 'INCOME', category=self.salary, account=self.savings)
+
+    def bulk(self, **payload):
+        return self.client.post(reverse('core:bulk_transactions'), json.dumps(payload), content_type='application/json')
+
+    def derived(self):
+        return (
+            dict(Account.objects.values_list('pk', 'balance')),
+            sorted(DailySummary.objects.exclude(count=0).values_list(
+                'date', 'account_id', 'category_id', 'transaction_type', 'amount', 'count'
+            )),
+            dict(Goal.objects.values_list('pk', 'current_amount')),
+            sorted(TransactionTag.objects.values_list('transaction_id', 'tag__key')),
+        )
+
+    def assertDerivedDataConsistent(self):
+        incremental = self.derived()
+        ledger.recompute_balances()
+        rollups.rebuild()
+        goals.recompute()
+        tags.rebuild()
+        self.assertEqual(incremental, self.derived())
+
+    def test_recategorize_and_set_status(self):
+        response = self.bulk(operation='recategorize', ids=[self.coffee.pk, self.lunch.pk], category=self.salary.pk)
+        self.assertEqual(response.json(), {'operation': 'recategorize', 'transactions': 2, 'accounts': 0})
+        self.assertEqual(Transaction.objects.filter(category=self.salary).count(), 3)
+        self.assertDerivedDataConsistent()
+
+        response = self.bulk(operation='set_status', filter={'account': self.account.pk}, status='CANCELLED')
+        self.assertEqual(response.json(), {'operation': 'set_status', 'transactions': 3, 'accounts': 2})
+        self.assertDerivedDataConsistent()
+
+    def test_retag_and_delete_by_search(self):
+        response = self.bulk(operation='retag', filter={'q': 'coffee'}, tags=['Work', 'Travel'])
+        self.assertEqual(response.json()['transactions'], 1)
+        self.coffee.refresh_from_db()
+        self.assertEqual(self.coffee.tags, ['Work', 'Travel'])
+        self.assertEqual([t.pk for t in search.search(self.user, 'tag:travel')], [self.coffee.pk])
+        self.assertDerivedDataConsistent()
+
+        # Deleting bypasses the per-row signals: they must not apply a second time
+        response = self.bulk(operation='delete', filter={'q': 'tag:work'})
+        self.assertEqual(response.json(), {'operation': 'delete', 'transactions': 1, 'accounts': 1})
+        response = self.bulk(operation='delete', ids=[self.transfer.pk, self.pay.pk])
+        self.assertEqual(response.json(), {'operation': 'delete', 'transactions': 2, 'accounts': 2})
+        self.assertEqual(list(Transaction.objects.values_list('pk', flat=True)), [self.lunch.pk])
+        self.assertEqual(search.search(self.user, 'coffee'), [])
+        self.assertDerivedDataConsistent()
+
+    @override_settings(CORE_SEARCH_BACKEND='tokens')
+    def test_delete_in_chunks_cleans_the_token_index(self):
+        search.rebuild()
+        with unittest.mock.patch.object(bulk, 'DELETE_CHUNK_SIZE', 1):
+            response = self.bulk(operation='delete', filter={'account': self.account.pk})
+        self.assertEqual(response.json()['transactions'], 3)
+        self.assertEqual(set(SearchToken.objects.values_list('transaction_id', flat=True)), {self.pay.pk})
+        self.assertFalse(TransactionTag.objects.exists())
+        self.assertDerivedDataConsistent()
+
+    def test_validation_and_ownership(self):
+        self.assertEqual(self.bulk(operation='delete').status_code, 400)
+        self.assertEqual(self.bulk(operation='explode', ids=[self.coffee.pk]).status_code, 400)
+        self.assertEqual(self.bulk(operation='set_status', ids=[self.coffee.pk]).status_code, 400)
+        self.assertEqual(self.bulk(operation='delete', ids='all').status_code, 400)
+        self.assertEqual(self.client.post(
+            reverse('core:bulk_transactions'), 'nope', content_type='application/json'
+        ).status_code, 400)
+
+        other = get_user_model().objects.create_user(username='bob', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.bulk(operation='delete', ids=[self.coffee.pk]).json()['transactions'], 0)
+        self.assertEqual(Transaction.objects.count(), 4)
+
+
+class InstrumentationTests(CoreTestCase):
+
+    def setUp(self):
+        super().setUp()
+        instrumentation.reset_stats()
+        self.client.force_login(self.user)
+
+    def test_requests_are_recorded_per_view(self):
+        self.add_transaction('10.00')
+        with self.assertLogs('core.instrumentation', 'INFO') as logs:
+            response = self.client.get(reverse('core:transaction_chart_data'))
+        self.assertIn('db;dur=', response['Server-Timing'])
+        record = logs.records[-1].instrumentation
+        self.assertEqual(record['view'], 'core:transaction_chart_data')
+        self.assertGreater(record['queries'], 0)
+        self.assertEqual(record['bytes'], len(response.content))
+
+        export = self.client.get(reverse('core:export_transactions'))
+        size = len(b''.join(export.streaming_content))
+
+        stats = instrumentation.stats()
+        self.assertEqual(stats['core:transaction_chart_data']['requests'], 1)
+        self.assertEqual(sum(stats['core:transaction_chart_data']['latency'].values()), 1)
+        self.assertEqual(stats['core:export_transactions']['bytes'], size)
+        self.assertGreater(stats['core:export_transactions']['queries'], 0)
+
+    def test_repeated_statements_are_flagged(self):
+        def looping_view(request):
+            for category in Category.objects.filter(user=self.user):
+                list(Transaction.objects.filter(category=category))
+            return HttpResponse('ok')
+
+        middleware = instrumentation.InstrumentationMiddleware(looping_view)
+        for number in range(12):
+            Category.objects.create(user=self.user, name=f'Category {number}')
+        with self.assertLogs('core.instrumentation', 'WARNING') as logs:
+            middleware(RequestFactory().get('/loop/'))
+        self.assertIn('Possible N+1 in unresolved: 14 queries', logs.output[0])
+        self.assertEqual(instrumentation.stats()['unresolved']['n_plus_one'], 1)
+        self.assertEqual(
+            instrumentation.shape("SELECT 1 FROM t WHERE id IN (1, 2, 3) AND name = 'x'"),
+            'SELECT ? FROM t WHERE id IN (...) AND name = ?',
+        )
+
+    def test_stats_endpoint_is_staff_only(self):
+        self.assertEqual(self.client.get(reverse('core:instrumentation_data')).status_code, 302)
+        self.user.is_staff = True
+        self.user.save()
+        self.client.get(reverse('core:budget_progress_data'))
+        self.assertIn('core:budget_progress_data', self.client.get(reverse('core:instrumentation_data')).json())
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', 'The plans checked are SQLite query plans')
+class QueryPlanTests(CoreTestCase):
+
+    def assertUsesIndex(self, queryset, index):
+        self.assertIn(f'USING INDEX {index} ', queryset.explain())
+
+    def test_hot_queries_use_their_indexes(self):
+        since = date(2024, 1, 1)
+        transactions = Transaction.objects.filter(user=self.user)
+        self.assertUsesIndex(transactions.order_by('-date', '-created_at'), 'transaction_user_date')
+        # Aggregates, which drop the default ordering
+        transactions = transactions.order_by()
+        self.assertUsesIndex(
+            transactions.filter(transaction_type='EXPENSE', date__gte=since), 'transaction_user_type_date'
+        )
+        self.assertUsesIndex(transactions.filter(category=self.groceries, date__gte=since), 'transaction_user_cat_date')
+        self.assertUsesIndex(
+            Transaction.objects.filter(account=self.account, date__gte=since).order_by(), 'transaction_account_date'
+        )
+
+        summaries = DailySummary.objects.filter(user=self.user).order_by()
+        self.assertUsesIndex(
+            summaries.filter(transaction_type='EXPENSE', date__gte=since), 'dailysummary_user_type_date'
+        )
+        self.assertUsesIndex(summaries.filter(category=self.groceries, date__gte=since), 'dailysummary_user_cat_date')
+
+        self.assertUsesIndex(
+            RecurringTransaction.objects.filter(status='ACTIVE', next_due__lte=since), 'recurring_status_next_due'
+        )
+        self.assertUsesIndex(
+            RecurringTransaction.objects.filter(user=self.user, status='ACTIVE', next_due__gte=since),
+            'recurring_user_status_due'
+        )
+        self.assertUsesIndex(
+            Budget.objects.filter(user=self.user, start_date__lte=since, end_date__gte=since), 'budget_user_dates'
+        )
+        self.assertUsesIndex(Goal.objects.filter(user=self.user, status='ACTIVE'), 'goal_user_status')
+
+
+class BenchmarkTests(CoreTestCase):
+
+    def test_seed_and_profile_views(self):
+        call_command('seed_benchmark_data', users=2, transactions=300, years=1, prefix='bench', stdout=io.StringIO())
+        user = get_user_model().objects.get(username='bench-1')
+        self.assertEqual(Transaction.objects.filter(user=user).count(), 300)
+        self.assertTrue(Category.objects.filter(user=user, depth=1).exists())
+        self.assertTrue(TransactionTag.objects.filter(user=user).exists())
+        self.assertEqual(DailySummary.objects.filter(user=user).aggregate(count=Sum('count'))['count'], 300)
+        with self.assertRaises(CommandError):
+            call_command('seed_benchmark_data', users=1, transactions=10, prefix='bench', stdout=io.StringIO())
+
+        # The benchmark client talks to 'localhost', which DEBUG allows outside tests
+        with tempfile.TemporaryDirectory() as directory, self.settings(ALLOWED_HOSTS=['localhost']):
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_queries', user='bench-1', repeat=1, view=['dashboard_data', 'export_cash_flow'],
+                output=output, stdout=io.StringIO(),
+            )
+            with open(output) as stream:
+                results = json.load(stream)
+        self.assertEqual(results['transactions'], 300)
+        self.assertEqual(set(results['views']), {'dashboard_data', 'export_cash_flow'})
+        self.assertEqual({view['status'] for view in results['views'].values()}, {200})
+        # The dashboard's builders run on the request's connection, so all of their queries count
+        self.assertGreater(results['views']['dashboard_data']['queries'], 5)
+        self.assertGreater(results['views']['dashboard_data']['rows'], 0)
+
+    def test_seeded_data_is_visible_to_every_view(self):
+        views = ['category_chart_data', 'budget_progress_data', 'cash_flow', 'expense_summary', 'income_summary']
+        with tempfile.TemporaryDirectory() as directory, self.settings(ALLOWED_HOSTS=['localhost']):
+            output = os.path.join(directory, 'results.json')
+            call_command(
+                'benchmark_queries', transactions=300, repeat=1, view=views, output=output, stdout=io.StringIO(),
+            )
+            with open(output) as stream:
+                results = json.load(stream)['views']
+            self.assertEqual({view['status'] for view in results.values()}, {200})
+            self.assertGreater(results['category_chart_data']['rows'], 0)
+            self.assertGreater(results['budget_progress_data']['rows'], 0)
+            # Rolled back
+            self.assertFalse(Transaction.objects.exclude(user=self.user).exists())
+
+            # A user without data fails the benchmark rather than profiling empty responses
+            with self.assertRaisesMessage(CommandError, 'category_chart_data returned no rows'):
+                call_command('benchmark_queries', user='alice', repeat=1, view=['category_chart_data'],
+                             stdout=io.StringIO())
+
+
+@override_settings(CORE_READ_REPLICA='replica')
+class ReplicaRoutingTests(SimpleTestCase):
+
+    def test_router_sends_only_flagged_reads_to_the_replica(self):
+        router = ReplicaRouter()
+        self.assertIsNone(router.db_for_read(Transaction))
+        with reading_from_replica():
+            self.assertEqual(router.db_for_read(Transaction), 'replica')
+            self.assertEqual(router.db_for_write(Transaction), 'default')
+        self.assertIsNone(router.db_for_read(Transaction))
+        self.assertFalse(router.allow_migrate('replica', 'core'))
+        self.assertIsNone(router.allow_migrate('default', 'core'))
+
+        with override_settings(CORE_READ_REPLICA=None), reading_from_replica():
+            self.assertIsNone(router.db_for_read(Transaction))
+
+    def test_decorated_views_route_their_worker_threads(self):
+        router = ReplicaRouter()
+
+        @replica_reads
+        def view(request):
+            return HttpResponse(router.db_for_read(Transaction))
+
+        @replica_reads
+        async def async_view(request):
+            aliases = await charts.fan_out({'worker': lambda: router.db_for_read(Transaction)})
+            return HttpResponse(aliases['worker'])
+
+        request = RequestFactory().get('/')
+        self.assertEqual(view(request).content, b'replica')
+        self.assertEqual(async_to_sync(async_view)(request).content, b'replica')
+        self.assertIsNone(router.db_for_read(Transaction))
+
+
+@override_settings(CORE_READ_REPLICA='replica', CORE_CONCURRENT_QUERIES=False)
+class SQLiteReplicaTests(TransactionTestCase):
+    # A second SQLite file as the 'replica' alias, filled by sync_replica; added
+    # before setUpClass, so '__all__' covers it
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        directory = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(directory.cleanup)
+        default = connections.settings['default']
+        connections.settings['replica'] = {
+            **default, 'NAME': os.path.join(directory.name, 'replica.sqlite3'), 'TEST': {**default['TEST'], 'NAME': None},
+        }
+        cls.addClassCleanup(cls.remove_replica)
+        super().setUpClass()
+
+    @classmethod
+    def remove_replica(cls):
+        connections['replica'].close()
+        del connections['replica']
+        del connections.settings['replica']
+
+    def setUp(self):
+        self.user = get_user_model().objects.create_user(username='erin')
+        self.account = Account.objects.create(user=self.user, name='Checking', account_type='BANK')
+        self.client.force_login(self.user)
+
+    def spend(self, amount):
+        Transaction.objects.create(
+            user=self.user, account=self.account, amount=Decimal(amount), transaction_type='EXPENSE',
+            description='Lunch', date=date.today(),
+        )
+
+    def test_reports_read_the_synced_replica(self):
+        self.spend('12.00')
+        call_command('sync_replica', stdout=io.StringIO())
+        self.spend('8.00')
+        params = {'date_from': date.today().isoformat(), 'date_to': date.today().isoformat()}
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            [bucket] = self.client.get(reverse('core:transaction_chart_data'), params).json()
+        # The replica has not seen the second expense yet
+        self.assertEqual(Decimal(str(bucket['expenses'])), Decimal('12.00'))
+        self.assertTrue(replica.captured_queries)
+
+    @unittest.skipUnless(forecast.available(), 'NumPy is not installed')
+    def test_cached_results_are_built_on_the_primary(self):
+        self.spend('12.00')
+        call_command('sync_replica', stdout=io.StringIO())
+        self.spend('8.00')
+
+        with CaptureQueriesContext(connections['replica']) as replica:
+            data = self.client.get(reverse('core:forecast_data')).json()
+        [checking] = data['accounts']
+        self.assertEqual(checking['balance'], -20.0)
+        self.assertEqual(replica.captured_queries, [])
+
+
+class FanOutTests(SimpleTestCase):
+
+    def test_builders_run_concurrently(self):
+        # Every builder waits for the others: run one at a time, the barrier breaks
+        barrier = threading.Barrier(3, timeout=5)
+
+        def meet(value):
+            barrier.wait()
+            return value
+
+        results = async_to_sync(charts.fan_out)({name: (lambda name=name: meet(name)) for name in 'abc'})
+        self.assertEqual(results, {'a': 'a', 'b': 'b', 'c': 'c'})
+
+
+class ConcurrentDashboardApiTests(TransactionTestCase):
+    # Committed data is visible to the replica test mirror, when one is configured
+    databases = '__all__'
+
+    def test_worker_threads_read_committed_data(self):
+        user = get_user_model().objects.create_user(username='carol')
+        account = Account.objects.create(user=user, name='Checking', account_type='BANK')
+        Transaction.objects.create(
+            user=user, account=account, amount=Decimal('12.00'), transaction_type='EXPENSE',
+            description='Lunch', date=date.today(),
+        )
+        self.client.force_login(user)
+
+        payload = self.client.get(reverse('core:dashboard_data')).json()
+        self.assertEqual(Decimal(payload['transactions'][-1]['expenses']), Decimal('12.00'))
+        self.assertEqual(payload['budgets'], [])
+
+    def test_worker_thread_queries_are_instrumented(self):
+        user = get_user_model().objects.create_user(username='dave')
+        self.client.force_login(user)
+        counts = {}
+        for concurrent in (True, False):
+            with self.settings(CORE_CONCURRENT_QUERIES=concurrent), \
+                    self.assertLogs('core.instrumentation', 'INFO') as logs:
+                self.client.get(reverse('core:dashboard_data'))
+            counts[concurrent] = logs.records[-1].instrumentation['queries']
+        self.assertEqual(counts[True], counts[False])
+
+        async def count_view(request):
+            return HttpResponse(str(await charts.in_thread(Account.objects.count)()))
+
+        middleware = instrumentation.InstrumentationMiddleware(count_view)
+        self.assertTrue(iscoroutinefunction(middleware))
+        with self.assertLogs('core.instrumentation', 'INFO') as logs:
+            response = async_to_sync(middleware)(RequestFactory().get('/count/'))
+        self.assertEqual(response.content, b'0')
+        self.assertEqual(logs.records[-1].instrumentation['queries'], 1)
@@ -7,10 +7,11 @@ app_name = 'core'
 urlpatterns = [
     # Dashboard
     path('', views.dashboard, name='dashboard'),
+    path('dashboard/<slug:name>/', views.dashboard_widget, name='dashboard_widget'),
     
     
     # Transactions
-    # path('transactions/', views.transaction_list, name='transaction_list'),
+    path('transactions/', views.transaction_list, name='transaction_list'),
     # path('transactions/add/', views.add_transaction, name='add_transaction'),
     # path('transactions/<int:pk>/edit/', views.edit_transaction, name='edit_transaction'),
     # path('transactions/<int:pk>/delete/', views.delete_transaction, name='delete_transaction'),
@@ -18,14 +19,14 @@ urlpatterns = [
     # Accounts
     path('accounts/', views.account_list, name='account_list'),
     path('accounts/add/', views.add_account, name='add_account'),
-    # path('accounts/<int:account_id>/', views.account_summary, name='account_summary'),
+    path('accounts/<int:account_id>/', views.account_summary, name='account_summary'),
     path('accounts/<int:pk>/edit/', views.edit_account, name='edit_account'),
     path('accounts/<int:pk>/delete/', views.delete_account, name='delete_account'),
     
     # Categories
     path('categories/', views.category_list, name='category_list'),
     path('categories/add/', views.add_category, name='add_category'),
-    # path('categories/<int:category_id>/analysis/', views.category_analysis, name='category_analysis'),
+    path('categories/<int:category_id>/analysis/', views.category_analysis, name='category_analysis'),
     path('categories/<int:pk>/edit/', views.edit_category, name='edit_category'),
     path('categories/<int:pk>/delete/', views.delete_category, name='delete_category'),
     
@@ -48,9 +49,20 @@ urlpatterns = [
     path('reports/cash-flow/', views.cash_flow, name='cash_flow'),
     
     # API endpoints for AJAX requests
+    path('api/transactions/', views.transaction_list_data, name='transaction_list_data'),
+    path('api/transactions/search/', views.search_transactions, name='search_transactions'),
+    path('api/dashboard/', views.dashboard_data, name='dashboard_data'),
     path('api/transactions/chart-data/', views.transaction_chart_data, name='transaction_chart_data'),
     path('api/categories/chart-data/', views.category_chart_data, name='category_chart_data'),
+    path('api/tags/spending/', views.tag_spending_data, name='tag_spending_data'),
     path('api/budget/progress/', views.budget_progress_data, name='budget_progress_data'),
+    path('api/forecast/', views.forecast_data, name='forecast_data'),
+    path('api/categories/analysis/', views.category_analysis_data, name='category_analysis_data'),
+    path('api/accounts/<int:account_id>/summary/', views.account_summary_data, name='account_summary_data'),
+    path('api/transactions/bulk/', views.bulk_transactions, name='bulk_transactions'),
+    path('api/transactions/import/', views.import_transactions, name='import_transactions'),
+    path('api/cache/stats/', views.cache_stats_data, name='cache_stats_data'),
+    path('api/instrumentation/', views.instrumentation_data, name='instrumentation_data'),
     
     # User Profile and Settings
     path('profile/', views.user_profile, name='user_profile'),
@@ -60,4 +72,6 @@ urlpatterns = [
     # Export functionality
     path('export/transactions/', views.export_transactions, name='export_transactions'),
     path('export/report/<str:report_type>/', views.export_report, name='export_report'),
+    path('api/jobs/<int:pk>/', views.job_status, name='job_status'),
+    path('jobs/<int:pk>/download/', views.download_job, name='download_job'),
 ]   
\ No newline at end of file
@@ -1,136 +1,206 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import aget_object_or_404, render, redirect, get_object_or_404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
-from django.http import HttpResponse, JsonResponse
-from django.db.models import Sum, Q,Count
+from django.http import FileResponse, Http404, JsonResponse
+from django.db.models import Sum
+from django.urls import reverse
 from django.utils import timezone
-from datetime import datetime, timedelta
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import quote_etag
+from datetime import timedelta
 import csv
+import io
+from functools import partial
 import json
-from .models import Account, Transaction, Category, Budget, Goal
+from .models import Account, Transaction, Category, Budget, Goal, DailySummary, Job
+from .cache import stats as cache_stats
+from .instrumentation import stats as instrumentation_stats
+from .dashboard import WIDGETS, widget_context, widget_version
+from .exports import REPORT_TYPES, TRANSACTION_HEADER, csv_response, filter_transactions, report_rows, transaction_rows
 from .forms import AccountForm, CategoryForm, UserProfileForm, UserSettingsForm ,GoalForm ,BudgetForm# Add these forms
+from .forms import BulkOperationForm, ReportRangeForm, TransactionFilterForm, TransactionImportForm
+from .importers import StatementError, detect_format, import_file
+from .pagination import InvalidCursor, keyset_page, page_size
+from . import analytics, bulk, cache, charts, columnar, forecast, jobs, search, tags
+from .categories import subtree, subtree_totals
+from .fx import convert, fold, user_currency
+from .reporting import series
+from .routers import replica_reads
 from django.db.models.functions import TruncMonth
 
 @login_required
 def dashboard(request):
-    # Get current date and first day of current month
+    """View for the dashboard page; its widgets are fetched from dashboard_widget after first paint"""
+    context = {
+        'current_month': timezone.now().date().strftime('%B %Y'),
+    }
+    return render(request, 'core/dashboard.html', context)
+
+@login_required
+def dashboard_widget(request, name):
+    """View for one server-rendered dashboard widget, cached as HTML until the user's data changes"""
+    if name not in WIDGETS:
+        raise Http404('Unknown dashboard widget')
     today = timezone.now().date()
-    first_day_of_month = today.replace(day=1)
-    
-    # Account Summary
-    accounts = Account.objects.filter(
-        user=request.user,
-        is_archived=False
-    ).annotate(
-        transaction_count=Count('transaction')
-    )
-    total_balance = accounts.aggregate(total=Sum('balance'))['total'] or 0
-    
-    # Monthly Summary
-    monthly_transactions = Transaction.objects.filter(
-        user=request.user,
-        date__gte=first_day_of_month,
-        date__lte=today
+    version = widget_version(request.user, today, name)
+    
+    # Browsers revalidate with the version and get a 304 while nothing changed
+    etag = quote_etag(version)
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        context = {
+            # Only built when the cached HTML is missing
+            'widget': SimpleLazyObject(partial(widget_context, request.user, today, name)),
+            'version': version,
+            'cache_alias': cache.alias(),
+            'cache_timeout': cache.timeout(),
+        }
+        response = render(request, f'core/dashboard/{name}.html', context)
+    response.headers['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+def _transaction_page(request, queryset, form):
+    """Apply the filter form and keyset pagination from the query string"""
+    filters = form.cleaned_data if form.is_valid() else {}
+    queryset = filter_transactions(request.user, queryset, filters)
+    return keyset_page(
+        queryset,
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        size=page_size(request.GET.get('page_size'))
     )
-    
-    monthly_income = monthly_transactions.filter(
-        transaction_type='INCOME'
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    monthly_expenses = monthly_transactions.filter(
-        transaction_type='EXPENSE'
-    ).aggregate(total=Sum('amount'))['total'] or 0
-    
-    # Recent Transactions
-    recent_transactions = Transaction.objects.filter(
+
+@login_required
+def transaction_list(request):
+    """View for listing transactions, one keyset page at a time"""
+    transactions = Transaction.objects.filter(
         user=request.user
-    ).select_related('account', 'category')[:5]
+    ).select_related('account', 'category')
     
-    # Budget Progress
-    active_budgets = Budget.objects.filter(
-        user=request.user,
-        start_date__lte=today
-    ).select_related('category')
+    form = TransactionFilterForm(request.GET or None, user=request.user)
+    try:
+        page, next_cursor, previous_cursor = _transaction_page(request, transactions, form)
+    except InvalidCursor:
+        return redirect('core:transaction_list')
     
-    budget_progress = []
-    for budget in active_budgets:
-        spent = Transaction.objects.filter(
-            user=request.user,
-            category=budget.category,
-            date__gte=budget.start_date,
-            date__lte=today,
-            transaction_type='EXPENSE'
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        budget_progress.append({
-            'budget': budget,
-            'spent': spent,
-            'remaining': budget.amount - spent,
-            'percentage': (spent / budget.amount * 100) if budget.amount > 0 else 0
-        })
-    
-    # Goals Progress
-    active_goals = Goal.objects.filter(
-        user=request.user,
-        status='IN_PROGRESS'
-    )
-    
-    # Spending by Category (Last 30 days)
-    thirty_days_ago = today - timedelta(days=30)
-    category_spending = Transaction.objects.filter(
-        user=request.user,
-        transaction_type='EXPENSE',
-        date__gte=thirty_days_ago
-    ).values('category__name').annotate(
-        total=Sum('amount')
-    ).order_by('-total')[:5]
-    
-    # Monthly Spending Trend (Last 6 months)
-    six_months_ago = today - timedelta(days=180)
-    monthly_trend = Transaction.objects.filter(
-        user=request.user,
-        date__gte=six_months_ago
-    ).annotate(
-        month=TruncMonth('date')
-    ).values('month', 'transaction_type').annotate(
-        total=Sum('amount')
-    ).order_by('month')
-    
-    # Upcoming Recurring Transactions
-    upcoming_recurring = Transaction.objects.filter(
-        user=request.user,
-        is_recurring=True,
-        date__gt=today
-    ).order_by('date')[:3]
+    # Filters carried over to the pager links
+    filter_query = request.GET.copy()
+    for key in ('after', 'before'):
+        filter_query.pop(key, None)
     
     context = {
-        'total_balance': total_balance,
-        'accounts': accounts,
-        'monthly_income': monthly_income,
-        'monthly_expenses': monthly_expenses,
-        'recent_transactions': recent_transactions,
-        'budget_progress': budget_progress,
-        'active_goals': active_goals,
-        'category_spending': category_spending,
-        'monthly_trend': monthly_trend,
-        'upcoming_recurring': upcoming_recurring,
-        'current_month': today.strftime('%B %Y'),
+        'form': form,
+        'filter_query': filter_query.urlencode(),
+        'transactions': page,
+        'next_cursor': next_cursor,
+        'previous_cursor': previous_cursor,
+        'categories': Category.objects.filter(user=request.user),
+        'accounts': Account.objects.filter(user=request.user),
     }
+    return render(request, 'core/transaction_list.html', context)
+
+@login_required
+def transaction_list_data(request):
+    """API endpoint for keyset-paginated transactions"""
+    transactions = Transaction.objects.filter(user=request.user).values(
+        'id', 'date', 'created_at', 'description', 'amount', 'transaction_type',
+        'status', 'category_id', 'category__name', 'account_id', 'account__name'
+    )
     
-    return render(request, 'core/dashboard.html', context)
+    form = TransactionFilterForm(request.GET or None, user=request.user)
+    if form.is_bound and not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    try:
+        page, next_cursor, previous_cursor = _transaction_page(request, transactions, form)
+    except InvalidCursor as exc:
+        return JsonResponse({'errors': {'cursor': [str(exc)]}}, status=400)
+    
+    return JsonResponse({
+        'results': page,
+        'next': next_cursor,
+        'previous': previous_cursor,
+    })
+
+@login_required
+def search_transactions(request):
+    """API endpoint for ranked full-text search over descriptions and tags"""
+    query = request.GET.get('q', '')
+    tags = request.GET.getlist('tag')
+    if not query.strip() and not tags:
+        return JsonResponse({'errors': {'q': ['Enter something to search for']}}, status=400)
+    
+    results = search.search(
+        request.user,
+        query,
+        tags=tags,
+        limit=page_size(request.GET.get('limit'), default=search.DEFAULT_LIMIT)
+    )
+    return JsonResponse({
+        'results': [
+            {
+                'id': transaction.id,
+                'date': transaction.date,
+                'description': transaction.description,
+                'amount': transaction.amount,
+                'transaction_type': transaction.transaction_type,
+                'tags': transaction.tags or [],
+                'category__name': transaction.category.name if transaction.category else None,
+                'account__name': transaction.account.name,
+                'rank': transaction.search_rank,
+            }
+            for transaction in results
+        ]
+    })
 
 @login_required
 def account_list(request):
     """View for listing all accounts"""
     accounts = Account.objects.filter(user=request.user)
-    total_balance = accounts.aggregate(total=Sum('balance'))['total'] or 0
+    currency = user_currency(request.user)
+    total_balance = sum(
+        convert(account.balance, account.currency, currency) for account in accounts
+    )
     
     context = {
         'accounts': accounts,
+        'currency': currency,
         'total_balance': total_balance,
     }
     return render(request, 'core/account_list.html', context)
 
+@login_required
+@replica_reads
+def account_summary(request, account_id):
+    """View for an account's monthly flows, balances and unusual expenses"""
+    account = get_object_or_404(Account, pk=account_id, user=request.user)
+    start_date, end_date = analytics.period(timezone.now().date(), analytics.analysis_months(request.GET.get('months')))
+    
+    context = {
+        'account': account,
+        'start_date': start_date,
+        'end_date': end_date,
+        'summary': analytics.account_statistics(account, start_date, end_date) if analytics.available() else None,
+        'recent_transactions': Transaction.objects.filter(
+            user=request.user,
+            account=account
+        ).select_related('category')[:10],
+    }
+    return render(request, 'core/account_summary.html', context)
+
+@login_required
+@replica_reads
+def account_summary_data(request, account_id):
+    """API endpoint for an account's monthly flows, balances, expense percentiles and anomalies"""
+    if not analytics.available():
+        return JsonResponse({'error': 'Analytics are not available on this server'}, status=503)
+    account = get_object_or_404(Account, pk=account_id, user=request.user)
+    start_date, end_date = analytics.period(timezone.now().date(), analytics.analysis_months(request.GET.get('months')))
+    return JsonResponse(analytics.account_statistics(account, start_date, end_date))
+
 @login_required
 def add_account(request):
     """View for adding a new account"""
@@ -182,6 +252,68 @@ def category_list(request):
     context = {'categories': categories}
     return render(request, 'core/category_list.html', context)
 
+@login_required
+def category_analysis(request, category_id):
+    """View for drilling down into a category and its subcategories"""
+    category = get_object_or_404(Category, pk=category_id, user=request.user)
+    today = timezone.now().date()
+    start_date = (today.replace(day=1) - timedelta(days=335)).replace(day=1)
+    transaction_type = 'INCOME' if request.GET.get('type', '').upper() == 'INCOME' else 'EXPENSE'
+    
+    summaries = DailySummary.objects.filter(
+        user=request.user,
+        transaction_type=transaction_type,
+        date__gte=start_date
+    )
+    currency = user_currency(request.user)
+    children = subtree_totals(summaries, parent=category, currency=currency)
+    monthly = fold(summaries.filter(subtree(category)).annotate(
+        month=TruncMonth('date')
+    ).values('month', 'account__currency').annotate(
+        total=Sum('amount'),
+        transactions=Sum('count')
+    ).order_by('month'), ('month',), ('total',), currency, date_key='month', counts=('transactions',))
+    
+    context = {
+        'category': category,
+        'currency': currency,
+        'ancestors': Category.objects.filter(
+            pk__in=[int(pk) for pk in category.path.split('/')[:-2]]
+        ).order_by('depth'),
+        'transaction_type': transaction_type,
+        'children': children,
+        'total': sum(row['total'] for row in children),
+        'monthly': monthly,
+        'recent_transactions': Transaction.objects.filter(
+            subtree(category),
+            user=request.user,
+            transaction_type=transaction_type
+        ).select_related('account', 'category')[:10],
+        'start_date': start_date,
+        'end_date': today,
+    }
+    if analytics.available():
+        context['analytics'] = analytics.category_statistics(
+            request.user, transaction_type, start_date, today, parent=category
+        )
+    return render(request, 'core/category_analysis.html', context)
+
+@login_required
+@replica_reads
+def category_analysis_data(request):
+    """API endpoint for per-category trends, percentiles and anomalies, under an optional parent category"""
+    if not analytics.available():
+        return JsonResponse({'error': 'Analytics are not available on this server'}, status=503)
+    parent = None
+    if request.GET.get('category'):
+        try:
+            parent = Category.objects.get(pk=int(request.GET['category']), user=request.user)
+        except (ValueError, Category.DoesNotExist):
+            return JsonResponse({'errors': {'category': ['Select a valid category.']}}, status=400)
+    transaction_type = 'INCOME' if request.GET.get('type', '').upper() == 'INCOME' else 'EXPENSE'
+    start_date, end_date = analytics.period(timezone.now().date(), analytics.analysis_months(request.GET.get('months')))
+    return JsonResponse(analytics.category_statistics(request.user, transaction_type, start_date, end_date, parent=parent))
+
 @login_required
 def add_category(request):
     """View for adding a new category"""
@@ -274,7 +406,7 @@ def delete_budget(request, pk):
 def add_goal(request):
     """View for adding a new financial goal"""
     if request.method == 'POST':
-        form = GoalForm(request.POST)
+        form = GoalForm(request.POST, user=request.user)
         if form.is_valid():
             goal = form.save(commit=False)
             goal.user = request.user
@@ -282,7 +414,7 @@ def add_goal(request):
             messages.success(request, 'Goal created successfully!')
             return redirect('core:goal_list')
     else:
-        form = GoalForm()
+        form = GoalForm(user=request.user)
     
     return render(request, 'core/goal_form.html', {'form': form})
 
@@ -292,13 +424,13 @@ def edit_goal(request, pk):
     goal = get_object_or_404(Goal, pk=pk, user=request.user)
     
     if request.method == 'POST':
-        form = GoalForm(request.POST, instance=goal)
+        form = GoalForm(request.POST, instance=goal, user=request.user)
         if form.is_valid():
             form.save()
             messages.success(request, 'Goal updated successfully!')
             return redirect('core:goal_list')
     else:
-        form = GoalForm(instance=goal)
+        form = GoalForm(instance=goal, user=request.user)
     
     return render(request, 'core/goal_form.html', {'form': form, 'goal': goal})
 
@@ -319,130 +451,250 @@ def report_list(request):
     """View for listing available reports"""
     return render(request, 'core/report_list.html')
 
+def _report_range(request, granularity='day'):
+    """Range and granularity of a report page; invalid parameters fall back to the last 30 days"""
+    form = ReportRangeForm(request.GET, granularity=granularity)
+    if not form.is_valid():
+        for errors in form.errors.values():
+            for error in errors:
+                messages.error(request, error)
+        form = ReportRangeForm({}, granularity=granularity)
+        form.is_valid()
+    return form
+
 @login_required
+@replica_reads
 def expense_summary(request):
     """View for expense summary report"""
-    today = timezone.now().date()
-    start_date = today - timedelta(days=30)
+    form = _report_range(request)
+    date_from, date_to, granularity = (form.cleaned_data[key] for key in ('date_from', 'date_to', 'granularity'))
+    currency = user_currency(request.user)
+    expenses_rows = DailySummary.objects.filter(user=request.user, transaction_type='EXPENSE')
     
-    expenses = Transaction.objects.filter(
-        user=request.user,
-        transaction_type='EXPENSE',
-        date__gte=start_date
-    ).values('category__name').annotate(
-        total=Sum('amount')
-    ).order_by('-total')
+    # Subcategories are rolled up into their top-level category
+    expenses = subtree_totals(expenses_rows.filter(
+        date__gte=date_from,
+        date__lte=date_to
+    ), currency=currency)
     
     context = {
+        'form': form,
         'expenses': expenses,
-        'start_date': start_date,
-        'end_date': today,
+        'trend': series(expenses_rows, date_from, date_to, granularity, {'total': Sum('amount')}, currency),
+        'start_date': date_from,
+        'end_date': date_to,
+        'granularity': granularity,
     }
     return render(request, 'core/expense_summary.html', context)
 
 @login_required
+@replica_reads
 def income_summary(request):
     """View for income summary report"""
-    today = timezone.now().date()
-    start_date = today - timedelta(days=30)
-    
-    income = Transaction.objects.filter(
-        user=request.user,
-        transaction_type='INCOME',
-        date__gte=start_date
-    ).values('category__name').annotate(
+    form = _report_range(request)
+    date_from, date_to, granularity = (form.cleaned_data[key] for key in ('date_from', 'date_to', 'granularity'))
+    currency = user_currency(request.user)
+    income_rows = DailySummary.objects.filter(user=request.user, transaction_type='INCOME')
+    
+    income = fold(income_rows.filter(
+        date__gte=date_from,
+        date__lte=date_to
+    ).values('category__name', 'account__currency').annotate(
         total=Sum('amount')
-    ).order_by('-total')
+    ).order_by(), ('category__name',), ('total',), currency, date_to)
+    income.sort(key=lambda row: row['total'], reverse=True)
     
     context = {
+        'form': form,
         'income': income,
-        'start_date': start_date,
-        'end_date': today,
+        'trend': series(income_rows, date_from, date_to, granularity, {'total': Sum('amount')}, currency),
+        'start_date': date_from,
+        'end_date': date_to,
+        'granularity': granularity,
     }
     return render(request, 'core/income_summary.html', context)
 
 @login_required
+@replica_reads
 def cash_flow(request):
     """View for cash flow report"""
-    today = timezone.now().date()
-    start_date = today - timedelta(days=30)
-    
-    transactions = Transaction.objects.filter(
-        user=request.user,
-        date__gte=start_date
-    ).values('date').annotate(
-        income=Sum('amount', filter=Q(transaction_type='INCOME')),
-        expenses=Sum('amount', filter=Q(transaction_type='EXPENSE'))
-    ).order_by('date')
+    form = _report_range(request)
+    date_from, date_to, granularity = (form.cleaned_data[key] for key in ('date_from', 'date_to', 'granularity'))
     
     context = {
-        'transactions': transactions,
-        'start_date': start_date,
-        'end_date': today,
+        'form': form,
+        'transactions': charts.transaction_chart(request.user, date_from, date_to, granularity),
+        'start_date': date_from,
+        'end_date': date_to,
+        'granularity': granularity,
     }
     return render(request, 'core/cash_flow.html', context)
 
 @login_required
-def transaction_chart_data(request):
+@replica_reads
+async def transaction_chart_data(request):
     """API endpoint for transaction chart data"""
-    today = timezone.now().date()
-    start_date = today - timedelta(days=30)
+    user = await request.auser()
+    form = ReportRangeForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
     
-    data = Transaction.objects.filter(
-        user=request.user,
-        date__gte=start_date
-    ).values('date').annotate(
-        income=Sum('amount', filter=Q(transaction_type='INCOME')),
-        expenses=Sum('amount', filter=Q(transaction_type='EXPENSE'))
-    ).order_by('date')
-    
-    return JsonResponse(list(data), safe=False)
+    data = await charts.in_thread(charts.transaction_chart)(
+        user, form.cleaned_data['date_from'], form.cleaned_data['date_to'], form.cleaned_data['granularity']
+    )
+    return JsonResponse(data, safe=False)
 
 @login_required
-def category_chart_data(request):
+@replica_reads
+async def category_chart_data(request):
     """API endpoint for category chart data"""
-    today = timezone.now().date()
-    start_date = today - timedelta(days=30)
-    
-    data = Transaction.objects.filter(
-        user=request.user,
-        date__gte=start_date
-    ).values('category__name').annotate(
-        total=Sum('amount')
-    ).order_by('-total')
-    
-    return JsonResponse(list(data), safe=False)
+    user = await request.auser()
+    form = ReportRangeForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    # Top-level categories, or the children of ?parent=, with their subcategories included
+    parent = None
+    if request.GET.get('parent'):
+        if not request.GET['parent'].isdigit():
+            return JsonResponse({'errors': {'parent': ['Enter a category id']}}, status=400)
+        parent = await aget_object_or_404(Category, pk=request.GET['parent'], user=user)
+    
+    data = await charts.in_thread(charts.category_chart)(
+        user, form.cleaned_data['date_from'], form.cleaned_data['date_to'], parent
+    )
+    return JsonResponse(data, safe=False)
 
 @login_required
-def budget_progress_data(request):
+@replica_reads
+def tag_spending_data(request):
+    """API endpoint for per-tag totals and their trend"""
+    form = ReportRangeForm(request.GET, granularity='month')
+    transaction_type = request.GET.get('type', 'EXPENSE').upper()
+    if not form.is_valid() or transaction_type not in dict(Transaction.TRANSACTION_TYPES):
+        errors = dict(form.errors)
+        if transaction_type not in dict(Transaction.TRANSACTION_TYPES):
+            errors['type'] = [f'Unknown transaction type: {transaction_type}']
+        return JsonResponse({'errors': errors}, status=400)
+    
+    filters = {
+        'transaction_type': transaction_type,
+        'date_from': form.cleaned_data['date_from'],
+        'date_to': form.cleaned_data['date_to'],
+        'tags': [tag for tag in request.GET.getlist('tag') if tag.isdigit()],
+    }
+    return JsonResponse({
+        'date_from': filters['date_from'],
+        'date_to': filters['date_to'],
+        'granularity': form.cleaned_data['granularity'],
+        'totals': list(tags.tag_totals(request.user, **filters)),
+        'trend': list(tags.tag_trend(request.user, granularity=form.cleaned_data['granularity'], **filters)),
+    })
+
+@login_required
+@replica_reads
+async def budget_progress_data(request):
     """API endpoint for budget progress data"""
-    today = timezone.now().date()
-    start_of_month = today.replace(day=1)
-    
-    budgets = Budget.objects.filter(
-        user=request.user,
-        start_date__lte=today,
-        end_date__gte=today
-    ).select_related('category')
-    
-    data = []
-    for budget in budgets:
-        spending = Transaction.objects.filter(
-            user=request.user,
-            category=budget.category,
-            transaction_type='EXPENSE',
-            date__gte=start_of_month
-        ).aggregate(total=Sum('amount'))['total'] or 0
-        
-        data.append({
-            'category': budget.category.name,
-            'budget': float(budget.amount),
-            'spent': float(spending),
-            'remaining': float(budget.amount - spending)
-        })
-    
+    user = await request.auser()
+    data = await charts.in_thread(charts.budget_progress)(user, timezone.now().date())
     return JsonResponse(data, safe=False)
 
+@login_required
+@replica_reads
+def forecast_data(request):
+    """API endpoint for projected account balances, month by month"""
+    if not forecast.available():
+        return JsonResponse({'error': 'Forecasting is not available on this server'}, status=503)
+    months = forecast.forecast_months(request.GET.get('months'))
+    return JsonResponse(forecast.forecast(request.user, timezone.now().date(), months))
+
+@login_required
+@replica_reads
+async def dashboard_data(request):
+    """API endpoint for every dashboard chart in one response, built concurrently"""
+    user = await request.auser()
+    form = ReportRangeForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    date_from, date_to, granularity = (form.cleaned_data[key] for key in ('date_from', 'date_to', 'granularity'))
+    
+    data = await charts.fan_out({
+        'transactions': partial(charts.transaction_chart, user, date_from, date_to, granularity),
+        'categories': partial(charts.category_chart, user, date_from, date_to),
+        'budgets': partial(charts.budget_progress, user, timezone.now().date()),
+    })
+    return JsonResponse(data)
+
+@login_required
+@require_POST
+def bulk_transactions(request):
+    """API endpoint for recategorizing, retagging, changing the status of or deleting many transactions"""
+    try:
+        data = json.loads(request.body or '{}')
+    except ValueError:
+        return JsonResponse({'errors': {'__all__': ['Send a JSON object']}}, status=400)
+    if not isinstance(data, dict):
+        return JsonResponse({'errors': {'__all__': ['Send a JSON object']}}, status=400)
+    
+    form = BulkOperationForm(data, user=request.user)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    selection = Transaction.objects.filter(user=request.user)
+    ids = form.cleaned_data['ids']
+    if ids is not None:
+        selection = selection.filter(pk__in=ids)
+    else:
+        filter_form = TransactionFilterForm(data.get('filter') or {}, user=request.user)
+        if not filter_form.is_valid():
+            return JsonResponse({'errors': {'filter': filter_form.errors}}, status=400)
+        filters = {key: value for key, value in filter_form.cleaned_data.items() if value}
+        if not filters:
+            return JsonResponse({'errors': {'__all__': ['Select transactions by ids or a filter']}}, status=400)
+        selection = filter_transactions(request.user, selection, filters)
+    
+    return JsonResponse(bulk.run(
+        selection,
+        form.cleaned_data['operation'],
+        category=form.cleaned_data['category'],
+        tags=form.cleaned_data['tags'],
+        status=form.cleaned_data['status']
+    ))
+
+@login_required
+@require_POST
+def import_transactions(request):
+    """API endpoint for bulk importing a CSV, OFX or JSON statement"""
+    form = TransactionImportForm(request.POST, request.FILES, user=request.user)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    
+    upload = form.cleaned_data['file']
+    try:
+        file_format = form.cleaned_data['file_format'] or detect_format(upload.name)
+        upload.seek(0)
+        result = import_file(
+            request.user,
+            io.TextIOWrapper(upload.file, encoding='utf-8', newline=''),
+            file_format,
+            account=form.cleaned_data['account'],
+            create_categories=not form.cleaned_data['reject_unknown_categories']
+        )
+    except (StatementError, UnicodeDecodeError) as exc:
+        return JsonResponse({'errors': {'file': [str(exc)]}}, status=400)
+    
+    return JsonResponse(result)
+
+@staff_member_required
+def cache_stats_data(request):
+    """API endpoint exposing this process' cache hit/miss counters"""
+    return JsonResponse(cache_stats())
+
+@staff_member_required
+def instrumentation_data(request):
+    """API endpoint exposing this process' per-view query and latency histograms"""
+    return JsonResponse(instrumentation_stats())
+
 @login_required
 def user_profile(request):
     """View for user profile"""
@@ -478,62 +730,91 @@ def user_settings(request):
 
 @login_required
 def export_transactions(request):
-    """View for exporting transactions to CSV"""
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = 'attachment; filename="transactions.csv"'
-    
-    writer = csv.writer(response)
-    writer.writerow(['Date', 'Category', 'Account', 'Type', 'Amount', 'Description'])
-    
-    transactions = Transaction.objects.filter(user=request.user).select_related(
-        'category', 'account'
-    ).order_by('-date')
-    
-    for transaction in transactions:
-        writer.writerow([
-            transaction.date,
-            transaction.category.name,
-            transaction.account.name,
-            transaction.transaction_type,
-            transaction.amount,
-            transaction.description
-        ])
-    
-    return response
+    """View for exporting transactions to CSV, Parquet or Arrow, streamed batch by batch"""
+    form = TransactionFilterForm(request.GET, user=request.user)
+    if not form.is_valid():
+        return JsonResponse({'errors': form.errors}, status=400)
+    file_format = request.GET.get('format', 'csv')
+    if file_format != 'csv':
+        if file_format not in columnar.FORMATS:
+            return JsonResponse({'errors': {'format': [f'Unknown format: {file_format}']}}, status=400)
+        if not columnar.available():
+            return JsonResponse({'error': 'Columnar exports are not available on this server'}, status=503)
+    
+    if request.GET.get('background') == '1':
+        return _queue_export(request, 'TRANSACTIONS')
+    
+    if file_format != 'csv':
+        return columnar.columnar_response(
+            'transactions',
+            columnar.record_batches(request.user, form.cleaned_data),
+            file_format
+        )
+    
+    rows = transaction_rows(request.user, form.cleaned_data)
+    return csv_response(
+        'transactions.csv',
+        TRANSACTION_HEADER,
+        rows,
+        compress=request.GET.get('gzip') == '1'
+    )
 
 @login_required
 def export_report(request, report_type):
     """View for exporting various reports"""
-    today = timezone.now().date()
-    start_date = today - timedelta(days=30)
-    
-    response = HttpResponse(content_type='text/csv')
-    response['Content-Disposition'] = f'attachment; filename="{report_type}_report.csv"'
-    
-    writer = csv.writer(response)
-    
-    if report_type == 'expense':
-        writer.writerow(['Category', 'Total Expenses'])
-        data = Transaction.objects.filter(
-            user=request.user,
-            transaction_type='EXPENSE',
-            date__gte=start_date
-        ).values('category__name').annotate(
-            total=Sum('amount')
-        ).order_by('-total')
-        
-        for item in data:
-            writer.writerow([item['category__name'], item['total']])
-            
-    elif report_type == 'income':
-        writer.writerow(['Category', 'Total Income'])
-        data = Transaction.objects.filter(
-            user=request.user,
-            transaction_type='INCOME',
-            date__gte=start_date
-        ).values('category__name').annotate(
-            total=Sum('amount')
-        ).order_by('-total')
-        
-        for item in data:
-            writer.writerow([item['category__name'], item['total']])
\ No newline at end of file
+    if report_type not in REPORT_TYPES:
+        raise Http404(f'Unknown report type: {report_type}')
+    
+    form = TransactionFilterForm(request.GET, user=request.user)
+    range_form = ReportRangeForm(request.GET)
+    if not (form.is_valid() and range_form.is_valid()):
+        return JsonResponse({'errors': {**form.errors, **range_form.errors}}, status=400)
+    
+    if request.GET.get('background') == '1':
+        return _queue_export(request, 'REPORT', report_type=report_type)
+    
+    header, rows = report_rows(request.user, report_type, {**form.cleaned_data, **range_form.cleaned_data})
+    return csv_response(
+        f'{report_type}_report.csv',
+        header,
+        iter(rows),
+        compress=request.GET.get('gzip') == '1'
+    )
+
+def _job_data(job):
+    data = {
+        'id': job.pk,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress,
+        'rows': job.rows,
+        'error': job.error,
+        'created_at': job.created_at,
+        'finished_at': job.finished_at,
+        'url': reverse('core:job_status', args=[job.pk]),
+        'download_url': None,
+    }
+    if job.status == 'COMPLETED':
+        data['download_url'] = reverse('core:download_job', args=[job.pk])
+    return data
+
+def _queue_export(request, kind, **params):
+    """Queue an export for the run_jobs worker; the client polls the returned job"""
+    params = {**request.GET.dict(), **params}
+    params.pop('background')
+    job = jobs.enqueue(request.user, kind, params)
+    response = JsonResponse(_job_data(job), status=202)
+    response['Location'] = reverse('core:job_status', args=[job.pk])
+    return response
+
+@login_required
+def job_status(request, pk):
+    """API endpoint for polling a background export"""
+    job = get_object_or_404(Job, pk=pk, user=request.user)
+    return JsonResponse(_job_data(job))
+
+@login_required
+def download_job(request, pk):
+    """View for downloading the file of a completed background export"""
+    job = get_object_or_404(Job, pk=pk, user=request.user, status='COMPLETED')
+    return FileResponse(job.file.open('rb'), as_attachment=True, filename=jobs.filename(job))
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -55,7 +57,7 @@ ROOT_URLCONF = 'expense_tracker.urls'
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
-        'DIRS': [],
+        'DIRS': [BASE_DIR / 'templates'],
         'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
@@ -74,12 +76,148 @@ WSGI_APPLICATION = 'expense_tracker.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+#
+# SQLite by default. EXPENSE_TRACKER_DB_ENGINE=postgresql (or mysql) and the
+# other EXPENSE_TRACKER_DB_* variables select a database server instead.
+# EXPENSE_TRACKER_DB_REPLICA adds a read-only 'replica' alias that the
+# reporting views and chart APIs read from: the host of a replica server,
+# or for SQLite a second database file kept up to date with sync_replica.
+
+DB_ENGINE = os.environ.get('EXPENSE_TRACKER_DB_ENGINE', 'sqlite')
+DB_REPLICA = os.environ.get('EXPENSE_TRACKER_DB_REPLICA', '')
+
+# Seconds a connection is kept open between requests
+DB_CONN_MAX_AGE = int(os.environ.get('EXPENSE_TRACKER_DB_CONN_MAX_AGE', '60'))
+
+# PostgreSQL only: a psycopg connection pool instead of persistent connections
+DB_POOL = os.environ.get('EXPENSE_TRACKER_DB_POOL', '0') == '1'
+
+# Seconds a SQLite writer waits for the lock before failing with "database is locked"
+SQLITE_BUSY_TIMEOUT = int(os.environ.get('EXPENSE_TRACKER_SQLITE_BUSY_TIMEOUT', '20'))
+
+# Run on every new SQLite connection. WAL lets readers proceed while one
+# writer commits; NORMAL sync is durable across application crashes in WAL
+# mode; the rest keep temporary b-trees and hot pages in memory.
+SQLITE_PRAGMAS = [
+    'PRAGMA journal_mode=WAL',
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-20000',
+    'PRAGMA mmap_size=268435456',
+]
+
+
+def database(name, host=''):
+    if DB_ENGINE == 'sqlite':
+        return {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': name,
+            'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+            'OPTIONS': {
+                'timeout': SQLITE_BUSY_TIMEOUT,
+                # Take the write lock up front, so concurrent writers wait for
+                # the busy timeout instead of failing when they upgrade
+                'transaction_mode': 'IMMEDIATE',
+                'init_command': '; '.join(SQLITE_PRAGMAS),
+            },
+        }
+    config = {
+        'ENGINE': f'django.db.backends.{DB_ENGINE}',
+        'NAME': name,
+        'HOST': host,
+        'PORT': os.environ.get('EXPENSE_TRACKER_DB_PORT', ''),
+        'USER': os.environ.get('EXPENSE_TRACKER_DB_USER', ''),
+        'PASSWORD': os.environ.get('EXPENSE_TRACKER_DB_PASSWORD', ''),
+        'CONN_MAX_AGE': DB_CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+    }
+    if DB_ENGINE == 'postgresql' and DB_POOL:
+        config.update(CONN_MAX_AGE=0, OPTIONS={'pool': True})
+    return config
+
+
+if DB_ENGINE == 'sqlite':
+    DATABASES = {
+        'default': database(os.environ.get('EXPENSE_TRACKER_DB_NAME', BASE_DIR / 'db.sqlite3')),
+    }
+    if DB_REPLICA:
+        DATABASES['replica'] = database(DB_REPLICA)
+else:
+    DATABASES = {
+        'default': database(
+            os.environ.get('EXPENSE_TRACKER_DB_NAME', 'expense_tracker'),
+            os.environ.get('EXPENSE_TRACKER_DB_HOST', 'localhost'),
+        ),
+    }
+    if DB_REPLICA:
+        DATABASES['replica'] = database(DATABASES['default']['NAME'], DB_REPLICA)
+
+if DB_REPLICA:
+    # Tests read the replica through the default test database
+    DATABASES['replica']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['core.routers.ReplicaRouter']
+
+# Alias the routed read-only views read from (None: everything uses 'default')
+CORE_READ_REPLICA = 'replica' if DB_REPLICA else None
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+#
+# Local memory by default; point EXPENSE_TRACKER_CACHE at 'file' or 'redis'
+# to share cached dashboards between worker processes.
+
+CACHE_BACKEND = os.environ.get('EXPENSE_TRACKER_CACHE', 'locmem')
+
+if CACHE_BACKEND == 'redis':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('EXPENSE_TRACKER_CACHE_LOCATION', 'redis://127.0.0.1:6379'),
+        }
     }
-}
+elif CACHE_BACKEND == 'file':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('EXPENSE_TRACKER_CACHE_LOCATION', BASE_DIR / 'cache'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'expense-tracker',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
+    }
+
+# Cache alias and lifetime used for per-user dashboard fragments
+CORE_CACHE_ALIAS = 'default'
+CORE_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Currency the exchange rate table is quoted against, and the currency
+# reports use for users without one of their own
+CORE_FX_BASE = 'USD'
+CORE_DEFAULT_CURRENCY = 'USD'
+
+# Let async APIs run independent queries concurrently, on separate connections
+CORE_CONCURRENT_QUERIES = True
+
+# Per-view query count and latency instrumentation, and how many runs of
+# the same SQL shape in one request are logged as a likely N+1 loop
+CORE_INSTRUMENTATION = os.environ.get('EXPENSE_TRACKER_INSTRUMENTATION', '1') == '1'
+CORE_N_PLUS_ONE_THRESHOLD = 10
+
+# Transaction search index: 'fts5' (SQLite), 'tokens' (any database), or
+# 'auto' to use FTS5 whenever the migration could create it
+CORE_SEARCH_BACKEND = os.environ.get('EXPENSE_TRACKER_SEARCH', 'auto')
+
+# Worker processes run_jobs uses for background exports (0: run in the worker itself)
+CORE_JOB_WORKERS = int(os.environ.get('EXPENSE_TRACKER_JOB_WORKERS', '2'))
+# Seconds after which a job still running is taken for abandoned by a dead worker
+CORE_JOB_TIMEOUT = int(os.environ.get('EXPENSE_TRACKER_JOB_TIMEOUT', '3600'))
 
 
 # Password validation
@@ -118,6 +256,10 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# Files written by background jobs; downloads go through the job views
+MEDIA_ROOT = os.environ.get('EXPENSE_TRACKER_MEDIA_ROOT', BASE_DIR / 'media')
+MEDIA_URL = 'media/'
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 